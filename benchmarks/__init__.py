@@ -0,0 +1,14 @@
+import os
+
+# placeholder settings, so that benchmarks can run without a .env file
+for name, value in {
+    "DBS_USER_ID": "benchmark",
+    "DBS_PIN": "benchmark",
+    "PROJECT_ID": "benchmark",
+    "SECRET_ID": "benchmark",
+    "OTP_EMAIL_SUBJECT": "DBS OTP",
+    "BUCKET_NAME": "benchmark",
+    "FROM_EMAIL": "from@example.com",
+    "TO_EMAIL": "to@example.com",
+}.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,128 @@
+"""
+Local stand-in for the DBS estatements API, which serves a configurable
+number of statements with artificial latency and errors
+"""
+
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+LIST_PATH = "/api/v3/channels/estatements"
+DOWNLOAD_PATH = "/api/v3/channels/estatements/inquiry"
+
+
+@dataclass
+class FakeDbsConfig:
+    statements: int = 100
+    pdf_size: int = 200 * 1024
+    latency: float = 0.05
+    error_rate: float = 0.0
+    seed: int = 0
+
+
+def make_statement(index: int) -> dict:
+    statement_date = date(2023, 12, 31) - timedelta(days=index)
+    return {
+        "statementDate": statement_date.isoformat(),
+        "statementType": "DBSSPA",
+        "statementHashKey": f"hash-{index}",
+        "description": "DBS Savings Plus Account",
+        "entityName": [],
+        "address": [],
+        "productCode": "1234",
+        "productReferenceNo": "1234567890",
+        "currency": None,
+        "formattedAccountNumber": "123-4-567890",
+    }
+
+
+class FakeDbsHandler(BaseHTTPRequestHandler):
+    server: "FakeDbsServer"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *_) -> None:
+        pass
+
+    def delay_or_fail(self) -> bool:
+        """Sleeps for the configured latency, and returns True for a 503"""
+        config = self.server.config
+        time.sleep(config.latency)
+        with self.server.lock:
+            failed = self.server.random.random() < config.error_rate
+        if failed:
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        return failed
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        url = urlparse(self.path)
+        if url.path != LIST_PATH:
+            self.send_error(404)
+            return
+        if self.delay_or_fail():
+            return
+
+        query = parse_qs(url.query)
+        page_size = int(query["pageSize"][0])
+        page_number = int(query["pageNumber"][0])
+        start = (page_number - 1) * page_size
+        end = min(start + page_size, self.server.config.statements)
+        body = json.dumps(
+            {
+                "totalRecords": self.server.config.statements,
+                "estatementTypes": [],
+                "estatements": [make_statement(i) for i in range(start, end)],
+            }
+        ).encode()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self) -> None:  # pylint: disable=invalid-name
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        if self.path != DOWNLOAD_PATH:
+            self.send_error(404)
+            return
+        if self.delay_or_fail():
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/pdf")
+        self.send_header("Content-Length", str(len(self.server.pdf)))
+        self.end_headers()
+        self.wfile.write(self.server.pdf)
+
+
+class FakeDbsServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, config: FakeDbsConfig):
+        super().__init__(("127.0.0.1", 0), FakeDbsHandler)
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.lock = threading.Lock()
+        self.pdf = b"%PDF-1.4\n" + bytes(config.pdf_size)
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host!s}:{port}"
+
+    def __enter__(self) -> "FakeDbsServer":
+        self.thread.start()
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.shutdown()
+        self.server_close()
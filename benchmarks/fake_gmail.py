@@ -0,0 +1,41 @@
+"""
+Stand-in for the Gmail API service, which accepts sent messages
+after an artificial delay
+"""
+
+import threading
+import time
+from typing import Any
+
+
+# pylint: disable=too-few-public-methods
+class FakeRequest:
+    def __init__(self, result: Any, latency: float):
+        self.result = result
+        self.latency = latency
+
+    def execute(self) -> Any:
+        time.sleep(self.latency)
+        return self.result
+
+
+class FakeGmailService:
+    """Implements the users().messages().send() chain used to send emails"""
+
+    def __init__(self, latency: float = 0.1):
+        self.latency = latency
+        self.sent_sizes: list[int] = []
+        self.lock = threading.Lock()
+
+    def users(self) -> "FakeGmailService":
+        return self
+
+    def messages(self) -> "FakeGmailService":
+        return self
+
+    def send(self, userId: str, body: dict, media_body=None) -> FakeRequest:
+        # pylint: disable=invalid-name,unused-argument
+        size = media_body.size() if media_body else len(str(body))
+        with self.lock:
+            self.sent_sizes.append(size)
+        return FakeRequest({"id": str(len(self.sent_sizes))}, self.latency)
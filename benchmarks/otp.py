@@ -0,0 +1,156 @@
+"""
+Compares the time per email and accuracy of finding the OTP in forwarded
+DBS SMS emails with extract_otp, and with the previous extraction, which
+searched the first part recursively for data, and the decoded text for
+any 6 digits.
+
+The corpus is hand-written to mirror the common ways SMS messages get
+forwarded: iOS Shortcuts automations, Android SMS forwarding apps (plain
+text and HTML) and SMS-to-email gateways. Each is paired with SMS texts
+that also contain phone numbers, dates and amounts.
+
+Usage: python -m benchmarks.otp --repeat 2000
+"""
+
+import argparse
+import re
+import time
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from typing import Callable, Optional
+
+from dbs.gmail import Message
+from dbs.gmail.otp import extract_otp, find_snippet_otp
+from dbs.settings import settings
+
+SMS_TEXTS = [
+    "Your DBS OTP is {otp}. Do not share it with anyone.",
+    "DBS: OTP for digibank login: {otp} (valid for 5 mins). Call 1800 111 1111",
+    "<#> {otp} is your DBS digibank OTP. Never share it. Ref 20231118",
+    "On 18/11/2023 10:30 you requested an OTP. Your OTP is {otp}",
+    "Call +6563272265 if you did not request this. Use one-time password {otp}",
+    "S$100,000.00 transfer limit change on 18/11/2023. Code {otp}",
+]
+
+
+def encode(text: str) -> str:
+    return urlsafe_b64encode(text.encode()).decode()
+
+
+def make_part(mime_type: str, text: str) -> dict:
+    return {"mimeType": mime_type, "body": {"size": len(text), "data": encode(text)}}
+
+
+def ios_shortcut(sms: str) -> tuple[dict, str]:
+    """A plain text email, with the SMS after a sender and timestamp"""
+    text = f"From: DBS\nReceived: 18 Nov 2023 at 10:30\n\n{sms}"
+    return {"mimeType": "text/plain", "body": {"data": encode(text)}}, text
+
+
+def android_forwarder(sms: str) -> tuple[dict, str]:
+    """A multipart email, with plain text and HTML alternatives"""
+    text = f"Sender: 77777 (+6591234567)\nTime: 2023-11-18 10:30:00\nMessage: {sms}"
+    html = f"<html><body><p>Sender: 77777</p><p>{sms}</p></body></html>"
+    payload = {
+        "mimeType": "multipart/alternative",
+        "body": {"size": 0},
+        "parts": [make_part("text/plain", text), make_part("text/html", html)],
+    }
+    return payload, text
+
+
+def gateway(sms: str) -> tuple[dict, str]:
+    """A mixed email, whose text part is nested after an empty signature part"""
+    payload = {
+        "mimeType": "multipart/mixed",
+        "body": {"size": 0},
+        "parts": [
+            {"mimeType": "multipart/related", "body": {"size": 0}, "parts": []},
+            {
+                "mimeType": "multipart/alternative",
+                "body": {"size": 0},
+                "parts": [make_part("text/plain", f"SMS from 6591234567: {sms}")],
+            },
+        ],
+    }
+    return payload, ""
+
+
+def make_corpus() -> list[tuple[Message, str]]:
+    corpus = []
+    for i, text in enumerate(SMS_TEXTS):
+        otp = f"{(i + 1) * 135791 % 1_000_000:06}"
+        sms = text.format(otp=otp)
+        for forward in (ios_shortcut, android_forwarder, gateway):
+            payload, snippet = forward(sms)
+            payload["headers"] = [
+                {"name": "Subject", "value": "Fwd: SMS"},
+                {"name": "From", "value": "Forwarder <user@gmail.com>"},
+            ]
+            data = {"id": str(len(corpus)), "snippet": snippet[:200]}
+            corpus.append((Message({**data, "payload": payload}), otp))
+    return corpus
+
+
+def search_data_key(part: dict):
+    for key, value in part.items():
+        if key == "data":
+            return value
+        if isinstance(value, dict):
+            result = search_data_key(value)
+            if result is not None:
+                return result
+        if isinstance(value, list):
+            for item in value:
+                if isinstance(item, dict):
+                    result = search_data_key(item)
+                    if result is not None:
+                        return result
+    return None
+
+
+def previous(message: Message) -> Optional[str]:
+    if message.body and "data" in message.body:
+        byte_data = message.body["data"]
+    else:
+        byte_data = next(search_data_key(part.data) for part in message.parts)
+    data = urlsafe_b64decode(byte_data).decode("utf-8")
+    if match := re.search(r"\d{6}", data):
+        return match.group(0)
+    return None
+
+
+def measure(extract: Callable[[Message], Optional[str]], repeat: int) -> tuple:
+    """Returns the microseconds per email, and the number of correct OTPs"""
+    corpus = make_corpus()
+    correct = 0
+    for message, otp in corpus:
+        try:
+            correct += extract(message) == otp
+        except Exception:  # pylint: disable=broad-exception-caught
+            pass
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for message, _ in corpus:
+            try:
+                extract(message)
+            except Exception:  # pylint: disable=broad-exception-caught
+                pass
+    duration = time.perf_counter() - start
+
+    return duration / (repeat * len(corpus)) * 1e6, correct, len(corpus)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark OTP extraction.")
+    parser.add_argument("--repeat", type=int, default=2000)
+    arguments = parser.parse_args()
+    settings.trusted_user_emails = ["user@gmail.com"]
+
+    for name, function in (("previous", previous), ("current", extract_otp)):
+        micros, correct, total = measure(function, arguments.repeat)
+        print(f"{name:<9}{micros:>6.2f} us/email  {correct}/{total} correct")
+
+    # the OTP watch only fetches the full email if its snippet has no OTP
+    in_snippet = sum(find_snippet_otp(message) == otp for message, otp in make_corpus())
+    print(f"{in_snippet}/{total} OTPs found in the snippet, without a full fetch")
@@ -0,0 +1,51 @@
+"""
+Compares the time and peak memory of building StatementRecords from a
+listing and serializing their download payloads, by unpacking each listed
+dict into the model and dumping it back, and with StatementRecord.from_api.
+
+Usage: python -m benchmarks.records --statements 100000
+"""
+
+import argparse
+import time
+import tracemalloc
+from typing import Callable
+
+from benchmarks.fake_dbs import make_statement
+from dbs.browser.download import StatementRecord
+
+
+def round_trip(listing: list[dict]) -> list[dict]:
+    records = [StatementRecord(**estatement) for estatement in listing]
+    return [record.model_dump(by_alias=True) for record in records]
+
+
+def from_api(listing: list[dict]) -> list[dict]:
+    records = [StatementRecord.from_api(estatement) for estatement in listing]
+    return [record.payload for record in records]
+
+
+def measure(run: Callable[[list[dict]], list[dict]], statements: int) -> tuple:
+    """Returns the microseconds and bytes of peak memory per statement"""
+    listing = [make_statement(i) for i in range(statements)]
+    start = time.perf_counter()
+    run(listing)
+    duration = time.perf_counter() - start
+
+    # the listing is traced too, as from_api keeps its dicts alive
+    tracemalloc.start()
+    run([make_statement(i) for i in range(statements)])
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return duration / statements * 1e6, peak / statements
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark StatementRecords.")
+    parser.add_argument("--statements", type=int, default=100_000)
+    arguments = parser.parse_args()
+
+    for name, function in (("round_trip", round_trip), ("from_api", from_api)):
+        micros, memory = measure(function, arguments.statements)
+        print(f"{name:<11}{micros:>6.2f} us/statement  {memory:>6.0f} B/statement")
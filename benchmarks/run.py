@@ -0,0 +1,238 @@
+"""
+Measures statement throughput, latency and peak memory against local
+stand-ins for the DBS and Gmail APIs, and appends the results to a
+JSON lines file so that they can be compared across versions.
+
+Usage: python -m benchmarks.run --concurrency 1 4 8 --statements 200
+"""
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import asdict
+from datetime import datetime, timezone
+from importlib.metadata import version
+from typing import Callable, Optional
+from unittest.mock import patch
+
+from benchmarks.fake_dbs import FakeDbsConfig, FakeDbsServer
+from benchmarks.fake_gmail import FakeGmailService
+from dbs import main as dbs_main
+from dbs.browser.download import StatementDownloader, StatementRecord
+from dbs.gmail import Gmail
+from dbs.pipeline import StatementPipeline, StatementResult
+from dbs.settings import settings
+
+RESULTS_PATH = os.path.join(os.path.dirname(__file__), "results.jsonl")
+COOKIES = [
+    {"name": "X-dbs-cust-sysgen-id", "value": "benchmark"},
+    {"name": "X-dbs-session-token", "value": "benchmark"},
+]
+USER_AGENT = "benchmark"
+# the listing pages fetched ahead, each of which holds a connection
+LISTING_WORKERS = 4
+
+
+class TimedStatementPipeline(StatementPipeline):
+    """Records how long each statement takes to go through the pipeline"""
+
+    latencies: list[float] = []
+
+    def process(self, record: StatementRecord) -> StatementResult:
+        start = time.perf_counter()
+        result = super().process(record)
+        self.latencies.append(time.perf_counter() - start)
+        return result
+
+
+def run_downloader(concurrency: int, page_size: int) -> list[StatementResult]:
+    downloader = StatementDownloader(
+        COOKIES,
+        USER_AGENT,
+        pool_size=concurrency + LISTING_WORKERS,
+        backoff_factor=0.01,
+    )
+    pipeline = TimedStatementPipeline(downloader, concurrency=concurrency)
+    records = downloader.iter_statements(
+        from_date="2023-01",
+        to_date="2023-12",
+        statement_type="ALL",
+        sort_order="DESC",
+        page_size=page_size,
+        workers=LISTING_WORKERS,
+    )
+    results = pipeline.run(records)
+    downloader.close()
+    return results
+
+
+def run_main(concurrency: int, page_size: int, gmail_latency: float) -> None:
+    argv = [
+        "dbs",
+        "--concurrency",
+        str(concurrency),
+        "--page-size",
+        str(page_size),
+        "--email",
+    ]
+    gmail_service = FakeGmailService(gmail_latency)
+
+    with patch.object(sys, "argv", argv), patch.multiple(
+        dbs_main,
+        Gmail=lambda: Gmail(gmail_service),  # type: ignore
+        get_session_cookies=lambda *_, **__: COOKIES,
+        StatementPipeline=TimedStatementPipeline,
+    ):
+        try:
+            dbs_main.main()
+        except RuntimeError as err:
+            # statements that failed after all retries are still counted
+            print(err, file=sys.stderr)
+
+
+def measure(run: Callable[[], object], memory: bool) -> tuple[float, Optional[float]]:
+    """Returns the duration of a run, and its peak traced memory in MB"""
+    TimedStatementPipeline.latencies = []
+
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        run()
+    finally:
+        duration = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] / 1024 / 1024 if memory else None
+        tracemalloc.stop()
+
+    return duration, peak
+
+
+def get_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark(scenario: str, concurrency: int, args: argparse.Namespace) -> dict:
+    config = FakeDbsConfig(
+        statements=args.statements,
+        pdf_size=args.pdf_size,
+        latency=args.latency,
+        error_rate=args.error_rate,
+    )
+
+    def run() -> None:
+        with FakeDbsServer(config) as server, tempfile.TemporaryDirectory() as tmp:
+            settings.dbs_base_url = server.url
+            cwd = os.getcwd()
+            os.chdir(tmp)
+            try:
+                if scenario == "downloader":
+                    run_downloader(concurrency, args.page_size)
+                else:
+                    run_main(concurrency, args.page_size, args.gmail_latency)
+            finally:
+                os.chdir(cwd)
+
+    # memory is traced in a separate run, as tracing slows down every allocation
+    duration, _ = measure(run, memory=False)
+    latencies = sorted(TimedStatementPipeline.latencies)
+    _, peak_memory = measure(run, memory=True)
+    percentiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else []
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "version": version("dbs-statement-downloader"),
+        "commit": get_commit(),
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "page_size": args.page_size,
+        "config": asdict(config),
+        "statements": len(latencies),
+        "statements_per_second": round(len(latencies) / duration, 2),
+        "p50_ms": round(percentiles[49] * 1000, 1) if percentiles else None,
+        "p95_ms": round(percentiles[94] * 1000, 1) if percentiles else None,
+        "peak_memory_mb": round(peak_memory or 0, 2),
+    }
+
+
+def find_previous(result: dict, path: str) -> Optional[dict]:
+    """Returns the last recorded result with the same settings"""
+    if not os.path.exists(path):
+        return None
+
+    keys = ("scenario", "concurrency", "page_size", "config")
+    previous = None
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            entry = json.loads(line)
+            if all(entry.get(key) == result[key] for key in keys):
+                previous = entry
+    return previous
+
+
+def report(result: dict, previous: Optional[dict]) -> None:
+    line = (
+        f"{result['scenario']:<10} concurrency={result['concurrency']:<3} "
+        f"{result['statements_per_second']:>8.2f} statements/s  "
+        f"p50={result['p50_ms']}ms  p95={result['p95_ms']}ms  "
+        f"peak={result['peak_memory_mb']}MB"
+    )
+    if previous:
+        change = result["statements_per_second"] / previous["statements_per_second"] - 1
+        line += f"  ({change:+.0%} vs {previous['commit'] or previous['version']})"
+    print(line)
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark statement downloads.")
+    parser.add_argument(
+        "--scenario",
+        nargs="+",
+        choices=["downloader", "main"],
+        default=["downloader", "main"],
+        help="Run StatementDownloader on its own, or main() with emails",
+    )
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4, 8])
+    parser.add_argument("--statements", type=int, default=100)
+    parser.add_argument("--page-size", type=int, default=10)
+    parser.add_argument("--pdf-size", type=int, default=200 * 1024)
+    parser.add_argument(
+        "--latency", type=float, default=0.05, help="Seconds per DBS API request"
+    )
+    parser.add_argument(
+        "--gmail-latency", type=float, default=0.1, help="Seconds per email sent"
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0.0,
+        help="Fraction of DBS API requests that fail with a 503",
+    )
+    parser.add_argument("--output", type=str, default=RESULTS_PATH)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    logging.disable(logging.INFO)
+    arguments = parse_arguments()
+
+    for name in arguments.scenario:
+        for workers in arguments.concurrency:
+            benchmark_result = benchmark(name, workers, arguments)
+            report(benchmark_result, find_previous(benchmark_result, arguments.output))
+            with open(arguments.output, "a", encoding="utf-8") as output:
+                output.write(json.dumps(benchmark_result) + "\n")
@@ -0,0 +1,84 @@
+import json
+import logging
+import os
+from typing import Iterator, Optional
+
+from pydantic import BaseModel
+
+from dbs.browser.download import StatementDownloader, StatementRecord
+from dbs.files import CHUNK_SIZE, DownloadedFile
+
+logger = logging.getLogger(__name__)
+
+
+class AccountProfile(BaseModel):
+    """
+    Credentials of a DBS account, loaded from a JSON file such as
+    [
+        {
+            "name": "alice",
+            "dbs_user_id": "...",
+            "dbs_pin": "...",
+            "otp_email_subject": "OTP for Alice"
+        }
+    ]
+    where `otp_email_subject` is text that only appears in the subject
+    or body of the OTP emails of that account
+    """
+
+    name: str
+    dbs_user_id: str
+    dbs_pin: str
+    otp_email_subject: Optional[str] = None
+
+
+def load_accounts(path: str) -> list[AccountProfile]:
+    with open(path, encoding="utf-8") as file:
+        accounts = [AccountProfile(**account) for account in json.load(file)]
+
+    names = [account.name for account in accounts]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Account names in {path} must be unique")
+
+    subjects = [account.otp_email_subject for account in accounts]
+    if len(accounts) > 1 and (None in subjects or len(set(subjects)) != len(subjects)):
+        raise ValueError(
+            f"Each account in {path} needs its own otp_email_subject, "
+            "so that OTP emails can be matched to their login"
+        )
+
+    return accounts
+
+
+class MultiAccountDownloader:
+    """
+    Lists the statements of several accounts, and downloads each one
+    with the session of the account it belongs to, so that a single
+    pipeline can process the statements of every account
+    """
+
+    def __init__(self, downloaders: dict[str, StatementDownloader]):
+        self.downloaders = downloaders
+
+    def iter_statements(self, **kwargs) -> Iterator[StatementRecord]:
+        for name, downloader in self.downloaders.items():
+            logger.info("Listing statements of account '%s'", name)
+            for record in downloader.iter_statements(**kwargs):
+                record.account = name
+                yield record
+
+    def download_statement_to_file(
+        self, record: StatementRecord, path: str, chunk_size: int = CHUNK_SIZE
+    ) -> DownloadedFile:
+        if record.account not in self.downloaders:
+            raise ValueError(f"Unknown account for statement: {record.account}")
+
+        if directory := os.path.dirname(path):
+            os.makedirs(directory, exist_ok=True)
+
+        downloader = self.downloaders[record.account]
+        return downloader.download_statement_to_file(record, path, chunk_size)
+
+    def close(self) -> None:
+        for downloader in self.downloaders.values():
+            downloader.close()
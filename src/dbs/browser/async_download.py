@@ -0,0 +1,259 @@
+import asyncio
+import logging
+import random
+from functools import cached_property
+from typing import Any, AsyncIterator, Optional
+
+from dbs.browser.download import (
+    RETRY_STATUSES,
+    BaseStatementDownloader,
+    StatementRecord,
+)
+from dbs.files import CHUNK_SIZE, AtomicFileWriter, DownloadedFile
+from dbs.metrics import metrics
+
+try:
+    import httpx
+except ImportError as err:  # pragma: no cover
+    raise ImportError(
+        "httpx is required for the asyncio downloader, "
+        "install it with `poetry install --extras async`"
+    ) from err
+
+logger = logging.getLogger(__name__)
+
+RETRY_ERRORS = (httpx.ConnectError, httpx.ReadError, httpx.RemoteProtocolError)
+
+
+class AsyncStatementDownloader(BaseStatementDownloader):
+    """
+    Coroutine equivalent of StatementDownloader, backed by a pooled
+    httpx.AsyncClient so that many statements can be fetched from a
+    single thread
+    """
+
+    async def __aenter__(self) -> "AsyncStatementDownloader":
+        return self
+
+    async def __aexit__(self, *_) -> None:
+        await self.close()
+
+    @cached_property
+    def client(self) -> httpx.AsyncClient:
+        connect_timeout, read_timeout = self.timeout
+        return httpx.AsyncClient(
+            headers=self.session_headers,
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(
+                max_connections=self.pool_size,
+                max_keepalive_connections=self.pool_size,
+            ),
+        )
+
+    async def close(self) -> None:
+        if "client" in self.__dict__:
+            await self.client.aclose()
+
+    def get_backoff(self, attempt: int) -> float:
+        return self.backoff_factor * 2**attempt + random.uniform(0, self.backoff_factor)
+
+    async def request(
+        self, method: str, url: str, stream: bool = False, **kwargs
+    ) -> httpx.Response:
+        """
+        Sends a request, retrying 5xx responses and dropped connections
+        with jittered exponential backoff.
+
+        Streamed responses must be closed by the caller.
+        """
+        endpoint = "list" if url == self.list_endpoint else "download"
+        metrics.increment("api_calls", service="dbs", endpoint=endpoint)
+
+        with metrics.timer("api_request", service="dbs", endpoint=endpoint):
+            return await self.send_with_retries(method, url, endpoint, stream, **kwargs)
+
+    async def send_with_retries(
+        self, method: str, url: str, endpoint: str, stream: bool, **kwargs
+    ) -> httpx.Response:
+        for attempt in range(self.max_retries + 1):
+            await self.rate_limiter.wait_async()
+            if attempt:
+                metrics.increment("api_retries", service="dbs", endpoint=endpoint)
+            try:
+                request = self.client.build_request(method, url, **kwargs)
+                response = await self.client.send(request, stream=stream)
+                if response.status_code not in RETRY_STATUSES:
+                    return response
+                if attempt == self.max_retries:
+                    return response
+                await response.aclose()
+                logger.warning("Retrying %s %s: %s", method, url, response.status_code)
+            except RETRY_ERRORS as err:
+                if attempt == self.max_retries:
+                    raise
+                logger.warning("Retrying %s %s: %s", method, url, err)
+
+            await asyncio.sleep(self.get_backoff(attempt))
+
+        raise RuntimeError("Unreachable")  # pragma: no cover
+
+    # pylint: disable=too-many-arguments
+    async def fetch_statement_page(
+        self,
+        from_date: str,
+        to_date: str,
+        statement_type: str,
+        sort_order: str,
+        page_size: int,
+        page_number: int,
+        **_,
+    ) -> dict:
+        params = self.list_params(
+            from_date, to_date, statement_type, sort_order, page_size, page_number
+        )
+        response = await self.request(
+            "GET", self.list_endpoint, params=params, headers=self.list_headers
+        )
+        return self.parse_page(response.text, page_number)
+
+    # pylint: disable=too-many-arguments
+    async def list_statements(
+        self,
+        from_date: str,
+        to_date: str,
+        statement_type: str,
+        sort_order: str,
+        page_size: int,
+        page_number: int,
+        **_,
+    ) -> list[dict]:
+        records = await self.fetch_statement_page(
+            from_date=from_date,
+            to_date=to_date,
+            statement_type=statement_type,
+            sort_order=sort_order,
+            page_size=page_size,
+            page_number=page_number,
+        )
+        return records["estatements"]
+
+    # pylint: disable=too-many-arguments,too-many-locals
+    async def iter_statements(
+        self,
+        from_date: str,
+        to_date: str,
+        statement_type: str,
+        sort_order: str,
+        page_size: int,
+        page_number: int = 1,
+        max_pages: Optional[int] = None,
+        workers: int = 4,
+        **_,
+    ) -> AsyncIterator[StatementRecord]:
+        """
+        Asynchronous version of StatementDownloader.iter_statements
+        """
+        query: dict[str, Any] = {
+            "from_date": from_date,
+            "to_date": to_date,
+            "statement_type": statement_type,
+            "sort_order": sort_order,
+            "page_size": page_size,
+        }
+
+        first_page = await self.fetch_statement_page(page_number=page_number, **query)
+        last_page = self.get_last_page(first_page, page_size, page_number, max_pages)
+        window = workers if last_page else 1
+        total_records = first_page.get("totalRecords")
+        if total_records is not None:
+            total_records = int(total_records)
+        next_page_number = page_number + 1
+        exhausted = False
+        pending: list[asyncio.Task] = []
+
+        def prefetch():
+            nonlocal next_page_number
+            while (
+                not exhausted
+                and len(pending) < window
+                and (last_page is None or next_page_number <= last_page)
+            ):
+                pending.append(
+                    asyncio.create_task(
+                        self.fetch_statement_page(page_number=next_page_number, **query)
+                    )
+                )
+                next_page_number += 1
+
+        try:
+            page, number = first_page, page_number
+            while True:
+                estatements = self.get_page_statements(
+                    page, number, page_size, total_records
+                )
+                if len(estatements) < page_size:
+                    # a short page is always the last one
+                    exhausted = True
+                    for task in pending:
+                        task.cancel()
+                    pending.clear()
+
+                prefetch()
+                for estatement in estatements:
+                    yield StatementRecord.from_api(estatement)
+
+                if not pending:
+                    return
+                page, number = await pending.pop(0), number + 1
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def download_statement(self, record: StatementRecord) -> bytes:
+        logger.info(
+            "Downloading estatement: %s %s",
+            record.statement_date,
+            record.statement_type,
+        )
+        response = await self.request(
+            "POST",
+            self.download_endpoint,
+            headers=self.download_headers,
+            json=record.payload,
+        )
+        response.raise_for_status()
+        metrics.increment("downloaded_bytes", len(response.content))
+
+        return response.content
+
+    async def download_statement_to_file(
+        self, record: StatementRecord, path: str
+    ) -> DownloadedFile:
+        """
+        Asynchronous version of StatementDownloader.download_statement_to_file
+        """
+        logger.info(
+            "Downloading estatement: %s %s",
+            record.statement_date,
+            record.statement_type,
+        )
+        response = await self.request(
+            "POST",
+            self.download_endpoint,
+            stream=True,
+            headers=self.download_headers,
+            json=record.payload,
+        )
+        try:
+            response.raise_for_status()
+
+            # chunks are small enough that writing them from the
+            # event loop is cheaper than handing each one to a thread
+            with AtomicFileWriter(path) as writer:
+                async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                    writer.write(chunk)
+        finally:
+            await response.aclose()
+
+        metrics.increment("downloaded_bytes", writer.size)
+        return writer.result
@@ -1,14 +1,25 @@
+import itertools
 import json
 import logging
+import math
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
 from functools import cached_property
-from typing import Optional
+from typing import Any, Iterator, Optional
 from uuid import uuid4
 
 import requests
 from dateutil.parser import parse
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field
 from pydantic.alias_generators import to_camel
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from dbs.files import CHUNK_SIZE, AtomicFileWriter, DownloadedFile
+from dbs.metrics import metrics
+from dbs.ratelimit import RateLimiter
+from dbs.settings import settings
 
 logger = logging.getLogger(__name__)
 
@@ -43,13 +54,70 @@ class StatementRecord(BaseModel):
     product_reference_no: str
     currency: Optional[str]
     formatted_account_number: str
+    # name of the account profile that listed the statement, which is
+    # never sent back to the DBS API
+    account: Optional[str] = Field(default=None, exclude=True)
+    # the estatement object as listed by the API, which is posted back as is
+    # to download the statement, rather than being rebuilt from the fields
+    estatement: Any = Field(default=None, exclude=True, repr=False)
+
+    @classmethod
+    def from_api(cls, estatement: dict) -> "StatementRecord":
+        """
+        Validates a listed estatement straight from its dict, which is kept
+        as the payload of its download request
+        """
+        record = cls.model_validate(estatement)
+        record.estatement = estatement
+        return record
+
+    @property
+    def payload(self) -> dict:
+        """Body of the request to download this statement"""
+        if self.estatement is not None:
+            return self.estatement
+        return self.model_dump(by_alias=True)
+
+
+RETRY_STATUSES = [500, 502, 503, 504]
+# user agent of the browser that logs in, which the session cookies belong to
+USER_AGENT = " ".join(
+    [
+        "Mozilla/5.0 (X11; Linux x86_64)",
+        "AppleWebKit/537.36 (KHTML, like Gecko)",
+        "Chrome/120.0.0.0 Safari/537.36",
+    ]
+)
+SESSION_COOKIE_NAMES = ["X-dbs-cust-sysgen-id", "X-dbs-session-token"]
+
 
+class BaseStatementDownloader:
+    """
+    Request building shared by the blocking and asyncio downloaders
+    """
 
-class StatementDownloader:
-    def __init__(self, cookies: dict, user_agent: str):
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        cookies: list[dict],
+        user_agent: str,
+        rate_limit: Optional[float] = None,
+        pool_size: int = 10,
+        max_retries: int = 3,
+        backoff_factor: float = 0.5,
+        connect_timeout: float = 5,
+        read_timeout: float = 30,
+        rate_limiter: Optional[RateLimiter] = None,
+    ):
         self.user_agent = user_agent
         self.cookies = cookies
-        self.ibanking_home_url: str = "https://internet-banking.dbs.com.sg"
+        # downloaders of several accounts share one limiter for the DBS host
+        self.rate_limiter = rate_limiter or RateLimiter(rate_limit)
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.timeout = (connect_timeout, read_timeout)
+        self.ibanking_home_url: str = settings.dbs_base_url
         self.download_endpoint: str = (
             self.ibanking_home_url + "/api/v3/channels/estatements/inquiry"
         )
@@ -66,7 +134,7 @@ class StatementDownloader:
 
     @cached_property
     def extracted_cookies(self) -> dict:
-        desired_cookie_names = ["X-dbs-cust-sysgen-id", "X-dbs-session-token"]
+        desired_cookie_names = SESSION_COOKIE_NAMES
         extracted_cookies = {}
 
         for cookie in self.cookies:
@@ -90,15 +158,15 @@ class StatementDownloader:
     def dbs_cust_sysgen_id(self) -> str:
         return self.extracted_cookies["X-dbs-cust-sysgen-id"]
 
-    @property
-    def common_headers(self) -> dict:
-        headers = {
+    @cached_property
+    def session_headers(self) -> dict:
+        """Headers that stay the same for every request in a session"""
+        return {
             "authorization": "auth",
             "authtype": "2FA",
             "channelid": "DIB",
             "clientid": "DIB",
             "user-agent": self.user_agent,
-            "x-correlationid": str(uuid4()),
             "x-dbs-session-token": self.dbs_session_token,
             "x-dbs-app-code": "IWSB",
             "x-dbs-authtype": "2FA",
@@ -107,13 +175,22 @@ class StatementDownloader:
             "x-dbs-cust-sysgen-id": self.dbs_cust_sysgen_id,
             "x-dbs-locale": "en",
             "x-dbs-rqclientctry": "SG",
+        }
+
+    @property
+    def request_headers(self) -> dict:
+        """Headers that need to be unique for every request"""
+        return {
+            "x-correlationid": str(uuid4()),
             "x-dbs-timestamp": self.create_utc_timestamp(),
             "x-dbs-uuid": str(uuid4()),
         }
-        return headers
 
-    # pylint: disable=too-many-arguments
-    def list_statements(
+    @property
+    def common_headers(self) -> dict:
+        return {**self.session_headers, **self.request_headers}
+
+    def list_params(
         self,
         from_date: str,
         to_date: str,
@@ -121,14 +198,8 @@ class StatementDownloader:
         sort_order: str,
         page_size: int,
         page_number: int,
-        **_,
-    ) -> list[dict]:
-        """
-        Returns a list of all estatement records within a given time period.
-        Defaults to the last 6 months, with statements sorted in
-        descending order, with 10 records per page.
-        """
-        params: dict[str, str | int] = {
+    ) -> dict[str, str | int]:
+        return {
             "statementType": statement_type,
             "from": parse(from_date).strftime("%m%Y"),
             "to": parse(to_date).strftime("%m%Y"),
@@ -137,41 +208,323 @@ class StatementDownloader:
             "pageNumber": page_number,
         }
 
-        headers = {"actionid": "LIST", "x-version": "2.0.0", **self.common_headers}
+    @property
+    def list_headers(self) -> dict:
+        return {"actionid": "LIST", "x-version": "2.0.0", **self.request_headers}
 
-        response = requests.get(
-            self.list_endpoint, params=params, headers=headers, timeout=10
-        )
+    @property
+    def download_headers(self) -> dict:
+        return {
+            "actionid": "ViewEstatement",
+            "x-version": "1.0.0",
+            **self.request_headers,
+        }
 
-        records = json.loads(response.text)
+    @staticmethod
+    def parse_page(response_text: str, page_number: int) -> dict:
+        records = json.loads(response_text)
 
         try:
             logger.info(
-                "total records: %s, types: %s",
+                "page: %s, total records: %s, types: %s",
+                page_number,
                 records["totalRecords"],
                 records["estatementTypes"],
             )
         except KeyError as err:
-            logger.error("Error: %s Response: %s", err, response.text)
+            logger.error("Error: %s Response: %s", err, response_text)
+
+        return records
+
+    @staticmethod
+    def get_last_page(
+        first_page: dict, page_size: int, page_number: int, max_pages: Optional[int]
+    ) -> Optional[int]:
+        """
+        Works out the last page to fetch from `totalRecords` and `max_pages`,
+        or returns None if neither is known
+        """
+        last_page: Optional[int] = None
+        if (total_records := first_page.get("totalRecords")) is not None:
+            last_page = max(math.ceil(int(total_records) / page_size), page_number)
+        if max_pages:
+            stop = page_number + max_pages - 1
+            last_page = min(last_page, stop) if last_page else stop
+        return last_page
+
+    @staticmethod
+    def get_page_statements(
+        page: dict, page_number: int, page_size: int, total_records: Optional[int]
+    ) -> list[dict]:
+        """
+        Returns the statements in a page of the listing, raising an error if
+        the page isn't a listing (e.g. an error or expired session response),
+        or doesn't hold as many statements as `total_records` implies, rather
+        than taking it for a short last page
+        """
+        estatements = page.get("estatements")
+        if not isinstance(estatements, list):
+            raise RuntimeError(
+                f"Page {page_number} of the statement list has no statements: "
+                f"{str(page)[:200]}"
+            )
+
+        if total_records is not None:
+            remaining = total_records - (page_number - 1) * page_size
+            expected = min(max(remaining, 0), page_size)
+            if len(estatements) != expected:
+                raise RuntimeError(
+                    f"Page {page_number} of the statement list has "
+                    f"{len(estatements)} statement(s), expected {expected} "
+                    f"of {total_records}"
+                )
+
+        return estatements
 
+
+class StatementDownloader(BaseStatementDownloader):
+    @cached_property
+    def session(self) -> requests.Session:
+        """
+        Keep-alive session with a connection pool sized for concurrent
+        downloads, which retries 5xx responses and dropped connections
+        with jittered exponential backoff
+        """
+        retry = Retry(
+            total=self.max_retries,
+            backoff_factor=self.backoff_factor,
+            backoff_jitter=self.backoff_factor,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=["GET", "POST"],
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=self.pool_size, max_retries=retry
+        )
+
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers.update(self.session_headers)
+        return session
+
+    def close(self) -> None:
+        if "session" in self.__dict__:
+            self.session.close()
+
+    def is_session_valid(self) -> bool:
+        """
+        Checks whether the session cookies are still accepted by making
+        the smallest possible listing request
+        """
+        this_month = datetime.now().strftime("%Y-%m")
+        params = self.list_params(this_month, this_month, "ALL", "DESC", 1, 1)
+
+        try:
+            response = self.session.get(
+                self.list_endpoint,
+                params=params,
+                headers=self.list_headers,
+                timeout=self.timeout,
+            )
+            return response.ok and "estatements" in response.json()
+        except (requests.RequestException, ValueError) as err:
+            logger.info("Session check failed: %s", err)
+            return False
+
+    # pylint: disable=too-many-arguments
+    def fetch_statement_page(
+        self,
+        from_date: str,
+        to_date: str,
+        statement_type: str,
+        sort_order: str,
+        page_size: int,
+        page_number: int,
+        **_,
+    ) -> dict:
+        """
+        Returns the raw API response for a single page of estatement records,
+        which includes the `totalRecords` count across all pages.
+        """
+        params = self.list_params(
+            from_date, to_date, statement_type, sort_order, page_size, page_number
+        )
+
+        self.rate_limiter.wait()
+        with metrics.timer("api_request", service="dbs", endpoint="list"):
+            response = self.session.get(
+                self.list_endpoint,
+                params=params,
+                headers=self.list_headers,
+                timeout=self.timeout,
+            )
+        self.record_request("list", response)
+
+        return self.parse_page(response.text, page_number)
+
+    @staticmethod
+    def record_request(endpoint: str, response: requests.Response) -> None:
+        metrics.increment("api_calls", service="dbs", endpoint=endpoint)
+        # urllib3 keeps the history of the retries made for a response
+        if metrics.enabled and (retries := getattr(response.raw, "retries", None)):
+            metrics.increment(
+                "api_retries", len(retries.history), service="dbs", endpoint=endpoint
+            )
+
+    # pylint: disable=too-many-arguments
+    def list_statements(
+        self,
+        from_date: str,
+        to_date: str,
+        statement_type: str,
+        sort_order: str,
+        page_size: int,
+        page_number: int,
+        **_,
+    ) -> list[dict]:
+        """
+        Returns a list of all estatement records within a given time period.
+        Defaults to the last 6 months, with statements sorted in
+        descending order, with 10 records per page.
+        """
+        records = self.fetch_statement_page(
+            from_date=from_date,
+            to_date=to_date,
+            statement_type=statement_type,
+            sort_order=sort_order,
+            page_size=page_size,
+            page_number=page_number,
+        )
         return records["estatements"]
 
-    def download_statement(self, record: StatementRecord):
-        headers = {
-            "actionid": "ViewEstatement",
-            "x-version": "1.0.0",
-            **self.common_headers,
+    # pylint: disable=too-many-arguments
+    def iter_statements(
+        self,
+        from_date: str,
+        to_date: str,
+        statement_type: str,
+        sort_order: str,
+        page_size: int,
+        page_number: int = 1,
+        max_pages: Optional[int] = None,
+        workers: int = 4,
+        **_,
+    ) -> Iterator[StatementRecord]:
+        """
+        Lazily yields estatement records across all pages, starting from
+        `page_number`.
+
+        The first page is used to work out the number of pages from
+        `totalRecords`, after which up to `workers` of the remaining pages
+        are fetched in parallel while earlier pages are being consumed.
+        If the total is unknown, only the next page is prefetched, and
+        iteration stops at the first short page.
+        """
+        query: dict[str, Any] = {
+            "from_date": from_date,
+            "to_date": to_date,
+            "statement_type": statement_type,
+            "sort_order": sort_order,
+            "page_size": page_size,
         }
 
-        data = {**record.model_dump(by_alias=True)}
+        first_page = self.fetch_statement_page(page_number=page_number, **query)
+
+        last_page = self.get_last_page(first_page, page_size, page_number, max_pages)
+
+        page_numbers: Iterator[int] = (
+            iter(range(page_number + 1, last_page + 1))
+            if last_page
+            else itertools.count(page_number + 1)
+        )
+        window = workers if last_page else 1
+        total_records = first_page.get("totalRecords")
+        if total_records is not None:
+            total_records = int(total_records)
+
+        executor = ThreadPoolExecutor(max_workers=window, thread_name_prefix="list")
+        pending: deque[Future] = deque()
+
+        def prefetch():
+            while len(pending) < window and (number := next(page_numbers, None)):
+                pending.append(
+                    executor.submit(
+                        self.fetch_statement_page, page_number=number, **query
+                    )
+                )
 
+        try:
+            page, number = first_page, page_number
+            while True:
+                estatements = self.get_page_statements(
+                    page, number, page_size, total_records
+                )
+                if len(estatements) < page_size:
+                    # a short page is always the last one
+                    page_numbers = iter(())
+                    for future in pending:
+                        future.cancel()
+                    pending.clear()
+
+                prefetch()
+                for estatement in estatements:
+                    yield StatementRecord.from_api(estatement)
+
+                if not pending:
+                    return
+                page, number = pending.popleft().result(), number + 1
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def download_statement(self, record: StatementRecord):
         logger.info(
             "Downloading estatement: %s %s",
             record.statement_date,
             record.statement_type,
         )
-        response = requests.post(
-            self.download_endpoint, headers=headers, json=data, timeout=10
-        )
+        self.rate_limiter.wait()
+        with metrics.timer("api_request", service="dbs", endpoint="download"):
+            response = self.session.post(
+                self.download_endpoint,
+                headers=self.download_headers,
+                json=record.payload,
+                timeout=self.timeout,
+            )
+        self.record_request("download", response)
+        response.raise_for_status()
+        metrics.increment("downloaded_bytes", len(response.content))
 
         return response.content
+
+    def download_statement_to_file(
+        self, record: StatementRecord, path: str, chunk_size: int = CHUNK_SIZE
+    ) -> DownloadedFile:
+        """
+        Streams a statement to `path` in chunks, without holding
+        the whole PDF in memory
+        """
+        logger.info(
+            "Downloading estatement: %s %s",
+            record.statement_date,
+            record.statement_type,
+        )
+        self.rate_limiter.wait()
+        with metrics.timer(
+            "api_request", service="dbs", endpoint="download"
+        ), self.session.post(
+            self.download_endpoint,
+            headers=self.download_headers,
+            json=record.payload,
+            timeout=self.timeout,
+            stream=True,
+        ) as response:
+            self.record_request("download", response)
+            response.raise_for_status()
+
+            with AtomicFileWriter(path) as writer:
+                for chunk in response.iter_content(chunk_size):
+                    writer.write(chunk)
+
+        metrics.increment("downloaded_bytes", writer.size)
+        return writer.result
@@ -1,6 +1,9 @@
 import asyncio
 import logging
 import time
+from dataclasses import dataclass
+from enum import Enum
+from typing import Awaitable, Callable, Optional
 
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
@@ -8,24 +11,81 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.ui import WebDriverWait
 
+from dbs.browser.download import USER_AGENT
 from dbs.gmail import Gmail
+from dbs.metrics import metrics
 from dbs.settings import settings
 
 logger = logging.getLogger(__name__)
 
+# assets that the login flow does not need, which are blocked in lightweight mode
+BLOCKED_URL_PATTERNS = [
+    "*.png",
+    "*.jpg",
+    "*.jpeg",
+    "*.gif",
+    "*.svg",
+    "*.ico",
+    "*.webp",
+    "*.woff",
+    "*.woff2",
+    "*.ttf",
+    "*.otf",
+    "*.mp4",
+    "*google-analytics.com*",
+    "*googletagmanager.com*",
+    "*doubleclick.net*",
+    "*adobedtm.com*",
+    "*omtrdc.net*",
+    "*demdex.net*",
+    "*facebook.net*",
+    "*hotjar.com*",
+]
+
+
+class LoginStep(Enum):
+    LOGIN_PAGE = "login page"
+    AUTHENTICATION_PAGE = "authentication page"
+    AUTHENTICATION_POPUP = "authentication pop-up"
+    REQUEST_OTP = "request OTP"
+    WAIT_FOR_OTP = "wait for OTP"
+    SUBMIT_OTP = "submit OTP"
+    DONE = "done"
+
+
+@dataclass
+class LoginState:
+    driver: webdriver.Chrome
+    dbs_user_id: str
+    dbs_pin: str
+    otp_task: Optional[asyncio.Task] = None
+    otp: Optional[str] = None
+
 
 class DbsAuthHandler:
-    user_agent = " ".join(
-        [
-            "Mozilla/5.0 (X11; Linux x86_64)",
-            "AppleWebKit/537.36 (KHTML, like Gecko)",
-            "Chrome/120.0.0.0 Safari/537.36",
-        ]
-    )
-
-    def __init__(self, gmail_client: Gmail):
+    user_agent = USER_AGENT
+
+    def __init__(self, gmail_client: Gmail, lightweight: bool = False):
+        self.login_url: str = settings.dbs_base_url + "/IB/Welcome"
+        self.lightweight = lightweight
         self.webdriver = self.create_driver()
         self.gmail_client = gmail_client
+        self.on_login_page = False
+        self.step_timings: dict[str, float] = {}
+
+    def prepare(self) -> None:
+        """Opens the login page ahead of time, so that a later login can skip it"""
+        logger.info("Opening login page")
+        self.webdriver.get(self.login_url)
+        self.on_login_page = True
+
+    def reset(self) -> None:
+        """Clears the session of a previous login and returns to the login page"""
+        self.webdriver.delete_all_cookies()
+        self.prepare()
+
+    def quit(self) -> None:
+        self.webdriver.quit()
 
     def create_driver(self) -> webdriver.Chrome:
         logger.info("Creating Chrome driver")
@@ -37,10 +97,54 @@ class DbsAuthHandler:
         options.add_argument("--disable-gpu")
         options.add_argument("--no-sandbox")
         options.add_argument("--disable-dev-shm-usage")
-        return webdriver.Chrome(options=options)
 
-    async def get_otp(self) -> str:
-        message = await self.gmail_client.wait_for_new_message()
+        if self.lightweight:
+            self.add_lightweight_options(options)
+
+        with metrics.timer("chrome_startup"):
+            driver = webdriver.Chrome(options=options)
+
+        if self.lightweight:
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd(
+                "Network.setBlockedURLs", {"urls": BLOCKED_URL_PATTERNS}
+            )
+
+        return driver
+
+    @staticmethod
+    def add_lightweight_options(options: Options) -> None:
+        """
+        Disables images and background features, and stops Chrome from
+        resolving any host that is not in `settings.browser_allowed_hosts`
+        """
+        logger.info("Using lightweight browser mode")
+        options.add_experimental_option(
+            "prefs",
+            {
+                "profile.managed_default_content_settings.images": 2,
+                "profile.default_content_setting_values.notifications": 2,
+                "profile.default_content_setting_values.geolocation": 2,
+                "profile.default_content_setting_values.media_stream": 2,
+            },
+        )
+        options.add_argument("--blink-settings=imagesEnabled=false")
+        options.add_argument("--disable-extensions")
+        options.add_argument("--disable-background-networking")
+        options.add_argument("--disable-component-update")
+        options.add_argument("--disable-default-apps")
+        options.add_argument("--disable-sync")
+        options.add_argument("--mute-audio")
+        options.add_argument("--no-first-run")
+
+        rules = ["MAP * ~NOTFOUND"]
+        rules += [f"EXCLUDE {host}" for host in settings.browser_allowed_hosts]
+        options.add_argument(f"--host-resolver-rules={', '.join(rules)}")
+
+    async def get_otp(self, start_history_id: Optional[str] = None) -> str:
+        message = await self.gmail_client.wait_for_new_message(
+            start_history_id=start_history_id
+        )
         logger.info("Attempting to retrieve OTP")
 
         otp = self.gmail_client.extract_otp_from_message(message)
@@ -51,77 +155,153 @@ class DbsAuthHandler:
         logger.info("OTP %s retrieved", "****" + otp[-2:])
         return otp
 
-    def execute_auth_flow(
-        self, driver: webdriver.Chrome, dbs_user_id: str, dbs_pin: str
-    ):
-        # login page
-        logger.info("Opening login page")
-        driver.get("https://internet-banking.dbs.com.sg/IB/Welcome")
-        driver.find_element(By.NAME, "UID").send_keys(dbs_user_id)
-        driver.find_element(By.NAME, "PIN").send_keys(dbs_pin)
+    @staticmethod
+    def wait_until(driver: webdriver.Chrome, condition, timeout: float = 10):
+        """Polls the page every 100ms until `condition` is met"""
+        return WebDriverWait(driver, timeout, poll_frequency=0.1).until(condition)
+
+    def open_login_page(self, state: LoginState) -> LoginStep:
+        driver = state.driver
+        if not self.on_login_page:
+            logger.info("Opening login page")
+            driver.get(self.login_url)
+        self.on_login_page = False
+
+        self.wait_until(driver, EC.presence_of_element_located((By.NAME, "UID")))
+        driver.find_element(By.NAME, "UID").send_keys(state.dbs_user_id)
+        driver.find_element(By.NAME, "PIN").send_keys(state.dbs_pin)
         logger.info("Clicking 'Login' button")
         driver.find_element(By.CSS_SELECTOR, "[title^='Login']").click()
+        return LoginStep.AUTHENTICATION_PAGE
 
-        # authentication page
+    def open_authentication_page(self, state: LoginState) -> LoginStep:
+        driver = state.driver
         driver.switch_to.parent_frame()
-        WebDriverWait(driver, 10).until(
-            EC.frame_to_be_available_and_switch_to_it((By.NAME, "user_area"))
+        self.wait_until(
+            driver, EC.frame_to_be_available_and_switch_to_it((By.NAME, "user_area"))
         )
-        driver.switch_to.frame("iframe1")
+        self.wait_until(driver, EC.frame_to_be_available_and_switch_to_it("iframe1"))
         logger.info("Clicking 'Authenticate now' button")
-        WebDriverWait(driver, 10).until(
-            EC.element_to_be_clickable((By.ID, "AuthenticatBtnId"))
+        self.wait_until(
+            driver, EC.element_to_be_clickable((By.ID, "AuthenticatBtnId"))
         ).click()
+        return LoginStep.AUTHENTICATION_POPUP
 
-        # authentication pop-up
+    def open_authentication_popup(self, state: LoginState) -> LoginStep:
+        driver = state.driver
         driver.switch_to.parent_frame()
-        time.sleep(1)
         logger.info("Clicking 'Enter OTP Manually' link")
-        WebDriverWait(driver, 10).until(
-            EC.element_to_be_clickable((By.LINK_TEXT, "Enter OTP Manually"))
+        self.wait_until(
+            driver, EC.element_to_be_clickable((By.LINK_TEXT, "Enter OTP Manually"))
         ).click()
+        return LoginStep.REQUEST_OTP
 
-        # Simultaneously trigger SMS and begin monitoring inbox for new messages
-        loop = asyncio.get_event_loop()
-        otp_task = loop.create_task(self.get_otp())
-        loop.run_until_complete(self.send_sms_otp(driver))
+    def send_sms_otp(self, driver: webdriver.Chrome) -> None:
+        driver.switch_to.parent_frame()
+        self.wait_until(
+            driver, EC.frame_to_be_available_and_switch_to_it((By.NAME, "user_area"))
+        )
+        self.wait_until(driver, EC.frame_to_be_available_and_switch_to_it("iframe1"))
 
-        # wait for SMS to be forwarded to email account
-        # and then retrieve OTP from email body
-        loop.run_until_complete(otp_task)
-        otp = otp_task.result()
+        logger.info("Clicking 'Get OTP via SMS' button")
+        self.wait_until(
+            driver, EC.element_to_be_clickable((By.LINK_TEXT, "Send SMS OTP"))
+        ).click()
+        self.wait_until(
+            driver,
+            EC.element_to_be_clickable((By.CSS_SELECTOR, "[title^='Get OTP via SMS']")),
+        ).click()
 
-        driver.find_element(By.NAME, "SMSLoginPin").send_keys(otp)
-        WebDriverWait(driver, 10).until(
-            EC.element_to_be_clickable((By.ID, "submitButton"))
+    async def request_otp(self, state: LoginState) -> LoginStep:
+        # the inbox is watched from before the SMS is sent, so that a quickly
+        # forwarded OTP email is not missed
+        start_history_id = await asyncio.to_thread(self.gmail_client.get_history_id)
+        state.otp_task = asyncio.create_task(self.get_otp(start_history_id))
+        await asyncio.to_thread(self.send_sms_otp, state.driver)
+        return LoginStep.WAIT_FOR_OTP
+
+    async def wait_for_otp(self, state: LoginState) -> LoginStep:
+        assert state.otp_task
+        state.otp = await state.otp_task
+        return LoginStep.SUBMIT_OTP
+
+    def submit_otp(self, state: LoginState) -> LoginStep:
+        driver = state.driver
+        assert state.otp
+        self.wait_until(
+            driver, EC.presence_of_element_located((By.NAME, "SMSLoginPin"))
+        ).send_keys(state.otp)
+        self.wait_until(
+            driver, EC.element_to_be_clickable((By.ID, "submitButton"))
         ).click()
+        return LoginStep.DONE
+
+    async def run_step(self, step: LoginStep, state: LoginState) -> LoginStep:
+        """
+        Runs the handler of a login step, with blocking Selenium calls running
+        in a thread so that the OTP watcher is not held up by them
+        """
+        handlers: dict[LoginStep, Callable[[LoginState], LoginStep]] = {
+            LoginStep.LOGIN_PAGE: self.open_login_page,
+            LoginStep.AUTHENTICATION_PAGE: self.open_authentication_page,
+            LoginStep.AUTHENTICATION_POPUP: self.open_authentication_popup,
+            LoginStep.SUBMIT_OTP: self.submit_otp,
+        }
+        async_handlers: dict[
+            LoginStep, Callable[[LoginState], Awaitable[LoginStep]]
+        ] = {
+            LoginStep.REQUEST_OTP: self.request_otp,
+            LoginStep.WAIT_FOR_OTP: self.wait_for_otp,
+        }
 
-        logger.info("Auth flow complete")
+        if step in async_handlers:
+            return await async_handlers[step](state)
+        return await asyncio.to_thread(handlers[step], state)
 
+    async def run_auth_flow(
+        self, driver: webdriver.Chrome, dbs_user_id: str, dbs_pin: str
+    ) -> webdriver.Chrome:
+        state = LoginState(driver, dbs_user_id, dbs_pin)
+        step = LoginStep.LOGIN_PAGE
+        self.step_timings = {}
+
+        try:
+            while step is not LoginStep.DONE:
+                start = time.perf_counter()
+                try:
+                    next_step = await self.run_step(step, state)
+                finally:
+                    self.step_timings[step.value] = time.perf_counter() - start
+                    metrics.observe(
+                        "login_step", self.step_timings[step.value], step=step.value
+                    )
+                logger.info(
+                    "Login step '%s' took %.2fs",
+                    step.value,
+                    self.step_timings[step.value],
+                )
+                step = next_step
+        finally:
+            if state.otp_task and not state.otp_task.done():
+                state.otp_task.cancel()
+
+        logger.info("Auth flow complete in %.2fs", sum(self.step_timings.values()))
         return driver
 
-    def login(self) -> webdriver.Chrome:
+    def execute_auth_flow(
+        self, driver: webdriver.Chrome, dbs_user_id: str, dbs_pin: str
+    ) -> webdriver.Chrome:
+        return asyncio.run(self.run_auth_flow(driver, dbs_user_id, dbs_pin))
+
+    def login(
+        self, dbs_user_id: Optional[str] = None, dbs_pin: Optional[str] = None
+    ) -> webdriver.Chrome:
         try:
             return self.execute_auth_flow(
                 driver=self.webdriver,
-                dbs_user_id=settings.dbs_user_id,
-                dbs_pin=settings.dbs_pin,
+                dbs_user_id=dbs_user_id or settings.dbs_user_id,
+                dbs_pin=dbs_pin or settings.dbs_pin,
             )
         except Exception as err:
             logger.error("Error during login: %s", err)
             raise
-
-    @staticmethod
-    async def send_sms_otp(driver: webdriver.Chrome) -> webdriver.Chrome:
-        driver.switch_to.parent_frame()
-        WebDriverWait(driver, 10).until(
-            EC.frame_to_be_available_and_switch_to_it((By.NAME, "user_area"))
-        )
-        driver.switch_to.frame("iframe1")
-
-        await asyncio.sleep(0)
-
-        logger.info("Clicking 'Get OTP via SMS' button")
-        driver.find_element(By.LINK_TEXT, "Send SMS OTP").click()
-        driver.find_element(By.CSS_SELECTOR, "[title^='Get OTP via SMS']").click()
-        return driver
@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from typing import Optional
+
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+except ImportError as err:  # pragma: no cover
+    raise ImportError(
+        "cryptography is required for the session cache, "
+        "install it with `poetry install --extras session-cache`"
+    ) from err
+
+from dbs.browser.download import SESSION_COOKIE_NAMES
+
+logger = logging.getLogger(__name__)
+
+
+class SessionCacheBackend(ABC):
+    @abstractmethod
+    def read(self) -> Optional[bytes]:
+        """Returns the stored bytes, or None if nothing has been stored"""
+
+    @abstractmethod
+    def write(self, data: bytes) -> None:
+        pass
+
+
+class FileSessionCacheBackend(SessionCacheBackend):
+    def __init__(self, path: str):
+        self.path = path
+
+    def read(self) -> Optional[bytes]:
+        try:
+            with open(self.path, "rb") as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def write(self, data: bytes) -> None:
+        # only the current user should be able to read the session
+        tmp_path = f"{self.path}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+        os.replace(tmp_path, self.path)
+
+
+class SecretManagerSessionCacheBackend(SessionCacheBackend):
+    """
+    Stores the session as a new version of an existing Secret Manager secret
+    """
+
+    def __init__(self, project_id: str, secret_id: str):
+        # pylint: disable=import-outside-toplevel
+        from google.cloud import secretmanager
+
+        self.client = secretmanager.SecretManagerServiceClient()
+        self.secret_payload = secretmanager.SecretPayload
+        self.parent = f"projects/{project_id}/secrets/{secret_id}"
+
+    def read(self) -> Optional[bytes]:
+        # pylint: disable=import-outside-toplevel
+        from google.api_core.exceptions import NotFound
+
+        try:
+            response = self.client.access_secret_version(
+                name=f"{self.parent}/versions/latest"
+            )
+        except NotFound:
+            return None
+        return response.payload.data
+
+    def write(self, data: bytes) -> None:
+        self.client.add_secret_version(
+            parent=self.parent, payload=self.secret_payload(data=data)
+        )
+
+
+class SessionCache:
+    """
+    Encrypts and stores the DBS session cookies so that a later run
+    can skip the Selenium login while the session is still valid
+    """
+
+    def __init__(self, backend: SessionCacheBackend, key: str | bytes):
+        self.backend = backend
+        self.fernet = Fernet(key)
+
+    def load(self) -> Optional[list[dict]]:
+        if not (token := self.backend.read()):
+            logger.info("No cached session found")
+            return None
+
+        try:
+            session = json.loads(self.fernet.decrypt(token))
+        except (InvalidToken, ValueError):
+            logger.warning("Could not decrypt cached session, ignoring it")
+            return None
+
+        logger.info("Loaded session cached at %s", time.ctime(session["saved_at"]))
+        return session["cookies"]
+
+    def save(self, cookies: list[dict]) -> None:
+        session = {
+            "saved_at": time.time(),
+            "cookies": [
+                {"name": cookie["name"], "value": cookie["value"]}
+                for cookie in cookies
+                if cookie["name"] in SESSION_COOKIE_NAMES
+            ],
+        }
+        self.backend.write(self.fernet.encrypt(json.dumps(session).encode()))
+        logger.info("Saved session to cache")
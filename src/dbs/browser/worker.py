@@ -0,0 +1,212 @@
+"""
+Long-lived login worker, which keeps a headless Chrome warm on the DBS
+login page and hands out fresh session cookies over a local socket.
+
+Start the worker with `python -m dbs.browser.worker`, and pass
+`--login-worker` to `dbs.main` to log in through it.
+"""
+
+import argparse
+import logging
+import os
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Optional
+
+from dbs.browser.login import DbsAuthHandler
+from dbs.gmail import Gmail
+from dbs.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+def get_process_tree_rss(pid: int) -> int:
+    """
+    Returns the resident memory in bytes of a process and all of its
+    descendants, which for chromedriver includes every Chrome process
+    """
+    children: dict[int, list[int]] = {}
+    rss_pages: dict[int, int] = {}
+
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", encoding="utf-8") as stat_file:
+                # the process name can contain spaces, so split after it
+                fields = stat_file.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        children.setdefault(int(fields[1]), []).append(int(entry))
+        rss_pages[int(entry)] = int(fields[21])
+
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        total += rss_pages.get(current, 0)
+        pending.extend(children.get(current, []))
+
+    return total * os.sysconf("SC_PAGE_SIZE")
+
+
+class LoginWorker:
+    """
+    Reuses one Chrome driver across logins, and replaces it after
+    `max_uses` logins, when it uses more than `max_memory_mb`, or
+    when it stops responding
+    """
+
+    def __init__(
+        self,
+        gmail_client: Gmail,
+        max_uses: int = 20,
+        max_memory_mb: int = 1024,
+        lightweight: bool = False,
+    ):
+        self.gmail_client = gmail_client
+        self.lightweight = lightweight
+        self.max_uses = max_uses
+        self.max_memory_mb = max_memory_mb
+        self.auth_handler: Optional[DbsAuthHandler] = None
+        self.uses = 0
+
+    def is_healthy(self, auth_handler: DbsAuthHandler) -> bool:
+        try:
+            auth_handler.webdriver.execute_script("return document.readyState")
+        except Exception as err:  # pylint: disable=broad-exception-caught
+            logger.warning("Chrome driver is not responding: %s", err)
+            return False
+
+        if self.uses >= self.max_uses:
+            logger.info("Chrome driver has been used %s times", self.uses)
+            return False
+
+        if process := auth_handler.webdriver.service.process:
+            memory_mb = get_process_tree_rss(process.pid) / 1024 / 1024
+            if memory_mb > self.max_memory_mb:
+                logger.info("Chrome driver is using %.0f MB of memory", memory_mb)
+                return False
+
+        return True
+
+    def recycle(self) -> None:
+        if self.auth_handler:
+            logger.info("Recycling Chrome driver")
+            try:
+                self.auth_handler.quit()
+            except Exception as err:  # pylint: disable=broad-exception-caught
+                logger.warning("Could not quit Chrome driver: %s", err)
+            self.auth_handler = None
+
+    def get_auth_handler(self) -> DbsAuthHandler:
+        """Returns a warm auth handler, creating a new one if needed"""
+        if self.auth_handler and not self.is_healthy(self.auth_handler):
+            self.recycle()
+
+        if not self.auth_handler:
+            self.auth_handler = DbsAuthHandler(self.gmail_client, self.lightweight)
+            self.auth_handler.prepare()
+            self.uses = 0
+
+        return self.auth_handler
+
+    def login(self) -> list[dict]:
+        auth_handler = self.get_auth_handler()
+
+        try:
+            cookies = auth_handler.login().get_cookies()
+        except Exception:
+            # the page is in an unknown state after a failed login
+            self.recycle()
+            raise
+
+        self.uses += 1
+
+        try:
+            # get ready for the next login while the caller uses these cookies
+            auth_handler.reset()
+        except Exception as err:  # pylint: disable=broad-exception-caught
+            logger.warning("Could not reset Chrome driver: %s", err)
+            self.recycle()
+
+        return cookies
+
+    def handle(self, connection: Connection) -> None:
+        if connection.recv() != "login":
+            connection.send({"error": "Unknown request"})
+            return
+
+        try:
+            connection.send({"cookies": self.login()})
+        except Exception as err:  # pylint: disable=broad-exception-caught
+            logger.error("Error during login: %s", err)
+            connection.send({"error": str(err)})
+
+    def serve(self, address: str, authkey: bytes) -> None:
+        self.get_auth_handler()
+
+        with Listener(address, authkey=authkey) as listener:
+            logger.info("Login worker listening on %s", address)
+
+            while True:
+                # a client that fails to authenticate or hangs up only
+                # drops its own connection
+                try:
+                    connection = listener.accept()
+                except (AuthenticationError, EOFError, ConnectionError) as err:
+                    logger.warning("Rejected login worker connection: %s", err)
+                    continue
+
+                with connection:
+                    try:
+                        self.handle(connection)
+                    except (EOFError, ConnectionError) as err:
+                        logger.warning("Login worker client disconnected: %s", err)
+
+
+def get_authkey() -> bytes:
+    if not settings.login_worker_authkey:
+        raise RuntimeError("LOGIN_WORKER_AUTHKEY must be set to use the login worker")
+    return settings.login_worker_authkey.encode()
+
+
+def request_login(address: Optional[str] = None) -> list[dict]:
+    """Asks a running login worker to log in, and returns the session cookies"""
+    address = address or settings.login_worker_address
+
+    with Client(address, authkey=get_authkey()) as connection:
+        connection.send("login")
+        response = connection.recv()
+
+    if error := response.get("error"):
+        raise RuntimeError(f"Login worker failed to log in: {error}")
+
+    return response["cookies"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a DBS login worker.")
+    parser.add_argument(
+        "--max-uses",
+        type=int,
+        default=20,
+        help="Number of logins after which the browser is replaced",
+    )
+    parser.add_argument(
+        "--max-memory-mb",
+        type=int,
+        default=1024,
+        help="Memory usage in MB above which the browser is replaced",
+    )
+    parser.add_argument(
+        "--lightweight-browser",
+        action="store_true",
+        help="Block images, fonts, analytics and hosts outside the allowlist",
+    )
+    args = parser.parse_args()
+
+    login_worker = LoginWorker(
+        Gmail(), args.max_uses, args.max_memory_mb, args.lightweight_browser
+    )
+    login_worker.serve(settings.login_worker_address, get_authkey())
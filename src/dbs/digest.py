@@ -0,0 +1,196 @@
+import base64
+import logging
+import os
+import re
+import tempfile
+import uuid
+from dataclasses import dataclass
+from email.message import MIMEPart
+from email.policy import SMTP
+from html import escape
+from typing import IO, Optional
+
+from dbs.gmail import Gmail, send_message_file
+
+logger = logging.getLogger(__name__)
+
+# Gmail rejects messages above 25 MB, which includes the base64 encoding
+MAX_MESSAGE_SIZE = 25 * 1024 * 1024
+# allowance for the headers and summary table of a message
+MESSAGE_OVERHEAD = 64 * 1024
+# base64 lines hold 57 bytes each, and are 78 bytes long with their CRLF
+LINE_BYTES = 57
+ENCODED_LINE_SIZE = 78
+ATTACHMENT_HEADERS_SIZE = 512
+
+FILENAME_PATTERN = re.compile(r"dbs-(?P<type>[a-z0-9]+)-(?P<date>[\d-]+)\.pdf$")
+
+
+def write_message(
+    file: IO[bytes],
+    headers: dict[str, str],
+    attachments: list[str],
+    body: Optional[MIMEPart] = None,
+) -> None:
+    """
+    Writes a MIME message with PDF attachments to `file`, base64-encoding
+    each attachment a few lines at a time instead of holding it in memory
+    """
+    boundary = f"=={uuid.uuid4().hex}"
+    lines = [f"{name}: {value}" for name, value in headers.items()] + [
+        "MIME-Version: 1.0",
+        f'Content-Type: multipart/mixed; boundary="{boundary}"',
+    ]
+    file.write(("\r\n".join(lines) + "\r\n").encode())
+
+    if body:
+        file.write(f"\r\n--{boundary}\r\n".encode())
+        file.write(body.as_bytes(policy=SMTP))
+
+    for attachment in attachments:
+        name = os.path.basename(attachment)
+        file.write(
+            (
+                f"\r\n--{boundary}\r\n"
+                f'Content-Type: application/pdf; name="{name}"\r\n'
+                f'Content-Disposition: attachment; filename="{name}"\r\n'
+                "Content-Transfer-Encoding: base64\r\n\r\n"
+            ).encode()
+        )
+        with open(attachment, "rb") as pdf_file:
+            # chunks are a multiple of the line length, so that every
+            # chunk ends on a line break
+            while chunk := pdf_file.read(LINE_BYTES * 1024):
+                file.write(base64.encodebytes(chunk).replace(b"\n", b"\r\n"))
+
+    file.write(f"\r\n--{boundary}--\r\n".encode())
+
+
+@dataclass
+class DigestEntry:
+    filename: str
+    size: int
+
+    @property
+    def encoded_size(self) -> int:
+        lines = -(-self.size // LINE_BYTES)
+        return lines * ENCODED_LINE_SIZE + ATTACHMENT_HEADERS_SIZE
+
+    @property
+    def summary(self) -> tuple[str, str, str, str]:
+        """Returns the account, statement type, date and size of the statement"""
+        account = os.path.dirname(self.filename) or "-"
+        name = os.path.basename(self.filename)
+        match = FILENAME_PATTERN.match(name)
+        statement_type, date = (
+            (match["type"].upper(), match["date"]) if match else (name, "-")
+        )
+        return account, statement_type, date, f"{self.size / 1024:.0f} KB"
+
+
+class DigestEmail:
+    """
+    Email sink that collects statements during a run, and sends them in as
+    few emails as possible, each of which stays under Gmail's size limit
+    """
+
+    def __init__(
+        self,
+        client: Gmail,
+        to_address: str,
+        from_address: str,
+        max_size: int = MAX_MESSAGE_SIZE,
+    ):
+        self.client = client
+        self.to_address = to_address
+        self.from_address = from_address
+        self.max_size = max_size
+        self.entries: list[DigestEntry] = []
+
+    def __call__(self, pdf_filename: str) -> None:
+        self.entries.append(DigestEntry(pdf_filename, os.path.getsize(pdf_filename)))
+
+    def get_chunks(self) -> list[list[DigestEntry]]:
+        """
+        Splits the statements into messages in the order they were added.
+        A statement that is too large for any message is sent on its own.
+        """
+        chunks: list[list[DigestEntry]] = []
+        size = self.max_size
+
+        for entry in self.entries:
+            if size + entry.encoded_size > self.max_size:
+                if entry.encoded_size + MESSAGE_OVERHEAD > self.max_size:
+                    logger.warning("%s may be too large to email", entry.filename)
+                chunks.append([])
+                size = MESSAGE_OVERHEAD
+            chunks[-1].append(entry)
+            size += entry.encoded_size
+
+        return chunks
+
+    @staticmethod
+    def get_subject(entries: list[DigestEntry], part: int, parts: int) -> str:
+        dates = sorted(entry.summary[2] for entry in entries)
+        subject = f"DBS eStatements - {len(entries)} statement(s)"
+        if dates[0] != dates[-1]:
+            subject += f", {dates[0]} to {dates[-1]}"
+        else:
+            subject += f", {dates[0]}"
+        if parts > 1:
+            subject += f" ({part}/{parts})"
+        return subject
+
+    @staticmethod
+    def get_body(entries: list[DigestEntry]) -> MIMEPart:
+        columns = ("Account", "Statement", "Date", "Size")
+        rows = [entry.summary for entry in entries]
+        widths = [max(len(row[i]) for row in [columns, *rows]) for i in range(4)]
+
+        text = "\n".join(
+            "  ".join(value.ljust(width) for value, width in zip(row, widths))
+            for row in [columns, *rows]
+        )
+        html = "".join(
+            "<tr>" + "".join(f"<td>{escape(value)}</td>" for value in row) + "</tr>"
+            for row in rows
+        )
+        header = "".join(f"<th>{column}</th>" for column in columns)
+
+        body = MIMEPart()
+        body.set_content(text + "\n")
+        body.add_alternative(f"<table><tr>{header}</tr>{html}</table>", subtype="html")
+        return body
+
+    def write_message(
+        self, file: IO[bytes], entries: list[DigestEntry], part: int, parts: int
+    ) -> None:
+        headers = {
+            "To": self.to_address,
+            "From": self.from_address,
+            "Subject": self.get_subject(entries, part, parts),
+        }
+        write_message(
+            file,
+            headers,
+            [entry.filename for entry in entries],
+            self.get_body(entries),
+        )
+
+    def send(self) -> list[str]:
+        """Sends all collected statements, and returns the ones that failed"""
+        chunks = self.get_chunks()
+        failed = []
+
+        for part, entries in enumerate(chunks, start=1):
+            try:
+                with tempfile.NamedTemporaryFile(suffix=".eml") as message_file:
+                    self.write_message(message_file, entries, part, len(chunks))
+                    message_file.flush()
+                    send_message_file(self.client.gmail_service, message_file.name)
+                logger.info("Digest %s/%s sent", part, len(chunks))
+            except Exception as err:  # pylint: disable=broad-exception-caught
+                logger.error("Failed to send digest %s/%s: %s", part, len(chunks), err)
+                failed += [entry.filename for entry in entries]
+
+        return failed
@@ -0,0 +1,236 @@
+"""
+Appends statement metadata and parsed transactions to Parquet (or Arrow IPC)
+datasets partitioned by statement month, so that statement history can be
+queried without listing the bucket or reading any PDFs.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import posixpath
+import uuid
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Literal, Optional
+
+try:
+    import pyarrow as pa  # type: ignore
+    import pyarrow.dataset as ds  # type: ignore
+except ImportError as err:  # pragma: no cover
+    raise ImportError(
+        "pyarrow is required to export statements, "
+        "install it with `poetry install --extras export`"
+    ) from err
+
+from dbs.storage import LocalStorageBackend, StorageBackend
+
+if TYPE_CHECKING:
+    from dbs.pipeline import StatementResult
+
+logger = logging.getLogger(__name__)
+
+ExportFormat = Literal["parquet", "arrow"]
+
+# exported files are stored under this prefix, wherever the export root is
+OBJECT_PREFIX = "exports"
+
+PARTITIONING = ds.partitioning(
+    pa.schema([("statement_month", pa.string())]), flavor="hive"
+)
+
+STATEMENT_SCHEMA = pa.schema(
+    [
+        ("statement_date", pa.string()),
+        ("statement_type", pa.string()),
+        ("statement_hash_key", pa.string()),
+        ("description", pa.string()),
+        ("entity_name", pa.list_(pa.string())),
+        ("address", pa.list_(pa.string())),
+        ("product_code", pa.string()),
+        ("product_reference_no", pa.string()),
+        ("currency", pa.string()),
+        ("formatted_account_number", pa.string()),
+        ("account", pa.string()),
+        ("filename", pa.string()),
+        ("status", pa.string()),
+        ("error", pa.string()),
+        ("size", pa.int64()),
+        ("sha256", pa.string()),
+        ("download_seconds", pa.float64()),
+        ("exported_at", pa.timestamp("s", tz="UTC")),
+        ("statement_month", pa.string()),
+    ]
+)
+
+TRANSACTION_SCHEMA = pa.schema(
+    [
+        ("account_number", pa.string()),
+        ("statement_date", pa.string()),
+        ("transaction_date", pa.string()),
+        ("description", pa.string()),
+        ("amount", pa.decimal128(18, 2)),
+        ("balance", pa.decimal128(18, 2)),
+        ("statement_month", pa.string()),
+    ]
+)
+
+
+class DatasetWriter:
+    """
+    Buffers the rows of one dataset, and writes every `batch_size` rows
+    as new files under a directory per statement month
+    """
+
+    def __init__(
+        self, path: str, schema: pa.Schema, file_format: ExportFormat, batch_size: int
+    ):
+        self.path = path
+        self.schema = schema
+        self.file_format = file_format
+        self.batch_size = batch_size
+        self.rows: list[dict] = []
+        # files written (or replaced by compaction) during this run
+        self.written: set[str] = set()
+
+    def append(self, row: dict) -> None:
+        self.rows.append(row)
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def write(self, table: pa.Table, path: str, partitioning=None) -> None:
+        ds.write_dataset(
+            table,
+            path,
+            format=self.file_format,
+            partitioning=partitioning,
+            basename_template=f"part-{uuid.uuid4().hex}-{{i}}.{self.file_format}",
+            existing_data_behavior="overwrite_or_ignore",
+            file_visitor=lambda written_file: self.written.add(written_file.path),
+        )
+
+    def flush(self) -> None:
+        if not self.rows:
+            return
+
+        table = pa.Table.from_pylist(self.rows, schema=self.schema)
+        self.write(table, self.path, PARTITIONING)
+        logger.info("Exported %s row(s) to %s", len(self.rows), self.path)
+        self.rows = []
+
+    def compact(self) -> list[str]:
+        """
+        Rewrites each statement month with more than one file as a single
+        file, and returns the files that were removed
+        """
+        if not os.path.isdir(self.path):
+            return []
+
+        removed = []
+        for partition in sorted(os.listdir(self.path)):
+            directory = os.path.join(self.path, partition)
+            files = sorted(
+                os.path.join(directory, filename)
+                for filename in os.listdir(directory)
+                if filename.endswith(f".{self.file_format}")
+            )
+            if len(files) < 2:
+                continue
+
+            table = ds.dataset(files, format=self.file_format).to_table()
+            self.write(table, directory)
+            for file in files:
+                os.remove(file)
+                self.written.discard(file)
+            removed += files
+            logger.info("Compacted %s file(s) in %s", len(files), directory)
+
+        return removed
+
+
+class StatementExporter:
+    """
+    Exports the metadata of every processed statement, and its parsed
+    transactions, optionally uploading the written files to storage
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        root: str = "exports",
+        file_format: ExportFormat = "parquet",
+        batch_size: int = 10_000,
+        storage: Optional[StorageBackend] = None,
+        compact: bool = False,
+    ):
+        self.root = root
+        self.statements = DatasetWriter(
+            os.path.join(root, "statements"), STATEMENT_SCHEMA, file_format, batch_size
+        )
+        self.transactions = DatasetWriter(
+            os.path.join(root, "transactions"),
+            TRANSACTION_SCHEMA,
+            file_format,
+            batch_size,
+        )
+        self.storage = storage
+        self.compact = compact
+        if compact and storage and not isinstance(storage, LocalStorageBackend):
+            # compaction reads the export root, so files that earlier runs
+            # uploaded but did not keep locally are never merged
+            logger.warning(
+                "Only the files in %s are compacted, files that are only in "
+                "%s are not",
+                root,
+                type(storage).__name__,
+            )
+        self.exported_at = datetime.now(timezone.utc).replace(microsecond=0)
+
+    def add(self, result: StatementResult) -> None:
+        record = result.record
+        statement_month = record.statement_date[:7]
+
+        self.statements.append(
+            {
+                **record.model_dump(),
+                "entity_name": [str(name) for name in record.entity_name],
+                "address": [str(line) for line in record.address],
+                "account": record.account,
+                "filename": result.filename,
+                "status": result.status,
+                "error": str(result.error) if result.error else None,
+                "size": result.pdf_file.size if result.pdf_file else None,
+                "sha256": result.pdf_file.sha256 if result.pdf_file else None,
+                "download_seconds": result.download_seconds,
+                "exported_at": self.exported_at,
+                "statement_month": statement_month,
+            }
+        )
+        for transaction in result.transactions:
+            self.transactions.append(
+                {
+                    **vars(transaction),
+                    "statement_month": statement_month,
+                }
+            )
+
+    def close(self) -> None:
+        """Writes any remaining rows, then compacts and uploads if enabled"""
+        removed = []
+        for writer in (self.statements, self.transactions):
+            writer.flush()
+            if self.compact:
+                removed += writer.compact()
+
+        if not self.storage:
+            return
+
+        for path in sorted(self.statements.written | self.transactions.written):
+            self.storage.upload(path, self.get_object_name(path))
+        # compacted files are only deleted once the files replacing them exist
+        for path in removed:
+            self.storage.delete(self.get_object_name(path))
+
+    def get_object_name(self, path: str) -> str:
+        """Returns the stored name of an exported file, relative to the root"""
+        relative_path = os.path.relpath(path, self.root)
+        return posixpath.join(OBJECT_PREFIX, *relative_path.split(os.sep))
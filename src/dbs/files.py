@@ -0,0 +1,53 @@
+import hashlib
+import os
+import tempfile
+from dataclasses import dataclass
+
+CHUNK_SIZE = 64 * 1024
+
+
+@dataclass
+class DownloadedFile:
+    path: str
+    size: int
+    sha256: str
+
+
+class AtomicFileWriter:
+    """
+    Writes to a temporary file next to `path`, which is renamed into place
+    once all chunks have been written, so that a failed download never leaves
+    a partial file behind. The content is hashed as it is written.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.size = 0
+        self.hash = hashlib.sha256()
+        directory, filename = os.path.split(os.path.abspath(path))
+        fd, self.tmp_path = tempfile.mkstemp(
+            dir=directory, prefix=f".{filename}.", suffix=".part"
+        )
+        self.file = os.fdopen(fd, "wb")
+
+    def __enter__(self) -> "AtomicFileWriter":
+        return self
+
+    def __exit__(self, exc_type, *_) -> None:
+        self.file.close()
+
+        if exc_type:
+            os.unlink(self.tmp_path)
+            return
+
+        os.chmod(self.tmp_path, 0o644)
+        os.replace(self.tmp_path, self.path)
+
+    def write(self, chunk: bytes) -> None:
+        self.file.write(chunk)
+        self.hash.update(chunk)
+        self.size += len(chunk)
+
+    @property
+    def result(self) -> DownloadedFile:
+        return DownloadedFile(self.path, self.size, self.hash.hexdigest())
@@ -1,3 +1,3 @@
-from .gmail import Gmail, Message, MessagePart
+from .gmail import Gmail, Message, MessagePart, send_message_file
 
-__all__ = ["Gmail", "Message", "MessagePart"]
+__all__ = ["Gmail", "Message", "MessagePart", "send_message_file"]
@@ -1,50 +1,181 @@
+"""
+Gmail credentials and API clients, which are cached so that only the first
+use in a process reads the token, and only an expired token is refreshed.
+
+The token is kept (with its expiry) in a local file, and is read from
+Secret Manager only when that file is missing. Refreshed tokens are
+written to the file, so that the next run can skip the refresh, and to
+Secret Manager only if the refresh token itself has changed, as every
+secret version is kept (and billed).
+"""
+
 from __future__ import annotations
 
 import json
 import logging
-from typing import TYPE_CHECKING
-
-from google.cloud import secretmanager
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
+import os
+import threading
+from functools import cache
+from typing import TYPE_CHECKING, Optional
 
 from dbs.settings import settings
 
 if TYPE_CHECKING:
+    from google.oauth2.credentials import Credentials
     from googleapiclient._apis.gmail.v1.resources import GmailResource
 
 
 logger = logging.getLogger(__name__)
 
+_lock = threading.Lock()
+_credentials: Optional[Credentials] = None  # pylint: disable=invalid-name
+# the HTTP client of a Gmail service isn't thread-safe, so each thread
+# (e.g. each login of a multi-account run) builds its own
+_services = threading.local()
+
+
+def get_secret_parent() -> str:
+    return f"projects/{settings.project_id}/secrets/{settings.secret_id}"
 
-def get_credentials(version_id="latest"):
-    project_id = settings.project_id
-    secret_id = settings.secret_id
-    scopes = [
-        "https://www.googleapis.com/auth/gmail.readonly",
-        "https://www.googleapis.com/auth/gmail.settings.basic",
-        "https://www.googleapis.com/auth/gmail.labels",
-        "https://www.googleapis.com/auth/gmail.modify",
-    ]
+
+def read_secret(version_id: str = "latest") -> str:
+    # pylint: disable=import-outside-toplevel
+    from google.cloud import secretmanager
 
     client = secretmanager.SecretManagerServiceClient()
-    name = f"projects/{project_id}/secrets/{secret_id}/versions/{version_id}"
-    response = client.access_secret_version(name=name)
+    response = client.access_secret_version(
+        name=f"{get_secret_parent()}/versions/{version_id}"
+    )
+    return response.payload.data.decode()
+
 
-    credentials = Credentials.from_authorized_user_info(
-        info=json.loads(response.payload.data), scopes=scopes
+def write_secret(token: str) -> None:
+    # pylint: disable=import-outside-toplevel
+    from google.cloud import secretmanager
+
+    client = secretmanager.SecretManagerServiceClient()
+    client.add_secret_version(
+        parent=get_secret_parent(),
+        payload=secretmanager.SecretPayload(data=token.encode()),
     )
+
+
+def read_token_cache(path: str) -> Optional[str]:
+    try:
+        with open(path, encoding="utf-8") as file:
+            return file.read()
+    except FileNotFoundError:
+        return None
+
+
+def write_token_cache(path: str, token: str) -> None:
+    # only the current user should be able to read the token
+    tmp_path = f"{path}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as file:
+        file.write(token)
+    os.replace(tmp_path, path)
+
+
+def load_credentials(version_id: str = "latest") -> Credentials:
+    """
+    Returns the credentials in the local token cache, or else in Secret
+    Manager, refreshing them if they have expired
+    """
+    # pylint: disable=import-outside-toplevel
+    from google.oauth2.credentials import Credentials
+
+    scopes = settings.gmail_scopes
+    cache_path = settings.gmail_token_cache_path
+    credentials = None
+
+    if cache_path and (token := read_token_cache(cache_path)):
+        try:
+            credentials = Credentials.from_authorized_user_info(
+                json.loads(token), scopes=scopes
+            )
+            logger.info("Loaded Gmail token from %s", cache_path)
+        except ValueError:
+            logger.warning("Could not read Gmail token cache, ignoring it")
+
+    from_secret = credentials is None
+    if credentials is None:
+        logger.info("Reading Gmail token from Secret Manager")
+        credentials = Credentials.from_authorized_user_info(
+            json.loads(read_secret(version_id)), scopes=scopes
+        )
+
+    if credentials.valid:
+        if from_secret and cache_path:
+            write_token_cache(cache_path, credentials.to_json())
+        return credentials
+
+    from google.auth.transport.requests import Request
+
+    logger.info("Refreshing Gmail token")
+    refresh_token = credentials.refresh_token
+    credentials.refresh(Request())
+    token = credentials.to_json()
+    if cache_path:
+        write_token_cache(cache_path, token)
+
+    # the secret only needs the refresh token, which rarely changes
+    if credentials.refresh_token == refresh_token:
+        return credentials
+    try:
+        write_secret(token)
+        logger.info("Saved refreshed Gmail token to Secret Manager")
+    except Exception as err:  # pylint: disable=broad-exception-caught
+        # the local cache still saves the next run a refresh
+        logger.warning("Could not save Gmail token to Secret Manager: %s", err)
+
     return credentials
 
 
+def get_credentials(version_id: str = "latest") -> Credentials:
+    """Returns the credentials of this process, loading them on first use"""
+    global _credentials  # pylint: disable=global-statement
+
+    with _lock:
+        if _credentials is None or not _credentials.valid:
+            _credentials = load_credentials(version_id)
+        return _credentials
+
+
+@cache
+def get_discovery_document() -> dict:
+    """Returns the Gmail discovery document bundled with googleapiclient"""
+    # pylint: disable=import-outside-toplevel
+    from googleapiclient.discovery_cache import get_static_doc
+
+    return json.loads(get_static_doc("gmail", "v1"))  # type: ignore[arg-type]
+
+
 def get_gmail_service() -> GmailResource:
-    logger.info("Creating Gmail client")
-    credentials = get_credentials()
+    """Returns the Gmail service of the current thread, building it on first use"""
+    # pylint: disable=import-outside-toplevel
+    from googleapiclient import discovery
 
-    try:
-        service = build("gmail", "v1", credentials=credentials, cache_discovery=False)
+    if (service := getattr(_services, "service", None)) is not None:
         return service
 
+    logger.info("Creating Gmail client")
+    try:
+        service = discovery.build_from_document(  # type: ignore[attr-defined]
+            get_discovery_document(), credentials=get_credentials()
+        )
     except Exception as err:
         logger.error(err)
         raise err
+
+    _services.service = service
+    return service
+
+
+def clear_cache() -> None:
+    """Forgets the credentials and the service of the current thread"""
+    global _credentials  # pylint: disable=global-statement
+
+    with _lock:
+        _credentials = None
+    _services.service = None
@@ -2,14 +2,15 @@ from __future__ import annotations
 
 import asyncio
 import logging
-import re
-import sys
+import os
 import time
-from base64 import urlsafe_b64decode
-from dataclasses import dataclass
-from typing import TYPE_CHECKING, Optional
+from collections import deque
+from typing import TYPE_CHECKING, Any, Iterator, Literal, Optional
 
 from dbs.gmail.credentials import get_gmail_service
+from dbs.gmail.otp import extract_otp, find_snippet_otp
+from dbs.metrics import metrics
+from dbs.ratelimit import RateLimiter
 from dbs.settings import settings
 
 if TYPE_CHECKING:
@@ -17,172 +18,372 @@ if TYPE_CHECKING:
 
 logger = logging.getLogger(__name__)
 
+MessageFormat = Literal["minimal", "metadata", "full", "raw"]
+
+# the only headers of a message that are read
+KEPT_HEADERS = frozenset({"Subject", "From", "Date"})
+
+
+def send_message_file(gmail_service: GmailResource, filename: str) -> dict:
+    """Sends an RFC 822 message from a file with a resumable upload"""
+    # pylint: disable=import-outside-toplevel
+    from googleapiclient.http import MediaFileUpload
+
+    media = MediaFileUpload(filename, mimetype="message/rfc822", resumable=True)
+    metrics.increment("api_calls", service="gmail", endpoint="messages.send")
+    metrics.increment("emailed_bytes", os.path.getsize(filename))
+    return (
+        gmail_service.users()
+        .messages()
+        .send(userId="me", body={}, media_body=media)  # type: ignore
+        .execute()
+    )
+
 
 class Gmail:
-    def __init__(self, gmail_service: Optional[GmailResource] = None):
-        if not gmail_service:
-            self.gmail_service: GmailResource = get_gmail_service()
+    def __init__(
+        self,
+        gmail_service: Optional[GmailResource] = None,
+        otp_email_subject: Optional[str] = None,
+    ):
+        self._gmail_service = gmail_service
+        self.otp_email_subject = otp_email_subject or settings.otp_email_subject
+
+    @property
+    def gmail_service(self) -> GmailResource:
+        # the service (and its credentials) are only fetched once first used
+        if self._gmail_service is None:
+            self._gmail_service = get_gmail_service()
+        return self._gmail_service
+
+    # pylint: disable=too-many-arguments
+    def get_emails(
+        self,
+        query: str = "is:unread",
+        latest: bool = False,
+        *,
+        message_format: MessageFormat = "full",
+        fields: Optional[str] = None,
+        metadata_headers: Optional[list[str]] = None,
+        batch_size: int = 50,
+    ) -> Iterator[Message]:
+        """
+        Lazily yields the emails matching `query`, newest first.
 
-    def get_emails(self, query="is:unread", latest=False) -> list[Message]:
-        if subject := settings.otp_email_subject:
+        Each page of search results is fetched with a single batch request,
+        using `message_format` (minimal, metadata or full) and an optional
+        `fields` mask to limit the size of each message.
+        """
+        if subject := self.otp_email_subject:
             query += " " + subject
 
-        emails = (
+        page_token = None
+        found = False
+
+        while True:
+            metrics.increment("api_calls", service="gmail", endpoint="messages.list")
+            response = (
+                self.gmail_service.users()
+                .messages()
+                .list(
+                    userId="me",
+                    q=query,
+                    maxResults=1 if latest else None,
+                    pageToken=page_token,
+                    fields="messages/id,nextPageToken",
+                )
+                .execute()
+            )
+            email_ids = [email["id"] for email in response.get("messages", [])]
+
+            for start in range(0, len(email_ids), batch_size):
+                end = start + batch_size
+                found = True
+                yield from self.get_messages(
+                    email_ids[start:end],
+                    message_format=message_format,
+                    fields=fields,
+                    metadata_headers=metadata_headers,
+                )
+
+            page_token = response.get("nextPageToken")
+            if latest or not page_token:
+                break
+
+        if not found:
+            logger.info("No emails found using query: '%s'", query)
+
+    def get_message_ids(
+        self, query: str, rate_limiter: Optional[RateLimiter] = None
+    ) -> Iterator[str]:
+        """
+        Lazily yields the IDs of every email matching `query`, newest first,
+        waiting for `rate_limiter` before each page is requested
+        """
+        page_token = None
+
+        while True:
+            if rate_limiter:
+                rate_limiter.wait()
+            metrics.increment("api_calls", service="gmail", endpoint="messages.list")
+            response = (
+                self.gmail_service.users()
+                .messages()
+                .list(
+                    userId="me",
+                    q=query,
+                    maxResults=500,
+                    pageToken=page_token,
+                    fields="messages/id,nextPageToken",
+                )
+                .execute()
+            )
+            for email in response.get("messages", []):
+                yield email["id"]
+
+            if not (page_token := response.get("nextPageToken")):
+                return
+
+    def batch_modify(
+        self,
+        message_ids: list[str],
+        add_label_ids: Optional[list[str]] = None,
+        remove_label_ids: Optional[list[str]] = None,
+    ) -> None:
+        """Changes the labels of up to 1000 emails with a single request"""
+        metrics.increment("api_calls", service="gmail", endpoint="messages.batchModify")
+        self.gmail_service.users().messages().batchModify(
+            userId="me",
+            body={
+                "ids": message_ids,
+                "addLabelIds": add_label_ids or [],
+                "removeLabelIds": remove_label_ids or [],
+            },
+        ).execute()
+
+    def get_messages(
+        self,
+        message_ids: list[str],
+        message_format: MessageFormat = "full",
+        fields: Optional[str] = None,
+        metadata_headers: Optional[list[str]] = None,
+    ) -> list[Message]:
+        """Fetches messages with one batch request, in the order given"""
+        responses: dict[str, dict] = {}
+
+        def callback(request_id: str, response: Any, exception: Optional[Exception]):
+            if exception:
+                raise exception
+            responses[request_id] = response
+
+        batch = self.gmail_service.new_batch_http_request(callback=callback)
+        for message_id in message_ids:
+            logger.debug("Retrieving email %s", message_id)
+            batch.add(
+                self.gmail_service.users()
+                .messages()
+                .get(
+                    userId="me",
+                    id=message_id,
+                    format=message_format,
+                    fields=fields,
+                    metadataHeaders=metadata_headers,
+                ),
+                request_id=message_id,
+            )
+        metrics.increment("api_calls", service="gmail", endpoint="batch")
+        batch.execute()
+
+        return [Message(responses[message_id]) for message_id in message_ids]
+
+    def get_history_id(self) -> str:
+        """Returns the current history ID of the mailbox"""
+        metrics.increment("api_calls", service="gmail", endpoint="getProfile")
+        profile = self.gmail_service.users().getProfile(userId="me").execute()
+        return profile["historyId"]
+
+    def get_message(self, message_id: str, **kwargs) -> Message:
+        metrics.increment("api_calls", service="gmail", endpoint="messages.get")
+        message = (
             self.gmail_service.users()
             .messages()
-            .list(userId="me", q=query)
+            .get(userId="me", id=message_id, **kwargs)
             .execute()
-            .get("messages")
         )
+        return Message(message)  # type: ignore
 
-        if not emails:
-            logger.info("No emails found using query: '%s'", query)
-            sys.exit(0)
+    def mark_as_read(self, message: Message):
+        metrics.increment("api_calls", service="gmail", endpoint="messages.modify")
+        logger.info("Marking email %s as read", message.message_id)
+        return (
+            self.gmail_service.users()
+            .messages()
+            .modify(
+                userId="me",
+                id=message.message_id,
+                body={"removeLabelIds": ["UNREAD"]},
+            )
+            .execute()
+        )
 
-        if latest:
-            emails = [emails[0]]
+    def get_new_message_ids(self, start_history_id: str) -> tuple[list[str], str]:
+        """
+        Returns the IDs of messages added to the inbox since `start_history_id`,
+        along with the latest history ID
+        """
+        message_ids = []
+        history_id = start_history_id
+        page_token = None
 
-        messages = []
-        for email in emails:
-            email_id = email["id"]
-            logger.debug("Retrieving email %s", email_id)
-            message = (
+        while True:
+            metrics.increment("api_calls", service="gmail", endpoint="history.list")
+            response = (
                 self.gmail_service.users()
-                .messages()
-                .get(userId="me", id=email_id)
+                .history()
+                .list(
+                    userId="me",
+                    startHistoryId=start_history_id,
+                    historyTypes=["messageAdded"],
+                    labelId="INBOX",
+                    pageToken=page_token,
+                )
                 .execute()
             )
-            messages.append(message)
-
-        return [
-            Message(message, self.gmail_service) for message in messages  # type: ignore
-        ]
-
-    def search_data_key(self, part: dict):
-        """Recursively searches message part for a 'data' key"""
-        for key, value in part.items():
-            if key == "data":
-                return value
-            if isinstance(value, dict):
-                result = self.search_data_key(value)
-                if result is not None:
-                    return result
-            if isinstance(value, list):
-                for item in value:
-                    if isinstance(item, dict):
-                        result = self.search_data_key(item)
-                        if result is not None:
-                            return result
-        return None
-
-    async def wait_for_new_message(self, timeout=time.time() + 60 * 5) -> Message:
+            for history in response.get("history", []):
+                for added in history.get("messagesAdded", []):
+                    message_ids.append(added["message"]["id"])
+
+            history_id = response.get("historyId", history_id)
+            if not (page_token := response.get("nextPageToken")):
+                return message_ids, history_id
+
+    def is_otp_message(self, message: Message) -> bool:
+        if not (subject := self.otp_email_subject):
+            return True
+
+        text = f"{message.headers.get('Subject', '')} {message.snippet}"
+        return subject.lower() in text.lower()
+
+    async def wait_for_new_message(
+        self,
+        timeout: float = 60 * 5,
+        start_history_id: Optional[str] = None,
+        min_interval: float = 0.25,
+        max_interval: float = 2,
+    ) -> Message:
         """
-        Waits for a new email message to arrive within the specified period.
+        Waits for a new OTP email to arrive within the specified period.
+
+        Instead of listing and fetching the latest email on every poll, only
+        the mailbox history since `start_history_id` is fetched, with polls
+        backing off from `min_interval` to `max_interval` seconds. Just the
+        headers and snippet of new messages are fetched, and the full OTP
+        email only if its snippet doesn't contain the OTP.
 
         Args:
-            timeout (int): Maximum time to wait in seconds. Defaults to 5 minutes.
+            timeout (float): Maximum time to wait in seconds. Defaults to 5 minutes.
+            start_history_id (str): History ID to look for new messages after.
+                Defaults to the current history ID.
 
         Returns:
-            latest_message: The latest email message received.
+            latest_message: The OTP email message received.
         """
         logger.info("Monitoring inbox for new messages")
-        start_time = time.time()
-        current_message = self.get_emails(query="", latest=True)[0]
-        logger.info("Current message %s", current_message.message_id)
-
-        while time.time() < start_time + timeout:
-            latest_message = self.get_emails(query="", latest=True)[0]
+        # the Gmail client blocks, so each request is made in a thread (one
+        # at a time, as its HTTP client isn't thread-safe) to let the event
+        # loop run the browser meanwhile
+        if start_history_id is None:
+            start_history_id = await asyncio.to_thread(self.get_history_id)
+        history_id = start_history_id
+        logger.info("Current history ID %s", history_id)
+        deadline = time.monotonic() + timeout
+        interval = min_interval
+
+        while time.monotonic() < deadline:
+            message_ids, history_id = await asyncio.to_thread(
+                self.get_new_message_ids, history_id
+            )
 
-            if current_message.message_id != latest_message.message_id:
-                logger.info(
-                    "New message %s received, exiting loop", latest_message.message_id
+            for message_id in message_ids:
+                message = await asyncio.to_thread(
+                    self.get_message,
+                    message_id,
+                    format="metadata",
+                    metadataHeaders=["Subject", "From"],
                 )
-                return latest_message
+                if self.is_otp_message(message):
+                    logger.info("New message %s received, exiting loop", message_id)
+                    # the full email is only needed if its snippet has no OTP
+                    if find_snippet_otp(message):
+                        return message
+                    return await asyncio.to_thread(self.get_message, message_id)
 
-            await asyncio.sleep(1)
+            await asyncio.sleep(interval)
+            interval = min(interval * 1.5, max_interval)
 
         raise RuntimeError("Timed out - new email not found in inbox")
 
-    def extract_otp_from_message(self, message: Message) -> str:
+    @staticmethod
+    def extract_otp_from_message(message: Message) -> str:
         """Retrieves a DBS OTP from a specific email"""
-        byte_data = self.get_byte_data(message)
-        data = urlsafe_b64decode(byte_data).decode("utf-8")
-        otp = self.search_string_for_otp(data)
-        return otp
-
-    def get_byte_data(self, message: Message) -> bytes:
-        if "body" in message.payload:
-            if "data" in message.payload["body"]:
-                return message.payload["body"]["data"]
+        return extract_otp(message)
 
-        if message.parts:
-            for part in message.parts:
-                return self.search_data_key(part.data)
-        raise RuntimeError("Byte data not found in email message")
 
-    @staticmethod
-    def search_string_for_otp(text: str) -> str:
-        if match := re.search(r"\d{6}", text):
-            otp = match.group(0)
-            return otp
-        raise RuntimeError("Could not find OTP in message")
+class Message:
+    """
+    A message returned by the Gmail API, which keeps only the headers that
+    are read and references to its body and parts, rather than the payload.
+    Operations on a message, like marking it as read, are done by `Gmail`.
+    """
 
+    __slots__ = ("message_id", "snippet", "headers", "mime_type", "body", "child_parts")
 
-class Message(Gmail):
-    def __init__(self, data: dict, gmail_service: GmailResource):
+    def __init__(self, data: dict):
+        payload = data.get("payload") or {}
         self.message_id: str = data.get("id")  # type: ignore
-        self.payload: dict = data.get("payload")  # type: ignore
-        self.gmail_service = gmail_service
-        self.trusted_user_emails = settings.trusted_user_emails
-        super().__init__(gmail_service)
-
-    def mark_as_read(self):
-        logger.info("Marking email %s as read", self.message_id)
-        return (
-            self.gmail_service.users()
-            .messages()
-            .modify(
-                userId="me", id=self.message_id, body={"removeLabelIds": ["UNREAD"]}
-            )
-            .execute()
-        )
+        self.snippet: str = data.get("snippet", "")
+        # when a header is repeated, the last value is kept
+        self.headers: dict[str, str] = {
+            item["name"]: item["value"]
+            for item in payload.get("headers", ())
+            if item["name"] in KEPT_HEADERS
+        }
+        self.mime_type: str = payload.get("mimeType", "text/plain")
+        self.body: Optional[dict] = payload.get("body")
+        self.child_parts: list[dict] = payload.get("parts") or []
 
     @property
     def subject(self) -> str:
-        for item in self.payload["headers"]:
-            if item["name"] == "Subject":
-                return item["value"]
-        raise RuntimeError("Subject could not be found")
+        try:
+            return self.headers["Subject"]
+        except KeyError as err:
+            raise RuntimeError("Subject could not be found") from err
 
     @property
-    def parts(self) -> list[MessagePart] | None:
-        """Return parts and nested parts"""
-        if parts := self.payload.get("parts"):
-            nested_parts = [
-                nested_part
-                for part in list(parts)
-                if part.get("parts")
-                for nested_part in part.get("parts")
-            ]
-            return [MessagePart(part) for part in parts + nested_parts]
-
-        return None
+    def parts(self) -> Iterator[MessagePart]:
+        """Yields parts, followed by their nested parts"""
+        queue = deque(self.child_parts)
+        while queue:
+            part = queue.popleft()
+            queue.extend(part.get("parts") or ())
+            yield MessagePart(part)
 
     @property
     def from_trusted_user(self) -> bool:
         """Check if user is trusted"""
-        for item in self.payload["headers"]:
-            if item["name"] == "From":
-                for trusted_email in self.trusted_user_emails:
-                    if f"<{trusted_email}>" in item["value"]:
-                        return True
+        sender = self.headers.get("From", "")
+        for trusted_email in settings.trusted_user_emails:
+            if f"<{trusted_email}>" in sender:
+                return True
 
         logger.info("No trusted user found")
         return False
 
 
-@dataclass
+# pylint: disable=too-few-public-methods
 class MessagePart:
+    __slots__ = ("data", "part_id", "filename", "body")
+
     def __init__(self, data: dict):
         self.data = data
         self.part_id: str | None = data.get("partId")
@@ -0,0 +1,143 @@
+"""
+Cleans up forwarded OTP emails in bulk, so that the OTP inbox (and every
+search of it) doesn't grow without limit.
+
+Usage: python -m dbs.gmail.maintenance --action archive --older-than 7d
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+from typing import Literal, Optional
+
+from dbs.gmail.gmail import Gmail
+from dbs.metrics import metrics
+from dbs.ratelimit import RateLimiter
+from dbs.settings import settings
+
+logger = logging.getLogger(__name__)
+
+CleanupAction = Literal["read", "archive", "trash"]
+
+# the most IDs that batchModify accepts in one request
+MAX_BATCH_SIZE = 1000
+
+# the labels added and removed by each action, all of which are done with
+# batchModify, so that the gmail.modify scope is enough (unlike batchDelete,
+# which needs full access to the mailbox)
+ACTION_LABELS: dict[str, tuple[list[str], list[str]]] = {
+    "read": ([], ["UNREAD"]),
+    "archive": ([], ["UNREAD", "INBOX"]),
+    "trash": (["TRASH"], ["UNREAD", "INBOX"]),
+}
+
+
+def build_query(
+    subject: Optional[str],
+    trusted_user_emails: list[str],
+    older_than: Optional[str] = None,
+) -> str:
+    """
+    Returns a Gmail search for OTP emails, which are forwarded from a
+    trusted sender and mention `subject`
+    """
+    if not subject:
+        raise ValueError("An OTP email subject is required to find OTP emails")
+
+    phrase = subject.replace('"', "")
+    terms = [f'"{phrase}"']
+    if trusted_user_emails:
+        terms.append(f"from:({' OR '.join(trusted_user_emails)})")
+    if older_than:
+        terms.append(f"older_than:{older_than}")
+    return " ".join(terms)
+
+
+# pylint: disable=too-few-public-methods
+class InboxCleaner:
+    """
+    Marks OTP emails as read, archives them or moves them to the trash
+    (where Gmail deletes them after 30 days), with one
+    request per `batch_size` emails, and at most `rate_limit` requests
+    per second
+    """
+
+    def __init__(
+        self,
+        gmail_client: Gmail,
+        rate_limit: Optional[float] = None,
+        batch_size: int = MAX_BATCH_SIZE,
+    ):
+        if not 0 < batch_size <= MAX_BATCH_SIZE:
+            raise ValueError(f"Batch size must be between 1 and {MAX_BATCH_SIZE}")
+
+        self.gmail_client = gmail_client
+        self.rate_limiter = RateLimiter(rate_limit)
+        self.batch_size = batch_size
+
+    def clean(
+        self,
+        action: CleanupAction = "archive",
+        older_than: Optional[str] = "1d",
+        dry_run: bool = False,
+        subject: Optional[str] = None,
+    ) -> int:
+        """Returns the number of OTP emails found, which are cleaned unless `dry_run`"""
+        query = build_query(
+            subject or self.gmail_client.otp_email_subject,
+            settings.trusted_user_emails,
+            older_than,
+        )
+        # all IDs are listed first, as changing labels while paging
+        # through search results would skip some emails
+        message_ids = list(self.gmail_client.get_message_ids(query, self.rate_limiter))
+        logger.info("Found %s OTP email(s) using query: '%s'", len(message_ids), query)
+
+        if dry_run:
+            logger.info("Dry run, %s OTP email(s) not changed", action)
+            return len(message_ids)
+
+        for start in range(0, len(message_ids), self.batch_size):
+            end = start + self.batch_size
+            batch = message_ids[start:end]
+            added, removed = ACTION_LABELS[action]
+            self.rate_limiter.wait()
+            self.gmail_client.batch_modify(
+                batch, add_label_ids=added, remove_label_ids=removed
+            )
+            metrics.increment("otp_emails_cleaned", len(batch), action=action)
+
+        logger.info("Cleaned %s OTP email(s) (%s)", len(message_ids), action)
+        return len(message_ids)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Clean up forwarded OTP emails.")
+    parser.add_argument(
+        "--action",
+        choices=["read", "archive", "trash"],
+        default="archive",
+        help="Mark as read, archive (and mark as read) or move to the trash",
+    )
+    parser.add_argument(
+        "--older-than",
+        default="1d",
+        help="Only clean OTP emails older than this, e.g. 2d, 1m or 1y",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only count the OTP emails that would be cleaned",
+    )
+    parser.add_argument(
+        "--rate-limit",
+        type=float,
+        default=2,
+        help="Maximum number of Gmail requests per second",
+    )
+    args = parser.parse_args()
+
+    InboxCleaner(Gmail(), args.rate_limit).clean(
+        args.action, args.older_than, args.dry_run
+    )
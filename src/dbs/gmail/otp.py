@@ -0,0 +1,117 @@
+"""
+Finds the OTP in a forwarded DBS SMS, from the snippet of the email if
+possible, and otherwise from its text parts.
+
+6-digit numbers that could be an OTP are found first, and those next to
+words like "OTP" are preferred, so that phone numbers, dates and amounts in
+the same text aren't mistaken for one.
+"""
+
+from __future__ import annotations
+
+import html
+import logging
+import re
+from base64 import urlsafe_b64decode
+from typing import TYPE_CHECKING, Iterator, Optional
+
+from dbs.settings import settings
+
+if TYPE_CHECKING:
+    from dbs.gmail.gmail import Message
+
+logger = logging.getLogger(__name__)
+
+# bounds on the MIME tree walk, as a forwarded SMS is a few small parts
+MAX_PARTS = 32
+MAX_PART_SIZE = 64 * 1024
+
+OTP_WORDS = r"(?:OTP|one[- ]time (?:password|PIN)|verification code|code)"
+
+# a 6-digit number that isn't part of a phone number, date, time or amount
+CANDIDATE_PATTERN = re.compile(r"(?<![\d+$])(?<!\d[/:.,-])\d{6}(?!\d|[/:.,-]\d)")
+# the words just before or after an OTP, e.g. "Your DBS OTP is 123456",
+# "OTP: 123456" or "123456 is your DBS digibank OTP"
+BEFORE_PATTERN = re.compile(rf"\b{OTP_WORDS}\b[^\d\n]{{0,40}}$", re.I)
+AFTER_PATTERN = re.compile(rf"[^\d\n]{{0,40}}?\b{OTP_WORDS}\b", re.I)
+CONTEXT_SIZE = 60
+
+TAG_PATTERN = re.compile(r"<[^>]+>")
+
+
+def find_otp(text: str) -> Optional[str]:
+    """
+    Returns the first candidate preceded by words like "OTP", or else the
+    first followed by them, or else the first candidate at all
+    """
+    followed = first = None
+
+    # only the text around each candidate is searched for context
+    for match in CANDIDATE_PATTERN.finditer(text):
+        start, end = match.span()
+        if BEFORE_PATTERN.search(text, max(start - CONTEXT_SIZE, 0), start):
+            return match.group()
+        if followed is None and AFTER_PATTERN.match(text, end, end + CONTEXT_SIZE):
+            followed = match.group()
+        if first is None:
+            first = match.group()
+
+    return followed or first
+
+
+def find_snippet_otp(message: Message) -> Optional[str]:
+    """Returns the OTP in the snippet of an email, which is HTML-escaped"""
+    return find_otp(html.unescape(message.snippet))
+
+
+def decode_body(mime_type: str, body: Optional[dict]) -> Optional[str]:
+    """Returns the text of a text/plain or text/html body, up to MAX_PART_SIZE"""
+    data = (body or {}).get("data")
+    if not data or not mime_type.startswith("text/"):
+        return None
+
+    # base64 encodes every 3 bytes as 4 characters
+    text = urlsafe_b64decode(data[: MAX_PART_SIZE // 3 * 4]).decode(
+        "utf-8", errors="replace"
+    )
+    if mime_type == "text/html":
+        text = TAG_PATTERN.sub(" ", text)
+    return html.unescape(text)
+
+
+def iter_texts(message: Message) -> Iterator[str]:
+    """
+    Yields the text of the body of an email and then of its parts, depth
+    first in order, visiting at most MAX_PARTS
+    """
+    if (text := decode_body(message.mime_type, message.body)) is not None:
+        yield text
+
+    stack = list(reversed(message.child_parts))
+    visited = 1
+
+    while stack and visited < MAX_PARTS:
+        part = stack.pop()
+        visited += 1
+        text = decode_body(part.get("mimeType", "text/plain"), part.get("body"))
+        if text is not None:
+            yield text
+        stack.extend(reversed(part.get("parts") or ()))
+
+
+def extract_otp(message: Message) -> str:
+    """
+    Returns the OTP in an email from a trusted sender, looking at its
+    snippet before decoding any part
+    """
+    if settings.trusted_user_emails and not message.from_trusted_user:
+        raise RuntimeError(f"Email {message.message_id} isn't from a trusted user")
+
+    if otp := find_snippet_otp(message):
+        return otp
+
+    for text in iter_texts(message):
+        if otp := find_otp(text):
+            return otp
+
+    raise RuntimeError("Could not find OTP in message")
@@ -1,17 +1,40 @@
+from __future__ import annotations
+
 import argparse
+import asyncio
+import atexit
 import logging
-from base64 import urlsafe_b64encode
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-from email.message import EmailMessage
+from functools import partial
+from typing import TYPE_CHECKING, Literal, Optional
 
 from dateutil.relativedelta import relativedelta
-from google.cloud import storage  # type: ignore
 
-from dbs.browser.download import StatementDownloader, StatementRecord
-from dbs.browser.login import DbsAuthHandler
-from dbs.gmail import Gmail
+from dbs.digest import DigestEmail, write_message
+from dbs.gmail import Gmail, send_message_file
+from dbs.manifest import Manifest
+from dbs.metrics import metrics
+from dbs.pipeline import (
+    AsyncStatementPipeline,
+    EmailSink,
+    StatementPipeline,
+    StatementResult,
+    UploadSink,
+)
+from dbs.ratelimit import RateLimiter
 from dbs.settings import settings
 
+# heavy dependencies (Selenium, requests, Google Cloud clients) are imported
+# where they are used, so that e.g. --help starts quickly
+if TYPE_CHECKING:
+    from dbs.accounts import AccountProfile
+    from dbs.browser.session_cache import SessionCache, SessionCacheBackend
+    from dbs.export import StatementExporter
+    from dbs.parse import StatementParser
+    from dbs.storage import StorageBackend
+
 logger = logging.getLogger(__name__)
 
 
@@ -21,33 +44,357 @@ def main():
     web portal using Selenium, and downloads estatements
     """
     args: Arguments = parse_arguments()
+    enable_metrics(args)
     gmail_client = Gmail()
-    auth_handler = DbsAuthHandler(gmail_client)
-    driver = auth_handler.login()
-    cookies = driver.get_cookies()
-    downloader = StatementDownloader(cookies, auth_handler.user_agent)
-
-    statement_metadata = downloader.list_statements(**vars(args))
-
-    for metadata in statement_metadata:
-        record = StatementRecord(**metadata)
-        pdf_statement = downloader.download_statement(record)
-        pdf_filename = (
-            f"dbs-{record.statement_type.lower()}-{record.statement_date}.pdf"
+    # one storage client is shared by the uploads and the export
+    storage = get_storage(args) if args.upload else None
+
+    if args.accounts:
+        if args.use_async or args.login_worker:
+            raise RuntimeError(
+                "--accounts can't be used with --async or --login-worker"
+            )
+        # pylint: disable=import-outside-toplevel
+        from dbs.accounts import load_accounts
+
+        download_all_accounts(gmail_client, load_accounts(args.accounts), args, storage)
+        return
+
+    session_cache = get_session_cache(args.session_cache)
+    cookies = get_session_cookies(
+        gmail_client,
+        session_cache,
+        login_worker=args.login_worker,
+        lightweight_browser=args.lightweight_browser,
+    )
+    clean_inbox(gmail_client, args)
+    sinks = get_sinks(gmail_client, args, storage)
+
+    # pylint: disable=import-outside-toplevel
+    from dbs.browser.download import USER_AGENT, StatementDownloader
+
+    if args.use_async:
+        with metrics.timer("pipeline"):
+            results = asyncio.run(
+                download_statements_async(cookies, USER_AGENT, args, **sinks)
+            )
+    else:
+        downloader = StatementDownloader(
+            cookies,
+            USER_AGENT,
+            rate_limit=args.rate_limit,
+            pool_size=get_pool_size(args),
         )
+        pipeline = StatementPipeline(downloader, concurrency=args.concurrency, **sinks)
+        with metrics.timer("pipeline"):
+            results = pipeline.run(downloader.iter_statements(**vars(args)))
+        downloader.close()
+
+    finish(results, sinks, get_exporter(args, storage))
+
+
+def get_sinks(
+    gmail_client: Gmail, args: Arguments, storage: Optional[StorageBackend] = None
+) -> dict:
+    email: Optional[EmailSink] = None
+    if args.email and args.digest:
+        email = DigestEmail(gmail_client, settings.to_email, settings.from_email)
+    elif args.email:
+        email = partial(email_statement, gmail_client)
+
+    return {
+        "upload": storage.upload if storage else None,
+        "email": email,
+        "manifest": Manifest(args.manifest_path) if args.incremental else None,
+        "parser": get_parser(args) if args.parse else None,
+    }
+
+
+def get_parser(args: Arguments) -> StatementParser:
+    # pylint: disable=import-outside-toplevel
+    from dbs.parse import StatementParser
+
+    return StatementParser(output_path=args.transactions_path)
+
+
+def get_exporter(
+    args: Arguments, storage: Optional[StorageBackend] = None
+) -> Optional[StatementExporter]:
+    if not args.export:
+        return None
+
+    # pylint: disable=import-outside-toplevel
+    from dbs.export import StatementExporter
+
+    return StatementExporter(
+        args.export,
+        file_format=args.export_format,
+        storage=storage,
+        compact=args.export_compact,
+    )
+
+
+def finish(
+    results: list[StatementResult],
+    sinks: dict,
+    exporter: Optional[StatementExporter] = None,
+) -> None:
+    manifest: Optional[Manifest] = sinks["manifest"]
+    parser: Optional[StatementParser] = sinks["parser"]
+
+    # statements in a digest are only recorded as emailed once it is sent
+    if isinstance(digest := sinks["email"], DigestEmail):
+        queued = {entry.filename for entry in digest.entries}
+        failed_emails = set(digest.send())
+        for result in results:
+            if result.filename in failed_emails:
+                result.error = RuntimeError("Digest email was not sent")
+            elif result.filename in queued and manifest:
+                manifest.record_email(result.record)
+
+    if manifest:
+        manifest.close()
+
+    if parser:
+        parser.close()
+        parser.write(
+            transaction for result in results for transaction in result.transactions
+        )
+
+    if exporter:
+        for result in results:
+            exporter.add(result)
+        exporter.close()
+
+    if failed := [result.filename for result in results if not result.ok]:
+        raise RuntimeError(f"Failed to process statement(s): {', '.join(failed)}")
+
+
+def log_into_accounts(
+    accounts: list[AccountProfile], args: Arguments
+) -> tuple[dict[str, list[dict]], list[str]]:
+    """
+    Logs into every account with at most `args.login_concurrency` browsers
+    open at once, and returns the session cookies of each account that
+    logged in, and the names of those that didn't
+    """
+
+    def login(account: AccountProfile) -> list[dict]:
+        # each login watches the inbox with its own Gmail client, which only
+        # accepts OTP emails that mention the subject of its account
+        return get_session_cookies(
+            Gmail(otp_email_subject=account.otp_email_subject),
+            get_session_cache(args.session_cache, account.name),
+            lightweight_browser=args.lightweight_browser,
+            account=account,
+        )
+
+    # a failed login doesn't stop the accounts that did log in (and have
+    # used up their OTPs) from being downloaded
+    all_cookies: dict[str, list[dict]] = {}
+    failed = []
+    with ThreadPoolExecutor(
+        max_workers=args.login_concurrency, thread_name_prefix="login"
+    ) as executor:
+        futures = {executor.submit(login, account): account for account in accounts}
+        for future in as_completed(futures):
+            account = futures[future]
+            try:
+                all_cookies[account.name] = future.result()
+            except Exception as err:  # pylint: disable=broad-exception-caught
+                logger.error("Failed to log into account %s: %s", account.name, err)
+                failed.append(account.name)
+
+    return all_cookies, failed
+
+
+def download_all_accounts(
+    gmail_client: Gmail,
+    accounts: list[AccountProfile],
+    args: Arguments,
+    storage: Optional[StorageBackend] = None,
+) -> None:
+    """
+    Logs into every account, and then downloads the statements of the
+    accounts that logged in in a single pipeline, with each account's files
+    under its own prefix. Failed logins fail the run once that's done.
+    """
+    # pylint: disable=import-outside-toplevel
+    from dbs.accounts import MultiAccountDownloader
+    from dbs.browser.download import USER_AGENT, StatementDownloader
 
-        with open(pdf_filename, "wb") as pdf_file:
-            pdf_file.write(pdf_statement)
+    all_cookies, failed_logins = log_into_accounts(accounts, args)
+    if not all_cookies:
+        raise RuntimeError("Failed to log into any account")
 
-        if args.upload:
-            upload_to_cloud(source_filename=pdf_filename)
+    # only once all logins are done, so that no OTP email is cleaned up
+    # before it's read
+    for subject in dict.fromkeys(account.otp_email_subject for account in accounts):
+        clean_inbox(Gmail(otp_email_subject=subject), args)
 
-        if args.email:
-            send_email(
-                client=gmail_client,
-                subject=f"DBS eStatement - {pdf_filename.split('.')[0].upper()}",
-                attachment=pdf_filename,
+    # --rate-limit applies to the DBS host, whichever account a request is for
+    rate_limiter = RateLimiter(args.rate_limit)
+    downloader = MultiAccountDownloader(
+        {
+            account.name: StatementDownloader(
+                all_cookies[account.name],
+                USER_AGENT,
+                pool_size=get_pool_size(args),
+                rate_limiter=rate_limiter,
             )
+            for account in accounts
+            if account.name in all_cookies
+        }
+    )
+    sinks = get_sinks(gmail_client, args, storage)
+    pipeline = StatementPipeline(downloader, concurrency=args.concurrency, **sinks)
+    with metrics.timer("pipeline"):
+        results = pipeline.run(downloader.iter_statements(**vars(args)))
+    downloader.close()
+
+    finish(results, sinks, get_exporter(args, storage))
+
+    if failed_logins:
+        raise RuntimeError(f"Failed to log into account(s): {', '.join(failed_logins)}")
+
+
+def enable_metrics(args: Arguments) -> None:
+    """Collects metrics for this run if they are exported anywhere at exit"""
+    if args.metrics_json or args.metrics_prometheus or args.metrics_otlp is not None:
+        metrics.enable()
+        atexit.register(export_metrics, args)
+
+
+def export_metrics(args: Arguments) -> None:
+    # a failed export is logged rather than raised, as the run itself is done
+    try:
+        if args.metrics_json:
+            metrics.write_json(args.metrics_json)
+        if args.metrics_prometheus:
+            metrics.write_prometheus(args.metrics_prometheus)
+        if args.metrics_otlp is not None:
+            metrics.export_otlp(args.metrics_otlp or None)
+    except Exception as err:  # pylint: disable=broad-exception-caught
+        logger.error("Failed to export metrics: %s", err)
+
+
+def get_session_cache(
+    backend: Optional[str], account_name: Optional[str] = None
+) -> Optional[SessionCache]:
+    """
+    Returns the session cache of the default account, or of `account_name`,
+    whose session is stored separately by suffixing the path or secret ID
+    """
+    if not backend:
+        return None
+
+    suffix = f"-{account_name}" if account_name else ""
+
+    if not settings.session_cache_key:
+        raise RuntimeError("SESSION_CACHE_KEY must be set to use the session cache")
+
+    # pylint: disable=import-outside-toplevel
+    from dbs.browser.session_cache import (
+        FileSessionCacheBackend,
+        SecretManagerSessionCacheBackend,
+        SessionCache,
+    )
+
+    cache_backend: SessionCacheBackend
+    if backend == "secret":
+        if not settings.session_cache_secret_id:
+            raise RuntimeError(
+                "SESSION_CACHE_SECRET_ID must be set to use the secret session cache"
+            )
+        cache_backend = SecretManagerSessionCacheBackend(
+            settings.project_id, settings.session_cache_secret_id + suffix
+        )
+    else:
+        cache_backend = FileSessionCacheBackend(settings.session_cache_path + suffix)
+
+    return SessionCache(cache_backend, settings.session_cache_key)
+
+
+def get_session_cookies(
+    gmail_client: Gmail,
+    session_cache: Optional[SessionCache] = None,
+    login_worker: bool = False,
+    lightweight_browser: bool = False,
+    account: Optional[AccountProfile] = None,
+) -> list[dict]:
+    """
+    Returns cached session cookies if they are still valid,
+    and otherwise logs in with Selenium (or a running login worker)
+    to get new ones
+    """
+    # pylint: disable=import-outside-toplevel
+    from dbs.browser.download import USER_AGENT, StatementDownloader
+
+    if session_cache and (cookies := session_cache.load()):
+        downloader = StatementDownloader(cookies, USER_AGENT)
+        is_valid = downloader.is_session_valid()
+        downloader.close()
+
+        if is_valid:
+            logger.info("Reusing cached session")
+            metrics.increment("session_cache", result="hit")
+            return cookies
+        logger.info("Cached session has expired, logging in again")
+        metrics.increment("session_cache", result="expired")
+
+    if login_worker:
+        from dbs.browser.worker import request_login
+
+        with metrics.timer("login", source="worker"):
+            cookies = request_login()
+    else:
+        from dbs.browser.login import DbsAuthHandler
+
+        with metrics.timer("login", source="browser"):
+            auth_handler = DbsAuthHandler(gmail_client, lightweight_browser)
+            if account:
+                logger.info("Logging into account '%s'", account.name)
+                driver = auth_handler.login(account.dbs_user_id, account.dbs_pin)
+            else:
+                driver = auth_handler.login()
+            cookies = driver.get_cookies()
+            auth_handler.quit()
+
+    if session_cache:
+        session_cache.save(cookies)
+
+    return cookies
+
+
+# pylint: disable=too-many-arguments
+async def download_statements_async(
+    cookies: list[dict],
+    user_agent: str,
+    args: Arguments,
+    *,
+    upload: Optional[UploadSink] = None,
+    email: Optional[EmailSink] = None,
+    manifest: Optional[Manifest] = None,
+    parser: Optional[StatementParser] = None,
+) -> list[StatementResult]:
+    # pylint: disable=import-outside-toplevel
+    from dbs.browser.async_download import AsyncStatementDownloader
+
+    async with AsyncStatementDownloader(
+        cookies,
+        user_agent,
+        rate_limit=args.rate_limit,
+        pool_size=get_pool_size(args),
+    ) as downloader:
+        pipeline = AsyncStatementPipeline(
+            downloader,
+            concurrency=args.concurrency,
+            upload=upload,
+            email=email,
+            manifest=manifest,
+            parser=parser,
+        )
+        return await pipeline.run(downloader.iter_statements(**vars(args)))
 
 
 def parse_arguments() -> argparse.Namespace:
@@ -83,18 +430,176 @@ def parse_arguments() -> argparse.Namespace:
         "--page-size", type=int, default=10, help="Number of statements per page"
     )
     parser.add_argument(
-        "--page-number", type=int, default=1, help="Page number for statement retrieval"
+        "--page-number",
+        type=int,
+        default=1,
+        help="Page number to start statement retrieval from",
+    )
+    parser.add_argument(
+        "--max-pages",
+        type=int,
+        default=None,
+        help="Maximum number of pages to retrieve (defaults to all pages)",
     )
     parser.add_argument(
         "--upload",
         action="store_true",
         help="Flag that determines whether to upload to a cloud bucket",
     )
+    parser.add_argument(
+        "--storage",
+        choices=["gcs", "local"],
+        default="gcs",
+        help="Upload to the GCS bucket, or to a local directory with --upload",
+    )
+    parser.add_argument(
+        "--storage-path",
+        type=str,
+        default="uploads",
+        help="Directory that statements are uploaded to with --storage local",
+    )
     parser.add_argument(
         "--email",
         action="store_true",
         help="Flag that determines whether to send statement(s) to an email",
     )
+    parser.add_argument(
+        "--digest",
+        action="store_true",
+        help="Send all statements in as few emails as possible with --email",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=1,
+        help="Number of statements to download and process in parallel",
+    )
+    parser.add_argument(
+        "--listing-workers",
+        dest="workers",
+        type=int,
+        default=4,
+        help="Number of statement list pages to fetch ahead in parallel",
+    )
+    parser.add_argument(
+        "--rate-limit",
+        type=float,
+        default=None,
+        help="Maximum number of requests per second made to the DBS API",
+    )
+    parser.add_argument(
+        "--async",
+        dest="use_async",
+        action="store_true",
+        help="Download statements with asyncio instead of a thread pool",
+    )
+    parser.add_argument(
+        "--session-cache",
+        choices=["file", "secret"],
+        default=None,
+        help="Reuse a cached login session from a local file or Secret Manager",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only download, upload and email statements that are new or changed",
+    )
+    parser.add_argument(
+        "--manifest-path",
+        type=str,
+        default=".dbs-manifest.sqlite3",
+        help="Path to the manifest of synced statements used by --incremental",
+    )
+    parser.add_argument(
+        "--parse",
+        action="store_true",
+        help="Extract the transactions of each statement (requires the parse extra)",
+    )
+    parser.add_argument(
+        "--transactions-path",
+        type=str,
+        default="transactions.jsonl",
+        help="Path to write the transactions extracted by --parse to, as JSON lines",
+    )
+    parser.add_argument(
+        "--export",
+        type=str,
+        default=None,
+        metavar="PATH",
+        help=(
+            "Append statement metadata and transactions to datasets in this "
+            "directory (requires the export extra), which are uploaded with --upload"
+        ),
+    )
+    parser.add_argument(
+        "--export-format",
+        type=str,
+        choices=["parquet", "arrow"],
+        default="parquet",
+        help="File format of the datasets written by --export",
+    )
+    parser.add_argument(
+        "--export-compact",
+        action="store_true",
+        help="Merge the files of each statement month into one after exporting",
+    )
+    parser.add_argument(
+        "--login-worker",
+        action="store_true",
+        help="Log in through a running login worker (python -m dbs.browser.worker)",
+    )
+    parser.add_argument(
+        "--lightweight-browser",
+        action="store_true",
+        help="Block images, fonts, analytics and hosts outside the allowlist",
+    )
+    parser.add_argument(
+        "--accounts",
+        type=str,
+        default=None,
+        help="Path to a JSON file of account profiles to download statements for",
+    )
+    parser.add_argument(
+        "--login-concurrency",
+        type=int,
+        default=2,
+        help="Maximum number of accounts to log into at once with --accounts",
+    )
+    parser.add_argument(
+        "--clean-inbox",
+        choices=["read", "archive", "trash"],
+        default=None,
+        help="After logging in, mark old OTP emails as read, archive or trash them",
+    )
+    parser.add_argument(
+        "--clean-inbox-older-than",
+        type=str,
+        default="1d",
+        help="Only clean OTP emails older than this with --clean-inbox, e.g. 2d",
+    )
+    parser.add_argument(
+        "--metrics-json",
+        type=str,
+        default=None,
+        help="Write a JSON summary of stage timings and counters to this path",
+    )
+    parser.add_argument(
+        "--metrics-prometheus",
+        type=str,
+        default=None,
+        help="Write stage timings and counters in Prometheus text format to this path",
+    )
+    parser.add_argument(
+        "--metrics-otlp",
+        type=str,
+        nargs="?",
+        const="",
+        default=None,
+        help=(
+            "Export stage timings and counters to an OTLP/HTTP collector, "
+            "which defaults to OTEL_EXPORTER_OTLP_ENDPOINT"
+        ),
+    )
     return parser.parse_args()
 
 
@@ -106,52 +611,97 @@ class Arguments(argparse.Namespace):
     sort_order: str
     page_size: int
     page_number: int
+    max_pages: int | None
     upload: bool
+    storage: str
+    storage_path: str
     email: bool
+    digest: bool
+    concurrency: int
+    workers: int
+    rate_limit: float | None
+    use_async: bool
+    session_cache: str | None
+    incremental: bool
+    manifest_path: str
+    parse: bool
+    transactions_path: str
+    export: str | None
+    export_format: Literal["parquet", "arrow"]
+    export_compact: bool
+    login_worker: bool
+    lightweight_browser: bool
+    accounts: str | None
+    login_concurrency: int
+    clean_inbox: Literal["read", "archive", "trash"] | None
+    clean_inbox_older_than: str
+    metrics_json: str | None
+    metrics_prometheus: str | None
+    metrics_otlp: str | None
 
 
-def upload_to_cloud(
-    source_filename: str,
-    bucket_name: str = settings.bucket_name,
-    bucket_prefix: str = "dbs",
-) -> None:
-    client = storage.Client()
-    bucket = client.get_bucket(bucket_name)
-    blob_name = f"{bucket_prefix}/{source_filename}"
-    blob = bucket.blob(blob_name)
-    logger.info("Attempting to upload to 'gs://%s/%s'", bucket_name, bucket_name)
-    blob.upload_from_filename(source_filename)
-    logger.info("Uploaded to %s", blob_name)
+def get_pool_size(args: Arguments) -> int:
+    """
+    Returns the number of connections to keep open to the DBS API, one for
+    each statement download and each listing page fetched ahead
+    """
+    return args.concurrency + args.workers
+
+
+def clean_inbox(gmail_client: Gmail, args: Arguments) -> None:
+    """Cleans up old OTP emails with --clean-inbox, without failing the run"""
+    if not args.clean_inbox:
+        return
+
+    # pylint: disable=import-outside-toplevel
+    from dbs.gmail.maintenance import InboxCleaner
+
+    try:
+        InboxCleaner(gmail_client, rate_limit=2).clean(
+            args.clean_inbox, args.clean_inbox_older_than
+        )
+    except Exception as err:  # pylint: disable=broad-exception-caught
+        logger.warning("Could not clean up OTP emails: %s", err)
+
+
+def get_storage(args: Arguments) -> StorageBackend:
+    # pylint: disable=import-outside-toplevel
+    from dbs.storage import GcsStorageBackend, LocalStorageBackend
+
+    if args.storage == "local":
+        return LocalStorageBackend(args.storage_path)
+
+    return GcsStorageBackend(settings.bucket_name)
+
+
+def email_statement(client: Gmail, pdf_filename: str) -> None:
+    send_email(
+        client=client,
+        subject=f"DBS eStatement - {pdf_filename.split('.')[0].upper()}",
+        attachment=pdf_filename,
+    )
 
 
 def send_email(
     client: Gmail,
     subject: str,
     attachment: str,
-    to_address: str = settings.to_email,
-    from_address: str = settings.from_email,
+    to_address: Optional[str] = None,
+    from_address: Optional[str] = None,
 ):
-    message = EmailMessage()
-    with open(attachment, "rb") as content_file:
-        content = content_file.read()
-        message.add_attachment(
-            content, maintype="application", subtype="pdf", filename=attachment
-        )
-        message["To"] = to_address
-        message["From"] = from_address
-        message["Subject"] = subject
-        encoded_message = urlsafe_b64encode(message.as_bytes()).decode()
-
-        create_message = {"raw": encoded_message}
-
-        # send email
-        (
-            client.gmail_service.users()
-            .messages()
-            .send(userId="me", body=create_message)  # type: ignore
-            .execute()
-        )
-        logger.info("Email sent: %s", message.__dict__)
+    headers = {
+        "To": to_address or settings.to_email,
+        "From": from_address or settings.from_email,
+        "Subject": subject,
+    }
+
+    # the MIME message is written to disk a few lines of the attachment at
+    # a time, and uploaded from there, so the PDF is never held in memory
+    with tempfile.NamedTemporaryFile(suffix=".eml") as message_file:
+        write_message(message_file, headers, [attachment])
+        message_file.flush()
+        send_message_file(client.gmail_service, message_file.name)
+    logger.info("Email sent: %s", subject)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import logging
+import sqlite3
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    from dbs.browser.download import StatementRecord
+
+logger = logging.getLogger(__name__)
+
+
+# pylint: disable=too-many-instance-attributes
+@dataclass
+class ManifestEntry:
+    statement_hash_key: str
+    product_reference_no: str
+    statement_date: str
+    statement_type: str
+    content_hash: str
+    size: int
+    local_path: str
+    gcs_generation: Optional[int]
+    emailed: bool
+    updated_at: str
+
+
+class Manifest:
+    """
+    SQLite index of statements that have already been downloaded,
+    keyed by statement hash key and product reference number
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+
+        with self._lock, self.connection:
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS statements (
+                    statement_hash_key TEXT NOT NULL,
+                    product_reference_no TEXT NOT NULL,
+                    statement_date TEXT NOT NULL,
+                    statement_type TEXT NOT NULL,
+                    content_hash TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    local_path TEXT NOT NULL,
+                    gcs_generation INTEGER,
+                    emailed INTEGER NOT NULL DEFAULT 0,
+                    updated_at TEXT NOT NULL,
+                    PRIMARY KEY (statement_hash_key, product_reference_no)
+                )
+                """
+            )
+
+    @staticmethod
+    def now() -> str:
+        return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+    def get(self, record: StatementRecord) -> Optional[ManifestEntry]:
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT * FROM statements "
+                "WHERE statement_hash_key = ? AND product_reference_no = ?",
+                (record.statement_hash_key, record.product_reference_no),
+            ).fetchone()
+
+        if not row:
+            return None
+
+        entry = ManifestEntry(*row)
+        entry.emailed = bool(entry.emailed)
+        return entry
+
+    def record_download(
+        self, record: StatementRecord, local_path: str, content_hash: str, size: int
+    ) -> None:
+        """
+        Records a downloaded statement. If the content has changed since
+        the last download, the upload and email status is reset.
+        """
+        with self._lock, self.connection:
+            self.connection.execute(
+                """
+                INSERT INTO statements VALUES (?, ?, ?, ?, ?, ?, ?, NULL, 0, ?)
+                ON CONFLICT (statement_hash_key, product_reference_no) DO UPDATE SET
+                    gcs_generation = CASE WHEN content_hash = excluded.content_hash
+                        THEN gcs_generation END,
+                    emailed = CASE WHEN content_hash = excluded.content_hash
+                        THEN emailed ELSE 0 END,
+                    content_hash = excluded.content_hash,
+                    size = excluded.size,
+                    local_path = excluded.local_path,
+                    updated_at = excluded.updated_at
+                """,
+                (
+                    record.statement_hash_key,
+                    record.product_reference_no,
+                    record.statement_date,
+                    record.statement_type,
+                    content_hash,
+                    size,
+                    local_path,
+                    self.now(),
+                ),
+            )
+
+    def record_upload(self, record: StatementRecord, generation: int) -> None:
+        self._update(record, "gcs_generation", generation)
+
+    def record_email(self, record: StatementRecord) -> None:
+        self._update(record, "emailed", 1)
+
+    def _update(self, record: StatementRecord, column: str, value: int) -> None:
+        with self._lock, self.connection:
+            self.connection.execute(
+                f"UPDATE statements SET {column} = ?, updated_at = ? "
+                "WHERE statement_hash_key = ? AND product_reference_no = ?",
+                (
+                    value,
+                    self.now(),
+                    record.statement_hash_key,
+                    record.product_reference_no,
+                ),
+            )
+
+    def close(self) -> None:
+        self.connection.close()
@@ -0,0 +1,210 @@
+"""
+Timers and counters for each stage of a run, which can be exported as
+Prometheus text, a JSON summary or to an OpenTelemetry (OTLP) collector.
+
+Metrics are disabled by default, in which case timers are a shared no-op
+context manager and counters return immediately.
+"""
+
+import json
+import logging
+import statistics
+import threading
+import time
+from contextlib import AbstractContextManager, nullcontext
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+Labels = tuple[tuple[str, str], ...]
+
+NULL_TIMER: AbstractContextManager = nullcontext()
+
+
+class Timer(AbstractContextManager):
+    def __init__(self, collector: "Metrics", name: str, labels: Labels):
+        self.collector = collector
+        self.name = name
+        self.labels = labels
+        self.start = 0.0
+
+    def __enter__(self) -> "Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.collector.record(self.name, time.perf_counter() - self.start, self.labels)
+
+
+class Metrics:
+    def __init__(self, prefix: str = "dbs"):
+        self.prefix = prefix
+        self.enabled = False
+        self.counters: dict[tuple[str, Labels], float] = {}
+        self.timings: dict[tuple[str, Labels], list[float]] = {}
+        self._lock = threading.Lock()
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def increment(self, name: str, value: float = 1, **labels: str) -> None:
+        if not self.enabled:
+            return
+
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def timer(self, name: str, **labels: str) -> AbstractContextManager:
+        """Times the duration of a `with` block in seconds"""
+        if not self.enabled:
+            return NULL_TIMER
+        return Timer(self, name, tuple(sorted(labels.items())))
+
+    def observe(self, name: str, seconds: float, **labels: str) -> None:
+        if self.enabled:
+            self.record(name, seconds, tuple(sorted(labels.items())))
+
+    def record(self, name: str, seconds: float, labels: Labels) -> None:
+        with self._lock:
+            self.timings.setdefault((name, labels), []).append(seconds)
+
+    def summary(self) -> dict:
+        """Returns the totals of each counter, and the distribution of each timer"""
+        with self._lock:
+            counters = dict(self.counters)
+            timings = {key: sorted(values) for key, values in self.timings.items()}
+
+        return {
+            "counters": [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(counters.items())
+            ],
+            "timers": [
+                {
+                    "name": name,
+                    "labels": dict(labels),
+                    "count": len(values),
+                    "sum": sum(values),
+                    "p50": get_quantile(values, 0.5),
+                    "p95": get_quantile(values, 0.95),
+                    "max": values[-1],
+                }
+                for (name, labels), values in sorted(timings.items())
+            ],
+        }
+
+    def to_prometheus(self) -> str:
+        """Renders counters and timers (as summaries) in Prometheus text format"""
+        lines = []
+        summary = self.summary()
+        counter_names = sorted({counter["name"] for counter in summary["counters"]})
+        timer_names = sorted({timer["name"] for timer in summary["timers"]})
+
+        for name in counter_names:
+            metric = f"{self.prefix}_{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines += [
+                f"{metric}{format_labels(counter['labels'])} {counter['value']}"
+                for counter in summary["counters"]
+                if counter["name"] == name
+            ]
+
+        for name in timer_names:
+            metric = f"{self.prefix}_{name}_seconds"
+            lines.append(f"# TYPE {metric} summary")
+            for timer in summary["timers"]:
+                if timer["name"] != name:
+                    continue
+                for quantile in ("0.5", "0.95"):
+                    labels = format_labels({**timer["labels"], "quantile": quantile})
+                    value = timer["p50"] if quantile == "0.5" else timer["p95"]
+                    lines.append(f"{metric}{labels} {value}")
+                labels = format_labels(timer["labels"])
+                lines.append(f"{metric}_sum{labels} {timer['sum']}")
+                lines.append(f"{metric}_count{labels} {timer['count']}")
+
+        return "\n".join(lines) + "\n"
+
+    def write_json(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.summary(), file, indent=2)
+        logger.info("Metrics summary written to %s", path)
+
+    def write_prometheus(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(self.to_prometheus())
+        logger.info("Prometheus metrics written to %s", path)
+
+    def export_otlp(self, endpoint: Optional[str] = None) -> None:
+        """
+        Sends all counters and timers to an OTLP/HTTP collector, which
+        defaults to OTEL_EXPORTER_OTLP_ENDPOINT
+        """
+        # pylint: disable=import-outside-toplevel
+        try:
+            from opentelemetry.exporter.otlp.proto.http.metric_exporter import (
+                OTLPMetricExporter,
+            )
+            from opentelemetry.sdk.metrics import MeterProvider
+            from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
+        except ImportError as err:
+            raise ImportError(
+                "OTLP export requires opentelemetry, "
+                "install it with `poetry install --extras otlp`"
+            ) from err
+
+        exporter = OTLPMetricExporter(
+            endpoint=f"{endpoint}/v1/metrics" if endpoint else None
+        )
+        provider = MeterProvider(
+            metric_readers=[PeriodicExportingMetricReader(exporter)]
+        )
+        self.record_otlp(provider.get_meter("dbs"))
+
+        # shutting down flushes all recorded values to the collector
+        provider.shutdown()
+        logger.info("Metrics exported to OTLP collector")
+
+    def record_otlp(self, meter: Any) -> None:
+        """Records every counter and timing with an OpenTelemetry meter"""
+        with self._lock:
+            counters = dict(self.counters)
+            timings = {key: list(values) for key, values in self.timings.items()}
+
+        instruments: dict[str, Any] = {}
+        for (name, labels), value in counters.items():
+            if name not in instruments:
+                instruments[name] = meter.create_counter(f"{self.prefix}.{name}")
+            instruments[name].add(value, dict(labels))
+
+        for (name, labels), values in timings.items():
+            key = f"{name}_seconds"
+            if key not in instruments:
+                instruments[key] = meter.create_histogram(
+                    f"{self.prefix}.{name}", unit="s"
+                )
+            for value in values:
+                instruments[key].record(value, dict(labels))
+
+
+def get_quantile(values: list[float], quantile: float) -> float:
+    if len(values) == 1:
+        return values[0]
+    # the 'inclusive' method keeps quantiles within the observed range
+    cut_points = statistics.quantiles(values, n=100, method="inclusive")
+    return cut_points[round(quantile * 100) - 1]
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    pairs = (f'{key}="{escape_label(str(value))}"' for key, value in labels.items())
+    return "{" + ",".join(pairs) + "}"
+
+
+metrics = Metrics()
@@ -0,0 +1,222 @@
+"""
+Extracts transactions from downloaded statement PDFs in a pool of worker
+processes, as text extraction is CPU-bound.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import multiprocessing
+import os
+import re
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import TYPE_CHECKING, Iterable, Optional
+
+try:
+    from pypdf import PdfReader
+except ImportError as err:  # pragma: no cover
+    raise ImportError(
+        "pypdf is required to parse statements, "
+        "install it with `poetry install --extras parse`"
+    ) from err
+
+from dbs.files import AtomicFileWriter, DownloadedFile
+from dbs.metrics import metrics
+
+if TYPE_CHECKING:
+    from dbs.browser.download import StatementRecord
+
+logger = logging.getLogger(__name__)
+
+MONTHS = "JAN FEB MAR APR MAY JUN JUL AUG SEP OCT NOV DEC".split()
+
+# e.g. "01 Nov Interest Earned 0.52 1,234.56" or "01/11/2023 Salary 10.00 1,244.56"
+TRANSACTION_PATTERN = re.compile(
+    r"^(?P<day>\d{2})[ /](?P<month>[A-Za-z]{3}|\d{2})(?:[ /](?P<year>\d{4}))?\s+"
+    r"(?P<description>.+?)\s+(?P<amount>[\d,]+\.\d{2})\s+(?P<balance>[\d,]+\.\d{2})"
+    r"(?:\s*(?P<suffix>CR|DR))?$"
+)
+BALANCE_PATTERN = re.compile(
+    r"balance (?:brought|carried) forward\s+(?P<balance>[\d,]+\.\d{2})", re.IGNORECASE
+)
+
+
+@dataclass
+class Transaction:
+    account_number: str
+    statement_date: str
+    transaction_date: str
+    description: str
+    # withdrawals are negative, as far as can be told from the running balance
+    amount: Decimal
+    balance: Decimal
+
+    def to_dict(self) -> dict:
+        return {
+            "account_number": self.account_number,
+            "statement_date": self.statement_date,
+            "transaction_date": self.transaction_date,
+            "description": self.description,
+            "amount": str(self.amount),
+            "balance": str(self.balance),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> Transaction:
+        return cls(
+            **{
+                **data,
+                "amount": Decimal(data["amount"]),
+                "balance": Decimal(data["balance"]),
+            }
+        )
+
+
+def to_decimal(value: str) -> Decimal:
+    return Decimal(value.replace(",", ""))
+
+
+def get_transaction_date(match: re.Match, statement_date: str) -> str:
+    """Returns the ISO date of a transaction, in the year of its statement"""
+    statement_year, statement_month = map(int, statement_date.split("-")[:2])
+    month = match["month"]
+    month_number = int(month) if month.isdigit() else MONTHS.index(month.upper()) + 1
+
+    if match["year"]:
+        year = int(match["year"])
+    else:
+        # statements that span new year list December transactions in January
+        year = statement_year - 1 if month_number > statement_month else statement_year
+    return f"{year:04}-{month_number:02}-{match['day']}"
+
+
+def parse_text(
+    text: str, account_number: str, statement_date: str
+) -> list[Transaction]:
+    """
+    Returns the transactions in the text of a statement, which are lines
+    that start with a date and end with an amount and the running balance
+    """
+    transactions = []
+    balance: Optional[Decimal] = None
+
+    for line in text.splitlines():
+        line = " ".join(line.split())
+
+        if match := BALANCE_PATTERN.search(line):
+            balance = to_decimal(match["balance"])
+            continue
+
+        if not (match := TRANSACTION_PATTERN.match(line)):
+            continue
+
+        amount = to_decimal(match["amount"])
+        new_balance = to_decimal(match["balance"])
+        if match["suffix"] == "DR" or (
+            balance is not None and balance - amount == new_balance
+        ):
+            amount = -amount
+
+        transactions.append(
+            Transaction(
+                account_number=account_number,
+                statement_date=statement_date,
+                transaction_date=get_transaction_date(match, statement_date),
+                description=match["description"],
+                amount=amount,
+                balance=new_balance,
+            )
+        )
+        balance = new_balance
+
+    return transactions
+
+
+def parse_pdf(path: str, account_number: str, statement_date: str) -> list[Transaction]:
+    """Extracts the text of every page of a PDF, and parses its transactions"""
+    reader = PdfReader(path)
+    text = "\n".join(page.extract_text() for page in reader.pages)
+    return parse_text(text, account_number, statement_date)
+
+
+class StatementParser:
+    """
+    Parses statements in worker processes while the pipeline carries on
+    with uploads and emails.
+
+    The transactions of each PDF are cached under `cache_dir` by the
+    SHA-256 of its content, so an unchanged statement is never parsed twice.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = ".dbs-transactions",
+        output_path: str = "transactions.jsonl",
+        max_workers: Optional[int] = None,
+    ):
+        self.cache_dir = cache_dir
+        self.output_path = output_path
+        os.makedirs(cache_dir, exist_ok=True)
+        # workers are spawned rather than forked from a process with
+        # running threads, and only import this module and pypdf
+        self.executor = ProcessPoolExecutor(
+            max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+        )
+
+    def get_cache_path(self, content_hash: str) -> str:
+        return os.path.join(self.cache_dir, f"{content_hash}.json")
+
+    def is_cached(self, content_hash: str) -> bool:
+        return os.path.exists(self.get_cache_path(content_hash))
+
+    def load(self, content_hash: str) -> Optional[list[Transaction]]:
+        try:
+            with open(self.get_cache_path(content_hash), encoding="utf-8") as file:
+                return [Transaction.from_dict(data) for data in json.load(file)]
+        except FileNotFoundError:
+            return None
+
+    def save(self, content_hash: str, transactions: list[Transaction]) -> None:
+        data = json.dumps([transaction.to_dict() for transaction in transactions])
+        with AtomicFileWriter(self.get_cache_path(content_hash)) as writer:
+            writer.write(data.encode())
+
+    def submit(
+        self, record: StatementRecord, pdf_file: DownloadedFile
+    ) -> Future[list[Transaction]]:
+        """Starts parsing a statement, unless its content was parsed before"""
+        if (transactions := self.load(pdf_file.sha256)) is not None:
+            metrics.increment("parse_cache", result="hit")
+            future: Future[list[Transaction]] = Future()
+            future.set_result(transactions)
+            return future
+
+        metrics.increment("parse_cache", result="miss")
+        future = self.executor.submit(
+            parse_pdf,
+            pdf_file.path,
+            record.formatted_account_number,
+            record.statement_date,
+        )
+
+        def on_parsed(parsed: Future[list[Transaction]]) -> None:
+            if not parsed.cancelled() and parsed.exception() is None:
+                self.save(pdf_file.sha256, parsed.result())
+
+        future.add_done_callback(on_parsed)
+        return future
+
+    def write(self, transactions: Iterable[Transaction]) -> None:
+        """Writes transactions to `output_path` as JSON lines"""
+        count = 0
+        with AtomicFileWriter(self.output_path) as writer:
+            for transaction in transactions:
+                writer.write(json.dumps(transaction.to_dict()).encode() + b"\n")
+                count += 1
+        logger.info("%s transaction(s) written to %s", count, self.output_path)
+
+    def close(self) -> None:
+        self.executor.shutdown()
@@ -0,0 +1,351 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, AsyncIterable, Callable, Iterable, Optional
+
+from dbs.digest import DigestEmail
+from dbs.files import DownloadedFile
+from dbs.metrics import metrics
+
+if TYPE_CHECKING:
+    from dbs.accounts import MultiAccountDownloader
+    from dbs.browser.async_download import AsyncStatementDownloader
+    from dbs.browser.download import StatementDownloader, StatementRecord
+    from dbs.manifest import Manifest
+    from dbs.parse import StatementParser, Transaction
+
+logger = logging.getLogger(__name__)
+
+
+# upload sinks return the GCS generation of the uploaded object, if there is one
+UploadSink = Callable[[str], Optional[int]]
+EmailSink = Callable[[str], None]
+
+
+@dataclass
+class StatementResult:
+    record: StatementRecord
+    filename: str
+    error: Optional[Exception] = None
+    skipped: bool = False
+    transactions: list[Transaction] = field(default_factory=list)
+    pdf_file: Optional[DownloadedFile] = None
+    download_seconds: Optional[float] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    @property
+    def status(self) -> str:
+        if self.error is not None:
+            return "failed"
+        return "skipped" if self.skipped else "ok"
+
+
+class BaseStatementPipeline:
+    """
+    Sink and manifest handling shared by the thread pool and asyncio pipelines.
+
+    With a manifest, statements that were already downloaded, uploaded and
+    emailed are skipped, and a re-downloaded statement is only uploaded or
+    emailed again if its content has changed.
+
+    With a parser, the transactions of each statement are extracted in
+    worker processes, while its upload and email are under way.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        concurrency: int = 1,
+        upload: Optional[UploadSink] = None,
+        email: Optional[EmailSink] = None,
+        manifest: Optional[Manifest] = None,
+        parser: Optional[StatementParser] = None,
+    ):
+        if concurrency < 1:
+            raise ValueError(f"Concurrency must be at least 1, got {concurrency}")
+
+        self.concurrency = concurrency
+        self.upload = upload
+        self.email = email
+        self.manifest = manifest
+        self.parser = parser
+
+    @staticmethod
+    def get_filename(record: StatementRecord) -> str:
+        filename = f"dbs-{record.statement_type.lower()}-{record.statement_date}.pdf"
+        # statements of each account are kept under their own prefix
+        return os.path.join(record.account, filename) if record.account else filename
+
+    def is_synced(self, record: StatementRecord) -> bool:
+        if not self.manifest or not (entry := self.manifest.get(record)):
+            return False
+
+        return (
+            (not self.upload or entry.gcs_generation is not None)
+            and (not self.email or entry.emailed)
+            and (not self.parser or self.parser.is_cached(entry.content_hash))
+        )
+
+    def skip(self, record: StatementRecord, pdf_filename: str) -> StatementResult:
+        logger.info("Skipping %s, already synced", pdf_filename)
+        transactions = None
+        if self.parser and self.manifest and (entry := self.manifest.get(record)):
+            transactions = self.parser.load(entry.content_hash)
+        return StatementResult(
+            record, pdf_filename, skipped=True, transactions=transactions or []
+        )
+
+    def save(
+        self, record: StatementRecord, pdf_file: DownloadedFile
+    ) -> tuple[bool, bool]:
+        """
+        Records a downloaded statement, and returns whether it still
+        needs to be uploaded and emailed
+        """
+        if not self.manifest:
+            return bool(self.upload), bool(self.email)
+
+        self.manifest.record_download(
+            record, pdf_file.path, pdf_file.sha256, pdf_file.size
+        )
+        if not (entry := self.manifest.get(record)):
+            raise RuntimeError(f"{pdf_file.path} is missing from the manifest")
+
+        return (
+            bool(self.upload) and entry.gcs_generation is None,
+            bool(self.email) and not entry.emailed,
+        )
+
+    def record_upload(self, record: StatementRecord, generation: Optional[int]):
+        if self.manifest:
+            self.manifest.record_upload(record, generation or 0)
+
+    def record_email(self, record: StatementRecord):
+        # a digest has only queued the statement, which is recorded as
+        # emailed once the digest is sent
+        if self.manifest and not isinstance(self.email, DigestEmail):
+            self.manifest.record_email(record)
+
+
+class StatementPipeline(BaseStatementPipeline):
+    """
+    Downloads statements and passes each written PDF through the
+    optional upload and email sinks.
+
+    Every worker runs the full download -> write -> upload -> email chain
+    for a single statement, so with more than one worker the stages
+    overlap across statements.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        downloader: StatementDownloader | MultiAccountDownloader,
+        *,
+        concurrency: int = 1,
+        upload: Optional[UploadSink] = None,
+        email: Optional[EmailSink] = None,
+        manifest: Optional[Manifest] = None,
+        parser: Optional[StatementParser] = None,
+    ):
+        super().__init__(
+            concurrency, upload=upload, email=email, manifest=manifest, parser=parser
+        )
+        self.downloader = downloader
+        # the Gmail client is backed by httplib2, which is not thread-safe
+        self._email_lock = threading.Lock()
+
+    def process(self, record: StatementRecord) -> StatementResult:
+        with metrics.timer("statement"):
+            result = self.process_statement(record)
+        metrics.increment("statements", status=result.status)
+        return result
+
+    def process_statement(self, record: StatementRecord) -> StatementResult:
+        pdf_filename = self.get_filename(record)
+        transactions: list[Transaction] = []
+
+        if self.is_synced(record):
+            return self.skip(record, pdf_filename)
+
+        try:
+            start = time.perf_counter()
+            with metrics.timer("stage", stage="download"):
+                pdf_file = self.downloader.download_statement_to_file(
+                    record, pdf_filename
+                )
+            download_seconds = time.perf_counter() - start
+            parsed = self.parser.submit(record, pdf_file) if self.parser else None
+            upload, email = self.save(record, pdf_file)
+
+            if upload and self.upload:
+                with metrics.timer("stage", stage="upload"):
+                    generation = self.upload(pdf_filename)
+                self.record_upload(record, generation)
+
+            if email and self.email:
+                with self._email_lock, metrics.timer("stage", stage="email"):
+                    self.email(pdf_filename)
+                self.record_email(record)
+
+            if parsed:
+                with metrics.timer("stage", stage="parse"):
+                    transactions = parsed.result()
+
+        except Exception as err:  # pylint: disable=broad-exception-caught
+            logger.error("Failed to process %s: %s", pdf_filename, err)
+            return StatementResult(record, pdf_filename, error=err)
+
+        return StatementResult(
+            record,
+            pdf_filename,
+            transactions=transactions,
+            pdf_file=pdf_file,
+            download_seconds=download_seconds,
+        )
+
+    def run(self, records: Iterable[StatementRecord]) -> list[StatementResult]:
+        """
+        Processes all records, returning results in the same order
+        as the records were given
+        """
+        if self.concurrency == 1:
+            results = [self.process(record) for record in records]
+        else:
+            with ThreadPoolExecutor(
+                max_workers=self.concurrency, thread_name_prefix="statement"
+            ) as executor:
+                futures = [executor.submit(self.process, record) for record in records]
+                results = [future.result() for future in futures]
+
+        log_summary(results)
+        return results
+
+
+class AsyncStatementPipeline(BaseStatementPipeline):
+    """
+    Asyncio version of StatementPipeline, which fans out over statements
+    with at most `concurrency` in flight at once.
+
+    The upload and email sinks wrap blocking Google clients, so they are
+    awaited in the same event loop but run on the default executor.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        downloader: AsyncStatementDownloader,
+        *,
+        concurrency: int = 1,
+        upload: Optional[UploadSink] = None,
+        email: Optional[EmailSink] = None,
+        manifest: Optional[Manifest] = None,
+        parser: Optional[StatementParser] = None,
+    ):
+        super().__init__(
+            concurrency, upload=upload, email=email, manifest=manifest, parser=parser
+        )
+        self.downloader = downloader
+        self._email_lock = asyncio.Lock()
+
+    async def process(self, record: StatementRecord) -> StatementResult:
+        with metrics.timer("statement"):
+            result = await self.process_statement(record)
+        metrics.increment("statements", status=result.status)
+        return result
+
+    async def process_statement(self, record: StatementRecord) -> StatementResult:
+        pdf_filename = self.get_filename(record)
+        transactions: list[Transaction] = []
+
+        if self.is_synced(record):
+            return self.skip(record, pdf_filename)
+
+        try:
+            start = time.perf_counter()
+            with metrics.timer("stage", stage="download"):
+                pdf_file = await self.downloader.download_statement_to_file(
+                    record, pdf_filename
+                )
+            download_seconds = time.perf_counter() - start
+            parsed = self.parser.submit(record, pdf_file) if self.parser else None
+            upload, email = await asyncio.to_thread(self.save, record, pdf_file)
+
+            if upload and self.upload:
+                with metrics.timer("stage", stage="upload"):
+                    generation = await asyncio.to_thread(self.upload, pdf_filename)
+                self.record_upload(record, generation)
+
+            if email and self.email:
+                async with self._email_lock:
+                    with metrics.timer("stage", stage="email"):
+                        await asyncio.to_thread(self.email, pdf_filename)
+                self.record_email(record)
+
+            if parsed:
+                with metrics.timer("stage", stage="parse"):
+                    transactions = await asyncio.wrap_future(parsed)
+
+        except Exception as err:  # pylint: disable=broad-exception-caught
+            logger.error("Failed to process %s: %s", pdf_filename, err)
+            return StatementResult(record, pdf_filename, error=err)
+
+        return StatementResult(
+            record,
+            pdf_filename,
+            transactions=transactions,
+            pdf_file=pdf_file,
+            download_seconds=download_seconds,
+        )
+
+    async def run(
+        self, records: AsyncIterable[StatementRecord]
+    ) -> list[StatementResult]:
+        """
+        Processes all records, returning results in the same order
+        as the records were given
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = []
+
+        async def process(record: StatementRecord) -> StatementResult:
+            try:
+                return await self.process(record)
+            finally:
+                semaphore.release()
+
+        try:
+            async for record in records:
+                await semaphore.acquire()
+                tasks.append(asyncio.create_task(process(record)))
+        except BaseException:
+            # statements already under way are stopped before the listing's
+            # error is raised, rather than carrying on in the background
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+        results = list(await asyncio.gather(*tasks))
+        log_summary(results)
+        return results
+
+
+def log_summary(results: list[StatementResult]) -> None:
+    failed = [result for result in results if not result.ok]
+    skipped = [result for result in results if result.skipped]
+    logger.info(
+        "Processed %s statement(s), %s skipped, %s failed",
+        len(results),
+        len(skipped),
+        len(failed),
+    )
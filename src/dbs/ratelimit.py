@@ -0,0 +1,39 @@
+import asyncio
+import threading
+import time
+from typing import Optional
+
+
+class RateLimiter:
+    """
+    Thread-safe limiter that spaces out calls so that no more than
+    `rate` calls per second are made. A rate of None disables limiting.
+    """
+
+    def __init__(self, rate: Optional[float] = None):
+        if rate is not None and rate <= 0:
+            raise ValueError(f"Rate must be positive, got {rate}")
+
+        self.interval = 1 / rate if rate else 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Claims the next free slot and returns the delay until it starts"""
+        if not self.interval:
+            return 0.0
+
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+
+        return slot - now
+
+    def wait(self) -> None:
+        if (delay := self.reserve()) > 0:
+            time.sleep(delay)
+
+    async def wait_async(self) -> None:
+        if (delay := self.reserve()) > 0:
+            await asyncio.sleep(delay)
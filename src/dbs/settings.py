@@ -1,3 +1,6 @@
+from functools import cache
+from typing import Any, Optional
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -11,8 +14,40 @@ class CloudSettings(BaseSettings):
     bucket_name: str
     from_email: str
     to_email: str
+    gmail_token_cache_path: Optional[str] = ".dbs-gmail-token"
+    gmail_scopes: list = [
+        "https://www.googleapis.com/auth/gmail.readonly",
+        "https://www.googleapis.com/auth/gmail.settings.basic",
+        "https://www.googleapis.com/auth/gmail.labels",
+        "https://www.googleapis.com/auth/gmail.modify",
+    ]
+    session_cache_key: Optional[str] = None
+    session_cache_path: str = ".dbs-session"
+    session_cache_secret_id: Optional[str] = None
+    login_worker_address: str = ".dbs-login-worker.sock"
+    login_worker_authkey: Optional[str] = None
+    dbs_base_url: str = "https://internet-banking.dbs.com.sg"
+    browser_allowed_hosts: list = ["*.dbs.com.sg", "*.dbs.com"]
 
     model_config = SettingsConfigDict(env_file=".env", extra="allow")
 
 
-settings = CloudSettings()
+@cache
+def get_settings() -> CloudSettings:
+    return CloudSettings()
+
+
+class LazySettings:
+    """
+    Stands in for CloudSettings, which is only created (reading the
+    environment and .env file) once a setting is first used
+    """
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(get_settings(), name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(get_settings(), name, value)
+
+
+settings: CloudSettings = LazySettings()  # type: ignore[assignment]
@@ -0,0 +1,163 @@
+import base64
+import hashlib
+import logging
+import os
+import shutil
+from abc import ABC, abstractmethod
+from typing import Optional
+
+import google_crc32c  # type: ignore
+from google.api_core.exceptions import NotFound
+from google.cloud import storage  # type: ignore
+from google.cloud.storage import transfer_manager  # type: ignore
+
+from dbs.files import CHUNK_SIZE
+from dbs.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# files above this size are uploaded as concurrent chunks
+LARGE_FILE_SIZE = 32 * 1024 * 1024
+
+
+def get_checksums(path: str) -> tuple[str, str]:
+    """
+    Returns the base64-encoded MD5 and CRC32C checksums of a file,
+    in the same format as the `md5_hash` and `crc32c` of a GCS blob
+    """
+    md5 = hashlib.md5()
+    crc32c = google_crc32c.Checksum()
+
+    with open(path, "rb") as file:
+        while chunk := file.read(CHUNK_SIZE):
+            md5.update(chunk)
+            crc32c.update(chunk)
+
+    return (
+        base64.b64encode(md5.digest()).decode(),
+        base64.b64encode(crc32c.digest()).decode(),
+    )
+
+
+class StorageBackend(ABC):
+    """
+    Destination of uploaded statements, which skips files that are
+    already stored with the same content
+    """
+
+    def __init__(self, prefix: str = "dbs"):
+        self.prefix = prefix
+
+    def get_name(self, source_filename: str) -> str:
+        return f"{self.prefix}/{source_filename}"
+
+    def upload(
+        self, source_filename: str, object_name: Optional[str] = None
+    ) -> Optional[int]:
+        """
+        Uploads a file as `object_name` (by default, its path), and returns
+        the generation of the stored object if the backend has one
+        """
+        name = self.get_name(object_name or source_filename)
+        return self.upload_file(source_filename, name, *get_checksums(source_filename))
+
+    def delete(self, object_name: str) -> None:
+        """Deletes a stored object, if there is one"""
+        self.delete_object(self.get_name(object_name))
+
+    @abstractmethod
+    def upload_file(
+        self, source_filename: str, name: str, md5: str, crc32c: str
+    ) -> Optional[int]:
+        pass
+
+    @abstractmethod
+    def delete_object(self, name: str) -> None:
+        pass
+
+
+class GcsStorageBackend(StorageBackend):
+    """
+    Uploads to a GCS bucket with one client and bucket handle for the whole
+    run, so that uploads from several threads share a connection pool
+    """
+
+    def __init__(
+        self,
+        bucket_name: str,
+        prefix: str = "dbs",
+        client: Optional[storage.Client] = None,
+        max_workers: int = 8,
+    ):
+        super().__init__(prefix)
+        self.client = client or storage.Client()
+        # unlike get_bucket, this does not fetch the bucket's metadata
+        self.bucket = self.client.bucket(bucket_name)
+        self.max_workers = max_workers
+
+    def upload_file(
+        self, source_filename: str, name: str, md5: str, crc32c: str
+    ) -> Optional[int]:
+        # composite objects only have a CRC32C checksum
+        if (blob := self.bucket.get_blob(name)) and (
+            blob.md5_hash == md5 if blob.md5_hash else blob.crc32c == crc32c
+        ):
+            logger.info("Skipping upload of %s, already in bucket", name)
+            metrics.increment("uploads_skipped")
+            return blob.generation
+
+        blob = self.bucket.blob(name)
+        logger.info("Uploading to 'gs://%s/%s'", self.bucket.name, name)
+
+        if os.path.getsize(source_filename) < LARGE_FILE_SIZE:
+            # a resumable upload is used for files above the blob's chunk size
+            blob.upload_from_filename(source_filename, checksum="md5")
+        else:
+            transfer_manager.upload_chunks_concurrently(
+                source_filename,
+                blob,
+                worker_type=transfer_manager.THREAD,
+                max_workers=self.max_workers,
+            )
+            blob.reload()
+
+        logger.info("Uploaded %s", name)
+        metrics.increment("uploaded_bytes", os.path.getsize(source_filename))
+        return blob.generation
+
+    def delete_object(self, name: str) -> None:
+        try:
+            self.bucket.delete_blob(name)
+            logger.info("Deleted 'gs://%s/%s'", self.bucket.name, name)
+        except NotFound:
+            pass
+
+
+class LocalStorageBackend(StorageBackend):
+    """Copies files into a local directory, as an offline stand-in for GCS"""
+
+    def __init__(self, root: str, prefix: str = "dbs"):
+        super().__init__(prefix)
+        self.root = root
+
+    def upload_file(
+        self, source_filename: str, name: str, md5: str, crc32c: str
+    ) -> Optional[int]:
+        path = os.path.join(self.root, name)
+
+        if os.path.exists(path) and get_checksums(path) == (md5, crc32c):
+            logger.info("Skipping upload of %s, already in %s", name, self.root)
+            metrics.increment("uploads_skipped")
+            return None
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.copyfile(source_filename, path)
+        logger.info("Copied %s to %s", source_filename, path)
+        metrics.increment("uploaded_bytes", os.path.getsize(path))
+        return None
+
+    def delete_object(self, name: str) -> None:
+        path = os.path.join(self.root, name)
+        if os.path.exists(path):
+            os.remove(path)
+            logger.info("Deleted %s", path)
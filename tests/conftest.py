@@ -0,0 +1,74 @@
+from typing import Callable
+from unittest.mock import MagicMock
+
+import pytest
+
+from dbs.browser.download import StatementRecord
+from dbs.files import AtomicFileWriter
+
+
+@pytest.fixture
+def make_page():
+    def make_page(page_number: int, page_size: int, total_records: int | None) -> dict:
+        """Builds a page of a listing with up to 25 statements"""
+        start = (page_number - 1) * page_size
+        end = min(page_number * page_size, total_records or 25)
+        page = {
+            "estatementTypes": [],
+            "estatements": [
+                {
+                    "statementDate": f"2023-11-{i:02}",
+                    "statementType": "DBSSPA",
+                    "statementHashKey": f"hash-{i}",
+                    "description": "DBS Savings Plus Account",
+                    "entityName": [],
+                    "address": [],
+                    "productCode": "1234",
+                    "productReferenceNo": "1234567890",
+                    "currency": None,
+                    "formattedAccountNumber": "123-4-567890",
+                }
+                for i in range(start, end)
+            ],
+        }
+        if total_records is not None:
+            page["totalRecords"] = total_records
+        return page
+
+    return make_page
+
+
+@pytest.fixture
+def make_record():
+    def make_record(statement_date: str) -> StatementRecord:
+        """Builds a savings account statement record for a given date"""
+        return StatementRecord(
+            statementDate=statement_date,
+            statementType="DBSSPA",
+            statementHashKey=f"hash-{statement_date}",
+            description="DBS Savings Plus Account",
+            entityName=[],
+            address=[],
+            productCode="1234",
+            productReferenceNo="1234567890",
+            currency=None,
+            formattedAccountNumber="123-4-567890",
+        )
+
+    return make_record
+
+
+@pytest.fixture
+def make_downloader():
+    def make_downloader(get_content: Callable[[StatementRecord], bytes]) -> MagicMock:
+        """Builds a downloader that writes `get_content(record)` to disk"""
+
+        def download_statement_to_file(record: StatementRecord, path: str, *_):
+            content = get_content(record)
+            with AtomicFileWriter(path) as writer:
+                writer.write(content)
+            return writer.result
+
+        return MagicMock(download_statement_to_file=download_statement_to_file)
+
+    return make_downloader
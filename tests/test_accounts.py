@@ -0,0 +1,48 @@
+import json
+import os
+from unittest.mock import MagicMock
+
+import pytest
+
+from dbs.accounts import MultiAccountDownloader, load_accounts
+from dbs.pipeline import StatementPipeline
+
+
+def test_load_accounts(tmp_path):
+    path = tmp_path / "accounts.json"
+    accounts = [
+        {"name": "alice", "dbs_user_id": "a", "dbs_pin": "1", "otp_email_subject": "A"},
+        {"name": "bob", "dbs_user_id": "b", "dbs_pin": "2", "otp_email_subject": "B"},
+    ]
+    path.write_text(json.dumps(accounts))
+
+    assert [account.name for account in load_accounts(str(path))] == ["alice", "bob"]
+
+    accounts[1]["otp_email_subject"] = "A"
+    path.write_text(json.dumps(accounts))
+
+    with pytest.raises(ValueError, match="otp_email_subject"):
+        load_accounts(str(path))
+
+
+def test_multi_account_pipeline(tmp_path, monkeypatch, make_record, make_downloader):
+    monkeypatch.chdir(tmp_path)
+    downloaders = {}
+    for name in ("alice", "bob"):
+        downloader = make_downloader(lambda record, name=name: name.encode())
+        downloader.iter_statements.return_value = iter([make_record("2023-11-30")])
+        downloaders[name] = downloader
+    upload = MagicMock()
+
+    downloader = MultiAccountDownloader(downloaders)
+    pipeline = StatementPipeline(downloader, upload=upload)
+    results = pipeline.run(downloader.iter_statements(page_size=10))
+
+    assert all(result.ok for result in results)
+    assert [result.filename for result in results] == [
+        os.path.join("alice", "dbs-dbsspa-2023-11-30.pdf"),
+        os.path.join("bob", "dbs-dbsspa-2023-11-30.pdf"),
+    ]
+    assert (tmp_path / "bob" / "dbs-dbsspa-2023-11-30.pdf").read_bytes() == b"bob"
+    downloaders["alice"].iter_statements.assert_called_once_with(page_size=10)
+    assert upload.call_count == 2
@@ -0,0 +1,122 @@
+import asyncio
+import json
+from unittest.mock import MagicMock
+
+import httpx
+import pytest
+
+from dbs.browser.async_download import AsyncStatementDownloader
+from dbs.browser.login import DbsAuthHandler
+from dbs.pipeline import AsyncStatementPipeline
+
+cookies = [
+    {"name": "X-dbs-cust-sysgen-id", "value": "12345"},
+    {"name": "X-dbs-session-token", "value": "mock_token"},
+]
+
+
+def test_async_download(tmp_path, monkeypatch, make_page):
+    monkeypatch.chdir(tmp_path)
+    attempts: dict[str, int] = {}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert request.headers["x-dbs-session-token"] == "mock_token"
+
+        if request.method == "GET":
+            page_number = int(request.url.params["pageNumber"])
+            page_size = int(request.url.params["pageSize"])
+            return httpx.Response(200, json=make_page(page_number, page_size, 25))
+
+        # fail the first attempt for every statement
+        key = json.loads(request.content)["statementHashKey"]
+        attempts[key] = attempts.get(key, 0) + 1
+        if attempts[key] == 1:
+            return httpx.Response(503)
+        return httpx.Response(200, content=key.encode())
+
+    async def run():
+        downloader = AsyncStatementDownloader(
+            cookies, DbsAuthHandler.user_agent, backoff_factor=0
+        )
+        downloader.client = httpx.AsyncClient(
+            headers=downloader.session_headers, transport=httpx.MockTransport(handler)
+        )
+        async with downloader:
+            pipeline = AsyncStatementPipeline(downloader, concurrency=5)
+            return await pipeline.run(
+                downloader.iter_statements(
+                    from_date="2023-06",
+                    to_date="2023-12",
+                    statement_type="ALL",
+                    sort_order="DESC",
+                    page_size=10,
+                )
+            )
+
+    results = asyncio.run(run())
+
+    assert all(result.ok for result in results)
+    assert [result.record.statement_hash_key for result in results] == [
+        f"hash-{i}" for i in range(25)
+    ]
+    assert set(attempts.values()) == {2}
+    assert (tmp_path / "dbs-dbsspa-2023-11-00.pdf").read_bytes() == b"hash-0"
+    assert not list(tmp_path.glob("*.part"))
+
+
+def test_async_iter_statements_error_page(make_page):
+    def handler(request: httpx.Request) -> httpx.Response:
+        page_number = int(request.url.params["pageNumber"])
+        if page_number == 3:
+            return httpx.Response(200, json={"errorCode": "SESSION_EXPIRED"})
+        return httpx.Response(200, json=make_page(page_number, 10, 25))
+
+    async def run():
+        downloader = AsyncStatementDownloader(cookies, DbsAuthHandler.user_agent)
+        downloader.client = httpx.AsyncClient(
+            headers=downloader.session_headers, transport=httpx.MockTransport(handler)
+        )
+        async with downloader:
+            return [
+                record
+                async for record in downloader.iter_statements(
+                    from_date="2023-06",
+                    to_date="2023-12",
+                    statement_type="ALL",
+                    sort_order="DESC",
+                    page_size=10,
+                )
+            ]
+
+    with pytest.raises(RuntimeError, match="Page 3 of the statement list"):
+        asyncio.run(run())
+
+
+def test_async_pipeline_stops_statements_when_listing_fails(make_record):
+    started: list[str] = []
+    cancelled: list[str] = []
+
+    async def download_statement_to_file(record, path):
+        started.append(path)
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(path)
+            raise
+
+    async def records():
+        yield make_record("2023-11-30")
+        yield make_record("2023-10-31")
+        await asyncio.sleep(0)
+        raise RuntimeError("Page 2 of the statement list has no statements")
+
+    async def run():
+        downloader = MagicMock(download_statement_to_file=download_statement_to_file)
+        pipeline = AsyncStatementPipeline(downloader, concurrency=5)
+        with pytest.raises(RuntimeError, match="Page 2"):
+            await pipeline.run(records())
+        # nothing is left running once run has raised
+        assert asyncio.all_tasks() == {asyncio.current_task()}
+
+    asyncio.run(run())
+    assert sorted(cancelled) == sorted(started) and len(started) == 2
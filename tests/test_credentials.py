@@ -0,0 +1,106 @@
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+from pytest_mock import MockerFixture
+
+from dbs.gmail import credentials as gmail_credentials
+from dbs.settings import settings
+
+
+def make_token(token: str, expiry: datetime, refresh_token: str = "refresh") -> str:
+    return json.dumps(
+        {
+            "token": token,
+            "refresh_token": refresh_token,
+            "client_id": "client",
+            "client_secret": "secret",
+            "expiry": expiry.isoformat() + "Z",
+        }
+    )
+
+
+@pytest.fixture(autouse=True)
+def token_cache(tmp_path, monkeypatch):
+    path = str(tmp_path / "token")
+    monkeypatch.setattr(settings, "gmail_token_cache_path", path)
+    gmail_credentials.clear_cache()
+    yield path
+    gmail_credentials.clear_cache()
+
+
+def test_credentials_cached_locally(token_cache, mocker: MockerFixture):
+    expiry = datetime.utcnow() + timedelta(hours=1)
+    read_secret = mocker.patch.object(
+        gmail_credentials, "read_secret", return_value=make_token("abc", expiry)
+    )
+    write_secret = mocker.patch.object(gmail_credentials, "write_secret")
+
+    credentials = gmail_credentials.get_credentials()
+    assert credentials.token == "abc"
+    assert gmail_credentials.get_credentials() is credentials
+    assert os.stat(token_cache).st_mode & 0o777 == 0o600
+
+    # a new process only reads the local cache
+    gmail_credentials.clear_cache()
+    assert gmail_credentials.get_credentials().token == "abc"
+
+    read_secret.assert_called_once()
+    write_secret.assert_not_called()
+
+
+@pytest.mark.parametrize("rotated", [False, True])
+def test_expired_credentials_refreshed(token_cache, mocker: MockerFixture, rotated):
+    expired = datetime.utcnow() - timedelta(minutes=1)
+    with open(token_cache, "w", encoding="utf-8") as file:
+        file.write(make_token("old", expired))
+    read_secret = mocker.patch.object(gmail_credentials, "read_secret")
+    write_secret = mocker.patch.object(gmail_credentials, "write_secret")
+
+    def refresh(self, _request):
+        self.token = "new"
+        self.expiry = datetime.utcnow() + timedelta(hours=1)
+        if rotated:
+            self._refresh_token = "rotated"  # pylint: disable=protected-access
+
+    mocker.patch("google.oauth2.credentials.Credentials.refresh", refresh)
+
+    assert gmail_credentials.get_credentials().token == "new"
+
+    read_secret.assert_not_called()
+    with open(token_cache, encoding="utf-8") as file:
+        assert json.load(file)["token"] == "new"
+    # a new secret version is only added for a new refresh token
+    if rotated:
+        write_secret.assert_called_once()
+        assert json.loads(write_secret.call_args.args[0])["refresh_token"] == "rotated"
+    else:
+        write_secret.assert_not_called()
+
+
+def test_gmail_service_per_thread(mocker: MockerFixture):
+    expiry = datetime.utcnow() + timedelta(hours=1)
+    read_secret = mocker.patch.object(
+        gmail_credentials, "read_secret", return_value=make_token("abc", expiry)
+    )
+
+    service = gmail_credentials.get_gmail_service()
+    assert gmail_credentials.get_gmail_service() is service
+    assert (
+        service.users()
+        .messages()
+        .list(userId="me")
+        .uri.startswith("https://gmail.googleapis.com/gmail/v1/users/me/messages")
+    )
+
+    services = []
+    thread = threading.Thread(
+        target=lambda: services.append(gmail_credentials.get_gmail_service())
+    )
+    thread.start()
+    thread.join()
+
+    assert services[0] is not service
+    read_secret.assert_called_once()
@@ -0,0 +1,46 @@
+import email
+from email.policy import default
+from unittest.mock import MagicMock
+
+from dbs.digest import DigestEmail
+
+
+def test_digest_email(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    sizes = {"2023-09-30": 300_000, "2023-10-31": 500_000, "2023-11-30": 400_000}
+    for date, size in sizes.items():
+        (tmp_path / f"dbs-dbsspa-{date}.pdf").write_bytes(date.encode() * (size // 10))
+    service = MagicMock()
+    messages: list[email.message.EmailMessage] = []
+
+    def send(userId, body, media_body):  # pylint: disable=invalid-name
+        with open(media_body._filename, "rb") as file:  # pylint: disable=W0212
+            messages.append(email.message_from_binary_file(file, policy=default))
+        return MagicMock()
+
+    service.users.return_value.messages.return_value.send.side_effect = send
+
+    # a limit of 1.2 MB fits the first two statements into one message
+    digest = DigestEmail(MagicMock(gmail_service=service), "to@x.com", "from@x.com")
+    digest.max_size = 1_200_000
+    for date in sizes:
+        digest(f"dbs-dbsspa-{date}.pdf")
+
+    assert not digest.send()
+    assert [message["Subject"] for message in messages] == [
+        "DBS eStatements - 2 statement(s), 2023-09-30 to 2023-10-31 (1/2)",
+        "DBS eStatements - 1 statement(s), 2023-11-30 (2/2)",
+    ]
+    attachments = list(messages[0].iter_attachments())
+    assert [part.get_filename() for part in attachments] == [
+        "dbs-dbsspa-2023-09-30.pdf",
+        "dbs-dbsspa-2023-10-31.pdf",
+    ]
+    assert (
+        attachments[1].get_content()
+        == (tmp_path / "dbs-dbsspa-2023-10-31.pdf").read_bytes()
+    )
+    assert (
+        "DBSSPA     2023-10-31  488 KB"
+        in messages[0].get_body(("plain",)).get_content()
+    )
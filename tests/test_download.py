@@ -1,9 +1,14 @@
+import hashlib
 import json
+import os
 from unittest.mock import MagicMock
 
+import pytest
+import requests
+from pydantic import ValidationError
 from pytest_mock import MockerFixture
 
-from dbs.browser.download import StatementDownloader
+from dbs.browser.download import StatementDownloader, StatementRecord
 from dbs.browser.login import DbsAuthHandler
 
 
@@ -32,13 +37,14 @@ def test_download(mocker: MockerFixture):
         {"name": "X-dbs-session-token", "value": "mock_token"},
     ]
 
-    mock_get = mocker.patch(
-        "dbs.browser.download.requests.get",
-        return_value=MagicMock(text=json.dumps(expected_response)),
-    )
     mocker.patch("dbs.browser.download.uuid4", return_value="abcd1234")
 
     downloader = StatementDownloader(cookies, DbsAuthHandler.user_agent)
+    mock_get = mocker.patch.object(
+        downloader.session,
+        "get",
+        return_value=MagicMock(text=json.dumps(expected_response)),
+    )
     response = downloader.list_statements(
         from_date="2023-06",
         to_date="2023-12",
@@ -59,7 +65,7 @@ def test_download(mocker: MockerFixture):
         "pageNumber": 1,
     }
 
-    expected_headers = {**downloader.common_headers}
+    expected_headers = {**downloader.request_headers}
 
     expected_headers["actionid"] = "LIST"
     expected_headers["x-version"] = "2.0.0"
@@ -70,5 +76,157 @@ def test_download(mocker: MockerFixture):
         downloader.list_endpoint,
         params=expected_params,
         headers=expected_headers,
-        timeout=10,
+        timeout=(5, 30),
+    )
+    assert downloader.session.headers["x-dbs-session-token"] == "mock_token"
+    assert downloader.session.headers["x-dbs-cust-sysgen-id"] == "12345"
+
+
+def test_session_retries():
+    cookies = [
+        {"name": "X-dbs-cust-sysgen-id", "value": "12345"},
+        {"name": "X-dbs-session-token", "value": "mock_token"},
+    ]
+    downloader = StatementDownloader(
+        cookies, DbsAuthHandler.user_agent, pool_size=16, max_retries=5
+    )
+
+    adapter = downloader.session.get_adapter(downloader.list_endpoint)
+
+    assert adapter.max_retries.total == 5
+    assert 503 in adapter.max_retries.status_forcelist
+    assert adapter._pool_maxsize == 16  # pylint: disable=protected-access
+
+
+@pytest.mark.parametrize("total_records", [25, None])
+def test_iter_statements(mocker: MockerFixture, make_page, total_records):
+    downloader = StatementDownloader([], DbsAuthHandler.user_agent)
+    mock_fetch = mocker.patch.object(
+        downloader,
+        "fetch_statement_page",
+        side_effect=lambda page_number, page_size, **_: make_page(
+            page_number, page_size, total_records
+        ),
+    )
+
+    records = list(
+        downloader.iter_statements(
+            from_date="2023-06",
+            to_date="2023-12",
+            statement_type="ALL",
+            sort_order="DESC",
+            page_size=10,
+        )
+    )
+
+    assert [record.statement_hash_key for record in records] == [
+        f"hash-{i}" for i in range(25)
+    ]
+    assert sorted(call.kwargs["page_number"] for call in mock_fetch.call_args_list) == [
+        1,
+        2,
+        3,
+    ]
+
+
+def test_iter_statements_max_pages(mocker: MockerFixture, make_page):
+    downloader = StatementDownloader([], DbsAuthHandler.user_agent)
+    mocker.patch.object(
+        downloader,
+        "fetch_statement_page",
+        side_effect=lambda page_number, page_size, **_: make_page(
+            page_number, page_size, 25
+        ),
     )
+
+    records = list(
+        downloader.iter_statements(
+            from_date="2023-06",
+            to_date="2023-12",
+            statement_type="ALL",
+            sort_order="DESC",
+            page_size=10,
+            page_number=2,
+            max_pages=1,
+        )
+    )
+
+    assert len(records) == 10
+    assert records[0].statement_hash_key == "hash-10"
+
+
+@pytest.mark.parametrize(
+    "broken_page, error",
+    [
+        ({"errorCode": "SESSION_EXPIRED"}, "has no statements"),
+        ({"totalRecords": 25, "estatements": []}, "has 0 statement"),
+    ],
+)
+def test_iter_statements_broken_page(
+    mocker: MockerFixture, make_page, broken_page, error
+):
+    downloader = StatementDownloader([], DbsAuthHandler.user_agent)
+    mocker.patch.object(
+        downloader,
+        "fetch_statement_page",
+        side_effect=lambda page_number, page_size, **_: (
+            broken_page if page_number == 2 else make_page(page_number, page_size, 25)
+        ),
+    )
+
+    # a page that isn't a full listing fails, instead of ending the listing
+    with pytest.raises(RuntimeError, match=error):
+        list(
+            downloader.iter_statements(
+                from_date="2023-06",
+                to_date="2023-12",
+                statement_type="ALL",
+                sort_order="DESC",
+                page_size=10,
+            )
+        )
+
+
+def test_download_statement_to_file(tmp_path, requests_mock, make_record):
+    cookies = [
+        {"name": "X-dbs-cust-sysgen-id", "value": "12345"},
+        {"name": "X-dbs-session-token", "value": "mock_token"},
+    ]
+    downloader = StatementDownloader(cookies, DbsAuthHandler.user_agent)
+    content = b"%PDF" + b"0" * 200_000
+    requests_mock.post(downloader.download_endpoint, content=content)
+
+    path = str(tmp_path / "statement.pdf")
+    pdf_file = downloader.download_statement_to_file(
+        make_record("2023-11-30"), path, chunk_size=1024
+    )
+
+    assert pdf_file.size == len(content)
+    assert pdf_file.sha256 == hashlib.sha256(content).hexdigest()
+    assert (tmp_path / "statement.pdf").read_bytes() == content
+
+    requests_mock.post(downloader.download_endpoint, status_code=404)
+    with pytest.raises(requests.HTTPError):
+        downloader.download_statement_to_file(make_record("2023-10-31"), path)
+
+    assert os.listdir(tmp_path) == ["statement.pdf"]
+
+
+def test_statement_record_from_api(make_page):
+    estatement = make_page(1, 1, 1)["estatements"][0]
+
+    record = StatementRecord.from_api(estatement)
+    record.account = "alice"
+    validated = StatementRecord(**estatement, account="alice")
+    assert record.model_dump() == validated.model_dump()
+    assert record.account == "alice"
+    # the listed object is posted back as is, which a validated record rebuilds
+    assert record.payload is estatement
+    assert validated.payload == estatement
+
+    # records that don't look like a listed estatement are validated
+    with pytest.raises(ValidationError):
+        StatementRecord.from_api({**estatement, "statementDate": None})
+    del estatement["currency"]
+    with pytest.raises(ValidationError):
+        StatementRecord.from_api(estatement)
@@ -0,0 +1,122 @@
+import logging
+from decimal import Decimal
+from unittest.mock import MagicMock
+
+import pytest
+
+from dbs.files import DownloadedFile
+from dbs.pipeline import StatementResult
+from dbs.storage import LocalStorageBackend
+
+pa = pytest.importorskip("pyarrow")
+ds = pytest.importorskip("pyarrow.dataset")
+pytest.importorskip("pypdf")
+
+# pylint: disable=wrong-import-position
+from dbs.export import StatementExporter  # noqa: E402
+from dbs.parse import Transaction  # noqa: E402
+
+
+def make_result(record) -> StatementResult:
+    transaction = Transaction(
+        account_number=record.formatted_account_number,
+        statement_date=record.statement_date,
+        transaction_date=record.statement_date,
+        description="Salary",
+        amount=Decimal("2000.00"),
+        balance=Decimal("2900.00"),
+    )
+    return StatementResult(
+        record,
+        f"dbs-dbsspa-{record.statement_date}.pdf",
+        transactions=[transaction],
+        pdf_file=DownloadedFile("statement.pdf", 100, "abc"),
+        download_seconds=0.5,
+    )
+
+
+def read(path: str, file_format: str = "parquet") -> pa.Table:
+    dataset = ds.dataset(path, format=file_format, partitioning="hive")
+    return dataset.to_table().sort_by("statement_date")
+
+
+@pytest.mark.parametrize("file_format", ["parquet", "arrow"])
+def test_export_in_batches(tmp_path, monkeypatch, make_record, file_format):
+    monkeypatch.chdir(tmp_path)
+    exporter = StatementExporter(file_format=file_format, batch_size=2)
+
+    for date in ("2023-11-30", "2023-10-31", "2023-11-15"):
+        exporter.add(make_result(make_record(date)))
+    exporter.close()
+
+    statements = read("exports/statements", file_format)
+    assert statements["statement_date"].to_pylist() == [
+        "2023-10-31",
+        "2023-11-15",
+        "2023-11-30",
+    ]
+    assert statements["statement_month"].to_pylist() == [
+        "2023-10",
+        "2023-11",
+        "2023-11",
+    ]
+    assert set(statements["sha256"].to_pylist()) == {"abc"}
+    assert set(statements["status"].to_pylist()) == {"ok"}
+
+    transactions = read("exports/transactions", file_format)
+    assert transactions["amount"].to_pylist() == [Decimal("2000.00")] * 3
+
+    # the 2 batches were written to separate files in the same month
+    assert (
+        len(list((tmp_path / "exports/statements/statement_month=2023-11").iterdir()))
+        == 2
+    )
+
+
+def test_export_compaction_and_upload(tmp_path, monkeypatch, make_record):
+    monkeypatch.chdir(tmp_path)
+    storage = LocalStorageBackend("uploads")
+    month = "statements/statement_month=2023-11"
+
+    for date in ("2023-11-30", "2023-11-15"):
+        exporter = StatementExporter(storage=storage)
+        exporter.add(make_result(make_record(date)))
+        exporter.close()
+    assert len(list((tmp_path / "uploads/dbs/exports" / month).iterdir())) == 2
+
+    exporter = StatementExporter(storage=storage, compact=True)
+    exporter.close()
+
+    local_files = list((tmp_path / "exports" / month).iterdir())
+    uploaded_files = list((tmp_path / "uploads/dbs/exports" / month).iterdir())
+    assert len(local_files) == 1
+    assert [file.name for file in uploaded_files] == [local_files[0].name]
+    assert read("exports/statements").num_rows == 2
+    assert read("uploads/dbs/exports/statements").num_rows == 2
+
+
+def test_export_upload_outside_working_directory(tmp_path, monkeypatch, make_record):
+    (tmp_path / "cwd").mkdir()
+    monkeypatch.chdir(tmp_path / "cwd")
+    storage = LocalStorageBackend(str(tmp_path / "uploads"))
+
+    exporter = StatementExporter(str(tmp_path / "out" / "exports"), storage=storage)
+    exporter.add(make_result(make_record("2023-11-30")))
+    exporter.close()
+
+    # object names are relative to the export root, not the working directory
+    assert read(str(tmp_path / "uploads/dbs/exports/statements")).num_rows == 1
+    assert read(str(tmp_path / "uploads/dbs/exports/transactions")).num_rows == 1
+
+
+def test_export_compaction_warns_for_remote_storage(tmp_path, monkeypatch, caplog):
+    monkeypatch.chdir(tmp_path)
+
+    with caplog.at_level(logging.WARNING, logger="dbs.export"):
+        StatementExporter(storage=LocalStorageBackend("uploads"), compact=True)
+        StatementExporter(storage=MagicMock(), compact=False)
+    assert not caplog.records
+
+    with caplog.at_level(logging.WARNING, logger="dbs.export"):
+        StatementExporter(storage=MagicMock(), compact=True)
+    assert "Only the files in exports are compacted" in caplog.text
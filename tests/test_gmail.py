@@ -0,0 +1,135 @@
+import asyncio
+from unittest.mock import MagicMock
+
+from dbs.gmail import Gmail
+from dbs.gmail.gmail import Message
+
+
+def make_message(message_id: str, subject: str, snippet: str = "") -> dict:
+    return {
+        "id": message_id,
+        "snippet": snippet,
+        "payload": {
+            "headers": [
+                {"name": "Subject", "value": subject},
+                {"name": "From", "value": "Forwarder <user@gmail.com>"},
+            ]
+        },
+    }
+
+
+def test_wait_for_new_message():
+    service = MagicMock()
+    users = service.users.return_value
+    users.getProfile.return_value.execute.return_value = {"historyId": "100"}
+    users.history.return_value.list.return_value.execute.side_effect = [
+        {"historyId": "100"},
+        {
+            "historyId": "101",
+            "history": [{"messagesAdded": [{"message": {"id": "newsletter"}}]}],
+        },
+        {
+            "historyId": "102",
+            "history": [{"messagesAdded": [{"message": {"id": "otp"}}]}],
+        },
+    ]
+    messages = {
+        "newsletter": make_message("newsletter", "Weekly digest"),
+        "otp": make_message("otp", "Fwd: SMS", snippet="DBS OTP is 123456"),
+    }
+    users.messages.return_value.get.side_effect = lambda userId, id, **_: MagicMock(
+        execute=MagicMock(return_value=messages[id])
+    )
+
+    gmail = Gmail(service)
+    message = asyncio.run(gmail.wait_for_new_message(min_interval=0, max_interval=0))
+
+    assert message.message_id == "otp"
+    start_history_ids = [
+        call.kwargs["startHistoryId"]
+        for call in users.history.return_value.list.call_args_list
+    ]
+    assert start_history_ids == ["100", "100", "101"]
+    # only headers and snippets are fetched, as the snippet has the OTP
+    get_calls = users.messages.return_value.get.call_args_list
+    assert [call.kwargs.get("format") for call in get_calls] == [
+        "metadata",
+        "metadata",
+    ]
+    assert gmail.extract_otp_from_message(message) == "123456"
+
+
+class FakeBatch:
+    def __init__(self, callback):
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, request_id):
+        self.requests.append((request, request_id))
+
+    def execute(self):
+        # responses of a batch request can arrive in any order
+        for request, request_id in reversed(self.requests):
+            self.callback(request_id, make_message(request["id"], "DBS OTP"), None)
+
+
+def test_get_emails():
+    service = MagicMock()
+    messages = service.users.return_value.messages.return_value
+    messages.list.return_value.execute.side_effect = [
+        {"messages": [{"id": str(i)} for i in range(3)], "nextPageToken": "page-2"},
+        {"messages": [{"id": "3"}]},
+    ]
+    messages.get.side_effect = lambda **kwargs: kwargs
+    batches: list[FakeBatch] = []
+    service.new_batch_http_request.side_effect = (
+        lambda callback: batches.append(FakeBatch(callback)) or batches[-1]
+    )
+
+    gmail = Gmail(service)
+    emails = gmail.get_emails(message_format="metadata", batch_size=2)
+
+    assert [email.message_id for email in emails] == ["0", "1", "2", "3"]
+    assert [len(batch.requests) for batch in batches] == [2, 1, 1]
+    assert messages.list.call_args_list[1].kwargs["pageToken"] == "page-2"
+    assert {
+        request["format"] for batch in batches for request, _ in batch.requests
+    } == {"metadata"}
+
+
+def test_is_otp_message_per_account():
+    gmail = Gmail(MagicMock(), otp_email_subject="OTP for Alice")
+
+    assert gmail.is_otp_message(
+        Message(make_message("1", "Fwd: SMS", snippet="OTP for Alice: 123456"))
+    )
+    assert not gmail.is_otp_message(
+        Message(make_message("2", "Fwd: SMS", snippet="OTP for Bob: 123456"))
+    )
+
+
+def test_message():
+    data = make_message("1", "Fwd: SMS")
+    data["payload"]["headers"].append({"name": "Received", "value": "by mx.google"})
+    data["payload"]["parts"] = [
+        {"partId": "0", "parts": [{"partId": "0.0"}, {"partId": "0.1"}]},
+        {"partId": "1", "body": {"data": "MTIzNDU2"}},
+    ]
+    message = Message(data)
+
+    assert message.subject == "Fwd: SMS"
+    assert message.headers["From"] == "Forwarder <user@gmail.com>"
+    assert message.from_trusted_user
+    assert [part.part_id for part in message.parts] == ["0", "1", "0.0", "0.1"]
+    assert not hasattr(message, "__dict__")
+    # only the headers that are read are kept
+    assert set(message.headers) == {"Subject", "From"}
+
+
+def test_mark_as_read():
+    service = MagicMock()
+    Gmail(service).mark_as_read(Message(make_message("1", "DBS OTP")))
+
+    service.users.return_value.messages.return_value.modify.assert_called_once_with(
+        userId="me", id="1", body={"removeLabelIds": ["UNREAD"]}
+    )
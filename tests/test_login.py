@@ -0,0 +1,124 @@
+import asyncio
+import threading
+import time
+from unittest.mock import MagicMock
+
+from dbs.browser.login import BLOCKED_URL_PATTERNS, DbsAuthHandler, LoginStep
+from dbs.gmail import Gmail
+from dbs.settings import settings
+
+
+def test_execute_auth_flow(monkeypatch):
+    monkeypatch.setattr(DbsAuthHandler, "create_driver", MagicMock())
+    events: list[str] = []
+    gmail_client = MagicMock()
+    gmail_client.get_history_id.side_effect = lambda: events.append("history") or "100"
+    gmail_client.extract_otp_from_message.return_value = "123456"
+
+    async def wait_for_new_message(start_history_id):
+        events.append(f"watch {start_history_id}")
+        # the SMS is sent from a thread while the inbox is being watched
+        while "sms" not in events:
+            await asyncio.sleep(0.01)
+        return MagicMock(subject="DBS OTP")
+
+    gmail_client.wait_for_new_message = wait_for_new_message
+
+    auth_handler = DbsAuthHandler(gmail_client)
+    driver = auth_handler.webdriver
+    driver.find_element.return_value.is_displayed.return_value = True
+    send_sms_otp = auth_handler.send_sms_otp
+
+    def send_sms_otp_and_record(driver):
+        while not events or not events[-1].startswith("watch"):
+            time.sleep(0.01)
+        send_sms_otp(driver)
+        events.append("sms")
+
+    monkeypatch.setattr(auth_handler, "send_sms_otp", send_sms_otp_and_record)
+
+    assert auth_handler.execute_auth_flow(driver, "user", "pin") is driver
+    assert events == ["history", "watch 100", "sms"]
+    driver.find_element.return_value.send_keys.assert_any_call("123456")
+    assert list(auth_handler.step_timings) == [
+        step.value for step in LoginStep if step is not LoginStep.DONE
+    ]
+
+
+def test_browser_steps_run_while_otp_request_pending(monkeypatch):
+    monkeypatch.setattr(DbsAuthHandler, "create_driver", MagicMock())
+    sms_requested = threading.Event()
+    service = MagicMock()
+    users = service.users.return_value
+    users.getProfile.return_value.execute.return_value = {"historyId": "100"}
+
+    def list_history():
+        # the inbox poll is pending until the request OTP step has finished,
+        # which needs the event loop to be free
+        assert sms_requested.wait(timeout=5)
+        return {
+            "historyId": "101",
+            "history": [{"messagesAdded": [{"message": {"id": "otp"}}]}],
+        }
+
+    users.history.return_value.list.return_value.execute.side_effect = list_history
+    users.messages.return_value.get.return_value.execute.return_value = {
+        "id": "otp",
+        "snippet": "Your DBS OTP is 123456",
+        "payload": {
+            "headers": [
+                {"name": "Subject", "value": "DBS OTP"},
+                {"name": "From", "value": "Forwarder <user@gmail.com>"},
+            ]
+        },
+    }
+
+    auth_handler = DbsAuthHandler(Gmail(service, otp_email_subject="DBS OTP"))
+    driver = auth_handler.webdriver
+    driver.find_element.return_value.is_displayed.return_value = True
+    run_step = auth_handler.run_step
+
+    async def run_step_and_record(step, state):
+        next_step = await run_step(step, state)
+        if step is LoginStep.REQUEST_OTP:
+            sms_requested.set()
+        return next_step
+
+    monkeypatch.setattr(auth_handler, "run_step", run_step_and_record)
+
+    assert auth_handler.execute_auth_flow(driver, "user", "pin") is driver
+    driver.find_element.return_value.send_keys.assert_any_call("123456")
+
+
+def test_lightweight_driver(monkeypatch):
+    chrome = MagicMock()
+    monkeypatch.setattr("dbs.browser.login.webdriver.Chrome", chrome)
+
+    auth_handler = DbsAuthHandler(MagicMock(), lightweight=True)
+
+    options = chrome.call_args.kwargs["options"]
+    assert (
+        options.experimental_options["prefs"][
+            "profile.managed_default_content_settings.images"
+        ]
+        == 2
+    )
+    assert (
+        "--host-resolver-rules=MAP * ~NOTFOUND, EXCLUDE *.dbs.com.sg, EXCLUDE *.dbs.com"
+        in options.arguments
+    )
+    auth_handler.webdriver.execute_cdp_cmd.assert_called_with(
+        "Network.setBlockedURLs", {"urls": BLOCKED_URL_PATTERNS}
+    )
+
+
+def test_login_url_from_settings(monkeypatch):
+    monkeypatch.setattr(DbsAuthHandler, "create_driver", MagicMock())
+    monkeypatch.setattr(settings, "dbs_base_url", "https://dbs.example.com")
+
+    auth_handler = DbsAuthHandler(MagicMock())
+    auth_handler.prepare()
+
+    auth_handler.webdriver.get.assert_called_once_with(
+        "https://dbs.example.com/IB/Welcome"
+    )
@@ -1,6 +1,21 @@
+from email import message_from_bytes
+from email.policy import default
+from unittest.mock import MagicMock
+
+import pytest
 from pytest_mock import MockerFixture
 
-from dbs.main import Arguments, parse_arguments
+from dbs.accounts import AccountProfile
+from dbs.digest import DigestEmail
+from dbs.main import (
+    Arguments,
+    download_all_accounts,
+    finish,
+    parse_arguments,
+    send_email,
+)
+from dbs.manifest import Manifest
+from dbs.pipeline import StatementPipeline
 
 
 def test_parse_arguments(mocker: MockerFixture):
@@ -15,4 +30,83 @@ def test_parse_arguments(mocker: MockerFixture):
     assert args.sort_order == "DESC"
     assert args.page_size == 10
     assert args.page_number == 1
+    assert args.max_pages is None
     assert args.upload
+    assert args.concurrency == 1
+    assert args.workers == 4
+    assert args.rate_limit is None
+
+
+def test_send_email(tmp_path):
+    attachment = tmp_path / "dbs-dbsspa-2023-11-30.pdf"
+    attachment.write_bytes(b"%PDF-1.4 statement")
+    sent = []
+
+    def send(userId, body, media_body):  # pylint: disable=invalid-name
+        assert userId == "me" and body == {}
+        sent.append(media_body.getbytes(0, media_body.size()))
+        return MagicMock()
+
+    client = MagicMock()
+    client.gmail_service.users().messages().send.side_effect = send
+
+    send_email(client, "DBS eStatement", str(attachment))
+
+    message = message_from_bytes(sent[0], policy=default)
+    assert message["Subject"] == "DBS eStatement"
+    (part,) = message.iter_attachments()
+    assert part.get_filename() == "dbs-dbsspa-2023-11-30.pdf"
+    assert part.get_content() == b"%PDF-1.4 statement"
+
+
+def test_finish_records_digest_emails_once_sent(
+    tmp_path, monkeypatch, make_record, make_downloader
+):
+    monkeypatch.chdir(tmp_path)
+    manifest_path = str(tmp_path / "manifest.sqlite3")
+    manifest = Manifest(manifest_path)
+    records = [make_record("2023-11-30"), make_record("2023-10-31")]
+    digest = DigestEmail(MagicMock(), "to@x.com", "from@x.com")
+    pipeline = StatementPipeline(
+        make_downloader(lambda record: b"pdf"), email=digest, manifest=manifest
+    )
+
+    results = pipeline.run(records)
+
+    # queued statements aren't emailed until the digest is sent
+    assert not any(manifest.get(record).emailed for record in records)
+
+    monkeypatch.setattr(
+        digest, "send", MagicMock(return_value=["dbs-dbsspa-2023-10-31.pdf"])
+    )
+    with pytest.raises(RuntimeError, match="dbs-dbsspa-2023-10-31.pdf"):
+        finish(results, {"email": digest, "manifest": manifest, "parser": None})
+
+    manifest = Manifest(manifest_path)
+    assert [manifest.get(record).emailed for record in records] == [True, False]
+
+
+def test_download_all_accounts_after_failed_login(mocker: MockerFixture):
+    mocker.patch("argparse._sys.argv", ["script.py", "--rate-limit", "5"])
+    accounts = [
+        AccountProfile(name=name, dbs_user_id=name, dbs_pin="1", otp_email_subject=name)
+        for name in ("alice", "bob", "carol")
+    ]
+
+    def get_session_cookies(gmail_client, *_, account, **__):
+        if account.name == "bob":
+            raise RuntimeError("OTP timed out")
+        return [{"name": "session", "value": account.name}]
+
+    mocker.patch("dbs.main.get_session_cookies", side_effect=get_session_cookies)
+    downloader_class = mocker.patch("dbs.browser.download.StatementDownloader")
+
+    with pytest.raises(RuntimeError, match="Failed to log into account.s.: bob"):
+        download_all_accounts(MagicMock(), accounts, parse_arguments())
+
+    # the accounts that logged in were downloaded, sharing one rate limiter
+    calls = downloader_class.call_args_list
+    assert [call.args[0][0]["value"] for call in calls] == ["alice", "carol"]
+    limiters = {id(call.kwargs["rate_limiter"]) for call in calls}
+    assert len(limiters) == 1
+    assert calls[0].kwargs["rate_limiter"].interval == 0.2
@@ -0,0 +1,105 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from dbs.gmail import Gmail
+from dbs.gmail.maintenance import InboxCleaner, build_query
+from dbs.settings import CloudSettings
+
+# the scopes that allow each Gmail endpoint, from the Gmail API reference
+ENDPOINT_SCOPES = {
+    "list": {
+        "https://mail.google.com/",
+        "https://www.googleapis.com/auth/gmail.modify",
+        "https://www.googleapis.com/auth/gmail.readonly",
+        "https://www.googleapis.com/auth/gmail.metadata",
+    },
+    "batchModify": {
+        "https://mail.google.com/",
+        "https://www.googleapis.com/auth/gmail.modify",
+    },
+    "batchDelete": {"https://mail.google.com/"},
+}
+
+
+def make_gmail_service(count: int) -> MagicMock:
+    """Builds a Gmail service whose search returns `count` IDs, 500 per page"""
+    service = MagicMock()
+    messages = service.users.return_value.messages.return_value
+    pages = [
+        {
+            "messages": [{"id": str(i)} for i in range(start, min(start + 500, count))],
+            "nextPageToken": str(start + 500) if start + 500 < count else None,
+        }
+        for start in range(0, count, 500)
+    ]
+    messages.list.return_value.execute.side_effect = pages
+    return service
+
+
+def test_build_query():
+    assert build_query('DBS "OTP"', ["a@gmail.com", "b@gmail.com"], "7d") == (
+        '"DBS OTP" from:(a@gmail.com OR b@gmail.com) older_than:7d'
+    )
+    assert build_query("DBS OTP", []) == '"DBS OTP"'
+    with pytest.raises(ValueError):
+        build_query(None, ["a@gmail.com"])
+
+
+def test_clean_in_batches():
+    service = make_gmail_service(2500)
+    messages = service.users.return_value.messages.return_value
+
+    cleaned = InboxCleaner(Gmail(service)).clean("archive", older_than="7d")
+
+    assert cleaned == 2500
+    assert "older_than:7d" in messages.list.call_args.kwargs["q"]
+    bodies = [call.kwargs["body"] for call in messages.batchModify.call_args_list]
+    assert [len(body["ids"]) for body in bodies] == [1000, 1000, 500]
+    assert bodies[0]["removeLabelIds"] == ["UNREAD", "INBOX"]
+    assert sorted(
+        message_id for body in bodies for message_id in body["ids"]
+    ) == sorted(str(i) for i in range(2500))
+
+
+def test_clean_dry_run_and_trash():
+    service = make_gmail_service(3)
+    messages = service.users.return_value.messages.return_value
+
+    assert InboxCleaner(Gmail(service)).clean("trash", dry_run=True) == 3
+    messages.batchModify.assert_not_called()
+
+    service = make_gmail_service(3)
+    messages = service.users.return_value.messages.return_value
+
+    assert InboxCleaner(Gmail(service), batch_size=2).clean("trash") == 3
+    bodies = [call.kwargs["body"] for call in messages.batchModify.call_args_list]
+    assert [body["ids"] for body in bodies] == [["0", "1"], ["2"]]
+    assert bodies[0]["addLabelIds"] == ["TRASH"]
+    messages.batchDelete.assert_not_called()
+
+
+@pytest.mark.parametrize("action", ["read", "archive", "trash"])
+def test_clean_needs_only_default_scopes(action):
+    service = make_gmail_service(3)
+    messages = service.users.return_value.messages.return_value
+
+    InboxCleaner(Gmail(service)).clean(action)
+
+    # every request an action makes is allowed by one of the default scopes
+    default_scopes = set(CloudSettings.model_fields["gmail_scopes"].default)
+    for method, scopes in ENDPOINT_SCOPES.items():
+        if getattr(messages, method).called:
+            assert scopes & default_scopes, method
+    assert messages.batchModify.called
+
+
+def test_clean_rate_limits_every_request():
+    service = make_gmail_service(1200)
+    cleaner = InboxCleaner(Gmail(service), batch_size=1000)
+    cleaner.rate_limiter = MagicMock()
+
+    cleaner.clean("read")
+
+    # 3 pages of search results, and 2 batches of changes
+    assert cleaner.rate_limiter.wait.call_count == 5
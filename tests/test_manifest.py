@@ -0,0 +1,44 @@
+from unittest.mock import MagicMock
+
+from dbs.manifest import Manifest
+from dbs.pipeline import StatementPipeline
+
+
+def test_incremental_pipeline(tmp_path, monkeypatch, make_record, make_downloader):
+    monkeypatch.chdir(tmp_path)
+    manifest = Manifest(str(tmp_path / "manifest.sqlite3"))
+    records = [make_record("2023-11-30"), make_record("2023-10-31")]
+    content = b"v1"
+    get_content = MagicMock(side_effect=lambda record: content)
+    downloader = make_downloader(get_content)
+    upload = MagicMock(return_value=123)
+    email = MagicMock()
+
+    pipeline = StatementPipeline(
+        downloader, upload=upload, email=email, manifest=manifest
+    )
+    results = pipeline.run(records)
+
+    assert not any(result.skipped for result in results)
+    assert upload.call_count == email.call_count == 2
+    entry = manifest.get(records[0])
+    assert entry and entry.gcs_generation == 123 and entry.emailed
+    assert entry.size == 2
+
+    # unchanged statements are skipped entirely
+    results = pipeline.run(records)
+    assert all(result.skipped for result in results)
+    assert get_content.call_count == 2
+
+    # a statement that was not emailed is re-downloaded, but not re-uploaded
+    pipeline.email = MagicMock()
+    manifest._update(records[0], "emailed", 0)  # pylint: disable=protected-access
+    pipeline.run(records)
+    assert upload.call_count == 2
+    pipeline.email.assert_called_once_with("dbs-dbsspa-2023-11-30.pdf")
+
+    # changed content resets the upload and email status
+    manifest._update(records[1], "emailed", 0)  # pylint: disable=protected-access
+    content = b"v2"
+    pipeline.run(records)
+    assert upload.call_count == 3
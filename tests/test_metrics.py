@@ -0,0 +1,134 @@
+import json
+from unittest.mock import MagicMock
+
+import pytest
+from pytest_mock import MockerFixture
+
+from dbs.browser.download import StatementDownloader
+from dbs.browser.login import DbsAuthHandler
+from dbs.gmail import Gmail
+from dbs.metrics import NULL_TIMER, Metrics
+
+
+def test_disabled_metrics():
+    metrics = Metrics()
+
+    assert metrics.timer("stage", stage="download") is NULL_TIMER
+    with metrics.timer("stage", stage="download"):
+        metrics.increment("api_calls", service="dbs", endpoint="list")
+    metrics.observe("login_step", 1.0, step="LOGIN_PAGE")
+
+    assert metrics.summary() == {"counters": [], "timers": []}
+
+
+def test_counters_and_timers():
+    metrics = Metrics()
+    metrics.enable()
+
+    metrics.increment("api_calls", service="dbs", endpoint="list")
+    metrics.increment("api_calls", service="dbs", endpoint="list")
+    metrics.increment("downloaded_bytes", 100)
+    for seconds in range(101):
+        metrics.observe("stage", seconds / 100, stage="download")
+    with metrics.timer("login"):
+        pass
+
+    summary = metrics.summary()
+    assert summary["counters"] == [
+        {
+            "name": "api_calls",
+            "labels": {"service": "dbs", "endpoint": "list"},
+            "value": 2,
+        },
+        {"name": "downloaded_bytes", "labels": {}, "value": 100},
+    ]
+    login, stage = summary["timers"]
+    assert login["name"] == "login" and login["count"] == 1
+    assert stage["labels"] == {"stage": "download"}
+    assert stage["count"] == 101
+    assert stage["p50"] == 0.5
+    assert stage["p95"] == 0.95
+    assert stage["max"] == 1.0
+
+
+def test_prometheus_and_json(tmp_path):
+    metrics = Metrics()
+    metrics.enable()
+    metrics.increment("api_calls", service="gmail", endpoint="messages.send")
+    metrics.observe("stage", 2.0, stage='say "hi"')
+
+    assert metrics.to_prometheus() == (
+        "# TYPE dbs_api_calls_total counter\n"
+        'dbs_api_calls_total{endpoint="messages.send",service="gmail"} 1\n'
+        "# TYPE dbs_stage_seconds summary\n"
+        'dbs_stage_seconds{stage="say \\"hi\\"",quantile="0.5"} 2.0\n'
+        'dbs_stage_seconds{stage="say \\"hi\\"",quantile="0.95"} 2.0\n'
+        'dbs_stage_seconds_sum{stage="say \\"hi\\""} 2.0\n'
+        'dbs_stage_seconds_count{stage="say \\"hi\\""} 1\n'
+    )
+
+    metrics.write_json(str(tmp_path / "metrics.json"))
+    summary = json.loads((tmp_path / "metrics.json").read_text())
+    assert summary == metrics.summary()
+
+
+def test_record_otlp():
+    otel_metrics = pytest.importorskip("opentelemetry.sdk.metrics")
+    export = pytest.importorskip("opentelemetry.sdk.metrics.export")
+    reader = export.InMemoryMetricReader()
+    provider = otel_metrics.MeterProvider(metric_readers=[reader])
+    metrics = Metrics()
+    metrics.enable()
+    metrics.increment("api_calls", service="dbs", endpoint="list")
+    metrics.observe("login", 3.0)
+
+    metrics.record_otlp(provider.get_meter("test"))
+
+    data = reader.get_metrics_data()
+    exported = {
+        metric.name: metric.data.data_points[0]
+        for metric in data.resource_metrics[0].scope_metrics[0].metrics
+    }
+    assert exported["dbs.api_calls"].value == 1
+    assert exported["dbs.api_calls"].attributes == {
+        "service": "dbs",
+        "endpoint": "list",
+    }
+    assert exported["dbs.login"].sum == 3.0
+
+
+def test_exported_names_have_one_prefix(mocker: MockerFixture):
+    metrics = Metrics()
+    metrics.enable()
+    mocker.patch("dbs.browser.download.metrics", metrics)
+    mocker.patch("dbs.gmail.gmail.metrics", metrics)
+    cookies = [
+        {"name": "X-dbs-cust-sysgen-id", "value": "12345"},
+        {"name": "X-dbs-session-token", "value": "mock_token"},
+    ]
+    downloader = StatementDownloader(cookies, DbsAuthHandler.user_agent)
+    mocker.patch.object(
+        downloader.session,
+        "get",
+        return_value=MagicMock(text='{"totalRecords": 0, "estatements": []}'),
+    )
+
+    downloader.list_statements("2023-06", "2023-12", "ALL", "DESC", 10, 1)
+    Gmail(MagicMock()).get_history_id()
+
+    names = [
+        line.split()[2]
+        for line in metrics.to_prometheus().splitlines()
+        if line.startswith("# TYPE")
+    ]
+    assert names == [
+        "dbs_api_calls_total",
+        "dbs_api_retries_total",
+        "dbs_api_request_seconds",
+    ]
+    # calls to both APIs are told apart by a label, not by the name
+    assert {
+        counter["labels"]["service"]
+        for counter in metrics.summary()["counters"]
+        if counter["name"] == "api_calls"
+    } == {"dbs", "gmail"}
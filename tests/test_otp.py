@@ -0,0 +1,90 @@
+from base64 import urlsafe_b64encode
+
+import pytest
+
+from dbs.gmail import Message
+from dbs.gmail.otp import MAX_PARTS, extract_otp, find_otp
+
+
+def encode(text: str) -> str:
+    return urlsafe_b64encode(text.encode()).decode()
+
+
+def make_message(parts: list[dict], snippet: str = "", sender="user@gmail.com"):
+    return Message(
+        {
+            "id": "1",
+            "snippet": snippet,
+            "payload": {
+                "mimeType": "multipart/mixed",
+                "headers": [
+                    {"name": "Subject", "value": "Fwd: SMS"},
+                    {"name": "From", "value": f"Forwarder <{sender}>"},
+                ],
+                "parts": parts,
+            },
+        }
+    )
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "Your DBS OTP is 123456. Do not share it with anyone.",
+        "DBS: OTP for digibank login: 123456 (valid for 5 mins)",
+        "<#> 123456 is your DBS digibank OTP. Never share it.",
+        "On 18/11/2023 at 10:30 you requested an OTP. Your OTP is 123456",
+        "Call 1800 111 1111 or +6563272265 if this wasn't you. Code 123456",
+        "From: DBS\n18/11/2023 10:30\nS$100,000.00 limit. 123456",
+        "Ref 20231118: use one-time password 123456 to log in",
+    ],
+)
+def test_find_otp(text):
+    assert find_otp(text) == "123456"
+
+
+@pytest.mark.parametrize(
+    "text", ["Call +65 6327 2265", "Paid S$123,456.00 on 18/11/2023", "20231118"]
+)
+def test_find_no_otp(text):
+    assert find_otp(text) is None
+
+
+def test_extract_otp_from_parts():
+    text = "Your DBS OTP is 123456"
+    message = make_message(
+        [
+            {"mimeType": "image/png", "body": {"data": encode("999999")}},
+            {
+                "mimeType": "multipart/alternative",
+                "parts": [
+                    # the first part has no data, so later parts are searched
+                    {"mimeType": "text/plain", "body": {"size": 0}},
+                    {
+                        "mimeType": "text/html",
+                        "body": {"data": encode(f"<b>{text}</b>")},
+                    },
+                ],
+            },
+        ],
+        snippet="Forwarded message from +65 6327 2265",
+    )
+
+    assert extract_otp(message) == "123456"
+
+
+def test_extract_otp_bounded():
+    parts = [{"mimeType": "text/plain", "body": {"data": encode("no OTP")}}] * MAX_PARTS
+    message = make_message(
+        parts + [{"mimeType": "text/plain", "body": {"data": encode("OTP 123456")}}]
+    )
+
+    with pytest.raises(RuntimeError, match="Could not find OTP"):
+        extract_otp(message)
+
+
+def test_extract_otp_from_untrusted_user():
+    message = make_message([], snippet="Your DBS OTP is 123456", sender="x@evil.com")
+
+    with pytest.raises(RuntimeError, match="isn't from a trusted user"):
+        extract_otp(message)
@@ -0,0 +1,87 @@
+import hashlib
+from decimal import Decimal
+
+import pytest
+
+from dbs.pipeline import StatementPipeline
+
+pytest.importorskip("pypdf")
+
+# pylint: disable=wrong-import-position
+from dbs.parse import StatementParser, parse_text  # noqa: E402
+
+STATEMENT_TEXT = """
+Date Description Withdrawal (-) Deposit (+) Balance
+Balance Brought Forward 1,000.00
+28 Dec Card Payment 100.00 900.00
+02 Jan Salary 2,000.00 2,900.00
+03 Jan   Transfer   to  savings 50.00 2,850.00
+Total 150.00 2,000.00
+"""
+
+
+def make_pdf(lines: list[str]) -> bytes:
+    """Builds a single page PDF with one line of text per line"""
+    text = "".join(f"({line}) Tj 0 -14 Td " for line in lines)
+    content = f"BT /F1 10 Tf 50 800 Td {text}ET".encode()
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+        b"/Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+        b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content),
+    ]
+    pdf = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    pdf += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\n" % (len(objects) + 1)
+    return pdf + b"startxref\n%d\n%%%%EOF\n" % xref
+
+
+def test_parse_text():
+    transactions = parse_text(STATEMENT_TEXT, "123-4-567890", "2024-01-31")
+
+    assert [
+        (t.transaction_date, t.description, t.amount, t.balance) for t in transactions
+    ] == [
+        ("2023-12-28", "Card Payment", Decimal("-100.00"), Decimal("900.00")),
+        ("2024-01-02", "Salary", Decimal("2000.00"), Decimal("2900.00")),
+        ("2024-01-03", "Transfer to savings", Decimal("-50.00"), Decimal("2850.00")),
+    ]
+    assert {t.account_number for t in transactions} == {"123-4-567890"}
+    assert {t.statement_date for t in transactions} == {"2024-01-31"}
+
+
+def test_pipeline_parses_statements(
+    tmp_path, monkeypatch, make_record, make_downloader
+):
+    monkeypatch.chdir(tmp_path)
+    pdf = make_pdf(STATEMENT_TEXT.strip().splitlines())
+    downloader = make_downloader(lambda _: pdf)
+    parser = StatementParser(max_workers=1)
+
+    pipeline = StatementPipeline(downloader, parser=parser)
+    results = pipeline.run([make_record("2024-01-31")])
+    parser.close()
+
+    assert results[0].ok
+    assert [t.description for t in results[0].transactions] == [
+        "Card Payment",
+        "Salary",
+        "Transfer to savings",
+    ]
+    content_hash = hashlib.sha256(pdf).hexdigest()
+    assert parser.load(content_hash) == results[0].transactions
+
+    # an unchanged statement is read from the cache, after the workers are gone
+    results = pipeline.run([make_record("2024-01-31")])
+    assert results[0].transactions == parser.load(content_hash)
+
+    parser.write(results[0].transactions)
+    assert len((tmp_path / "transactions.jsonl").read_text().splitlines()) == 3
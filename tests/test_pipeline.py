@@ -0,0 +1,36 @@
+import os
+from unittest.mock import MagicMock
+
+import pytest
+
+from dbs.browser.download import StatementRecord
+from dbs.pipeline import StatementPipeline
+
+
+@pytest.mark.parametrize("concurrency", [1, 4])
+def test_pipeline_run(tmp_path, monkeypatch, make_record, make_downloader, concurrency):
+    monkeypatch.chdir(tmp_path)
+
+    def get_content(record: StatementRecord) -> bytes:
+        if record.statement_date == "2023-10-31":
+            raise RuntimeError("boom")
+        return record.statement_date.encode()
+
+    downloader = make_downloader(get_content)
+    upload = MagicMock()
+    records = [make_record(date) for date in ("2023-11-30", "2023-10-31", "2023-09-30")]
+
+    pipeline = StatementPipeline(downloader, concurrency=concurrency, upload=upload)
+    results = pipeline.run(records)
+
+    assert [result.filename for result in results] == [
+        "dbs-dbsspa-2023-11-30.pdf",
+        "dbs-dbsspa-2023-10-31.pdf",
+        "dbs-dbsspa-2023-09-30.pdf",
+    ]
+    assert [result.ok for result in results] == [True, False, True]
+    assert sorted(os.listdir(tmp_path)) == [
+        "dbs-dbsspa-2023-09-30.pdf",
+        "dbs-dbsspa-2023-11-30.pdf",
+    ]
+    assert upload.call_count == 2
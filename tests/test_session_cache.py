@@ -0,0 +1,54 @@
+from unittest.mock import MagicMock
+
+from cryptography.fernet import Fernet
+from pytest_mock import MockerFixture
+
+from dbs.browser.session_cache import FileSessionCacheBackend, SessionCache
+from dbs.main import get_session_cookies
+
+cookies = [
+    {"name": "X-dbs-cust-sysgen-id", "value": "12345"},
+    {"name": "X-dbs-session-token", "value": "mock_token"},
+    {"name": "unrelated", "value": "foo"},
+]
+
+
+def test_session_cache(tmp_path):
+    path = str(tmp_path / "session")
+    key = Fernet.generate_key()
+    session_cache = SessionCache(FileSessionCacheBackend(path), key)
+
+    assert session_cache.load() is None
+
+    session_cache.save(cookies)
+
+    with open(path, "rb") as file:
+        assert b"mock_token" not in file.read()
+    assert session_cache.load() == cookies[:2]
+
+    other_cache = SessionCache(FileSessionCacheBackend(path), Fernet.generate_key())
+    assert other_cache.load() is None
+
+
+def test_get_session_cookies(tmp_path, mocker: MockerFixture):
+    session_cache = SessionCache(
+        FileSessionCacheBackend(str(tmp_path / "session")), Fernet.generate_key()
+    )
+    session_cache.save(cookies)
+
+    mock_auth_handler = mocker.patch("dbs.browser.login.DbsAuthHandler")
+    mock_auth_handler.return_value.login.return_value.get_cookies.return_value = [
+        {"name": "X-dbs-cust-sysgen-id", "value": "12345"},
+        {"name": "X-dbs-session-token", "value": "new_token"},
+    ]
+    mock_is_valid = mocker.patch(
+        "dbs.browser.download.StatementDownloader.is_session_valid", return_value=True
+    )
+
+    assert get_session_cookies(MagicMock(), session_cache) == cookies[:2]
+    mock_auth_handler.assert_not_called()
+
+    mock_is_valid.return_value = False
+
+    assert get_session_cookies(MagicMock(), session_cache)[1]["value"] == "new_token"
+    assert session_cache.load()[1]["value"] == "new_token"
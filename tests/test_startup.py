@@ -0,0 +1,59 @@
+import os
+import subprocess
+import sys
+
+HEAVY_MODULES = [
+    "selenium",
+    "requests",
+    "httpx",
+    "google.cloud.storage",
+    "google.cloud.secretmanager",
+    "googleapiclient",
+    "pyarrow",
+    "pypdf",
+]
+
+# generous, as CI machines are slow; override with DBS_IMPORT_BUDGET_MS
+IMPORT_BUDGET_MS = int(os.environ.get("DBS_IMPORT_BUDGET_MS", 2000))
+
+
+def get_import_times(module: str) -> dict[str, int]:
+    """Returns the cumulative import time in microseconds of every module"""
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_main_imports_no_heavy_modules():
+    times = get_import_times("dbs.main")
+
+    for module in HEAVY_MODULES:
+        assert module not in times, f"{module} is imported by dbs.main"
+    assert times["dbs.main"] / 1000 < IMPORT_BUDGET_MS
+
+
+def test_help_without_settings():
+    environment = {
+        key: value
+        for key, value in os.environ.items()
+        if key not in {"BUCKET_NAME", "DBS_USER_ID", "DBS_PIN", "PROJECT_ID"}
+    }
+    process = subprocess.run(
+        [sys.executable, "-m", "dbs.main", "--help"],
+        capture_output=True,
+        check=True,
+        env=environment,
+        text=True,
+    )
+
+    assert process.stdout.startswith("usage:")
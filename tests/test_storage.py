@@ -0,0 +1,63 @@
+from unittest.mock import MagicMock
+
+from dbs.storage import GcsStorageBackend, LocalStorageBackend, get_checksums
+
+
+def test_gcs_storage_backend(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "statement.pdf").write_bytes(b"statement")
+    md5, crc32c = get_checksums("statement.pdf")
+    client = MagicMock()
+    bucket = client.bucket.return_value
+    bucket.get_blob.return_value = None
+    bucket.blob.return_value.generation = 1
+
+    storage = GcsStorageBackend("bucket", client=client)
+
+    assert storage.upload("statement.pdf") == 1
+    bucket.get_blob.assert_called_once_with("dbs/statement.pdf")
+    bucket.blob.return_value.upload_from_filename.assert_called_once()
+
+    # an object with the same content is not uploaded again
+    bucket.get_blob.return_value = MagicMock(md5_hash=md5, generation=1)
+    assert storage.upload("statement.pdf") == 1
+    bucket.get_blob.return_value = MagicMock(md5_hash=None, crc32c=crc32c)
+    storage.upload("statement.pdf")
+    assert bucket.blob.return_value.upload_from_filename.call_count == 1
+
+    client.bucket.assert_called_once_with("bucket")
+    client.get_bucket.assert_not_called()
+
+
+def test_local_storage_backend(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "alice").mkdir()
+    (tmp_path / "alice" / "statement.pdf").write_bytes(b"v1")
+    storage = LocalStorageBackend(str(tmp_path / "uploads"))
+
+    storage.upload("alice/statement.pdf")
+    uploaded = tmp_path / "uploads" / "dbs" / "alice" / "statement.pdf"
+    assert uploaded.read_bytes() == b"v1"
+
+    mtime = uploaded.stat().st_mtime_ns
+    storage.upload("alice/statement.pdf")
+    assert uploaded.stat().st_mtime_ns == mtime
+
+    (tmp_path / "alice" / "statement.pdf").write_bytes(b"v2")
+    storage.upload("alice/statement.pdf")
+    assert uploaded.read_bytes() == b"v2"
+
+
+def test_storage_delete(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "statement.pdf").write_bytes(b"statement")
+    storage = LocalStorageBackend(str(tmp_path / "uploads"))
+
+    storage.upload("statement.pdf")
+    storage.delete("statement.pdf")
+    storage.delete("statement.pdf")
+    assert not (tmp_path / "uploads" / "dbs" / "statement.pdf").exists()
+
+    client = MagicMock()
+    GcsStorageBackend("bucket", client=client).delete("statement.pdf")
+    client.bucket.return_value.delete_blob.assert_called_once_with("dbs/statement.pdf")
@@ -0,0 +1,79 @@
+import os
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client
+from unittest.mock import MagicMock
+
+import pytest
+
+from dbs.browser import worker
+from dbs.browser.worker import LoginWorker, get_process_tree_rss
+
+
+@pytest.fixture
+def auth_handlers(monkeypatch):
+    handlers: list[MagicMock] = []
+
+    def create_handler(*_):
+        handler = MagicMock()
+        handlers.append(handler)
+        handler.login.return_value.get_cookies.return_value = [
+            {"name": "JSESSIONID", "value": str(len(handlers))}
+        ]
+        handler.webdriver.service.process = None
+        return handler
+
+    monkeypatch.setattr(worker, "DbsAuthHandler", create_handler)
+    return handlers
+
+
+def test_login_worker_reuses_driver(auth_handlers):
+    login_worker = LoginWorker(MagicMock(), max_uses=2)
+
+    cookies = [login_worker.login() for _ in range(3)]
+
+    assert [cookie[0]["value"] for cookie in cookies] == ["1", "1", "2"]
+    assert len(auth_handlers) == 2
+    auth_handlers[0].prepare.assert_called_once()
+    assert auth_handlers[0].reset.call_count == 2
+    auth_handlers[0].quit.assert_called_once()
+
+
+def test_login_worker_recycles_driver_after_error(auth_handlers):
+    login_worker = LoginWorker(MagicMock())
+    login_worker.login()
+    auth_handlers[0].login.side_effect = RuntimeError("timeout")
+
+    with pytest.raises(RuntimeError):
+        login_worker.login()
+
+    auth_handlers[0].quit.assert_called_once()
+    assert login_worker.login()[0]["value"] == "2"
+
+
+def test_login_worker_serves_after_bad_connections(auth_handlers, tmp_path):
+    address = str(tmp_path / "worker.sock")
+    login_worker = LoginWorker(MagicMock())
+    threading.Thread(
+        target=login_worker.serve, args=(address, b"secret"), daemon=True
+    ).start()
+
+    def connect(authkey: bytes = b"secret"):
+        for _ in range(100):
+            if os.path.exists(address):
+                return Client(address, authkey=authkey)
+            threading.Event().wait(0.01)
+        raise TimeoutError("Login worker did not start")
+
+    with pytest.raises(AuthenticationError):
+        connect(b"wrong")
+    # a client that hangs up without sending a request
+    connect().close()
+
+    with connect() as connection:
+        connection.send("login")
+        assert connection.recv() == {"cookies": [{"name": "JSESSIONID", "value": "1"}]}
+
+
+def test_get_process_tree_rss():
+    assert get_process_tree_rss(os.getpid()) > 0